@@ -0,0 +1,297 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of zendesk.py against the stub of the Zendesk API, or another API with --api-url,
+measure the startup of the CLI, the latency and the API calls of each action and the throughput of the bulk actions
+
+- Usage
+python benchmark.py --output results.json --latency 0.05 --job-delay 0.5
+python benchmark.py --output results.json --compare previous.json
+python benchmark.py --api-url http://127.0.0.1:8080 --output results.json
+python benchmark.py --startup-only --startup-budget 0.5 --compare previous.json --max-regression 20
+"""
+
+#libraries
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import threading
+import statistics
+import subprocess
+from datetime import datetime
+from urllib.parse import urlparse
+from urllib.request import urlopen
+import stubserver
+
+class Benchmark:
+
+    def __init__(self, apiURL, runs, count, concurrency):
+        """
+        Run the CLI in subprocesses with the environment of zenpy pointing to the API, the API calls are
+        read in the /__stats of the stub, they are None with another API
+        """
+        self.apiURL = apiURL.rstrip("/")
+        self.runs = runs
+        self.count = count
+        self.concurrency = concurrency
+        self.script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "zendesk.py")
+        self.environment = dict(os.environ)
+        self.environment["ZENPY_FORCE_SCHEME"] = urlparse(self.apiURL).scheme
+        self.environment["ZENPY_FORCE_NETLOC"] = urlparse(self.apiURL).netloc
+        self.directory = tempfile.mkdtemp(prefix="zendesk_benchmark_")
+
+    def stats(self, path="__stats"):
+        try:
+            with urlopen("{}/{}".format(self.apiURL, path), timeout=10) as response:
+                return json.loads(response.read())
+        except Exception:
+            return None
+
+    def execute(self, *arguments, stdin=None):
+        """
+        Run the CLI once
+
+        :param arguments:
+        :param stdin: content of the stdin
+        :return: tuple (seconds, API calls, stdout)
+        """
+        self.stats("__reset")
+        start = time.perf_counter()
+        process = subprocess.run([sys.executable, self.script] + list(arguments), input=stdin, env=self.environment,
+                                 stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+        seconds = time.perf_counter() - start
+        if process.returncode != 0:
+            raise RuntimeError("{} - {}".format(" ".join(arguments), process.stderr or process.stdout))
+        stats = self.stats()
+        return seconds, stats["requests"] if stats is not None else None, process.stdout
+
+    def summary(self, seconds, calls):
+        seconds = sorted(seconds)
+        return {"runs": len(seconds), "median": round(statistics.median(seconds), 4),
+                "p95": round(seconds[min(len(seconds) - 1, int(len(seconds) * 0.95))], 4),
+                "min": round(seconds[0], 4), "max": round(seconds[-1], 4),
+                "api_calls": calls[-1] if calls else None}
+
+    def startup(self):
+        """
+        Time of the import of the module, of the CLI until the help of the actions and of a create
+        appended to the spool, the paths without API calls
+
+        :return:
+        """
+        results = dict()
+        spoolFile = os.path.join(self.directory, "spool.jsonl")
+        for name, arguments in (("import", ["-c", "import zendesk"]), ("help", [self.script, "-h"]),
+                                ("help_search", [self.script, "search", "-h"]),
+                                ("create_spool", [self.script, "create", "--subject", "benchmark", "--description",
+                                                  "benchmark", "--spool", "--spool-file", spoolFile])):
+            seconds = list()
+            for run in range(self.runs):
+                start = time.perf_counter()
+                subprocess.run([sys.executable] + arguments, env=self.environment, cwd=os.path.dirname(self.script),
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+                seconds.append(time.perf_counter() - start)
+            results[name] = self.summary(seconds, list())
+        return results
+
+    def imports(self):
+        """
+        Time of the import of the module with -X importtime, and the heavy libraries imported by it,
+        they are imported only when used
+
+        :return:
+        """
+        seconds = list()
+        for run in range(self.runs):
+            process = subprocess.run([sys.executable, "-X", "importtime", "-c", "import zendesk"], env=self.environment,
+                                     cwd=os.path.dirname(self.script), stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                                     universal_newlines=True, check=True)
+            for line in process.stderr.splitlines():
+                if line.split("|")[-1].strip() == "zendesk":
+                    seconds.append(int(line.split("|")[1]) / 1000000)
+        process = subprocess.run([sys.executable, "-c", "import sys, zendesk; print(' '.join(sorted(name for name in {} "
+                                  "if name in sys.modules)))".format(HEAVY_IMPORTS)], env=self.environment,
+                                 cwd=os.path.dirname(self.script), stdout=subprocess.PIPE, universal_newlines=True, check=True)
+        return {"module": self.summary(seconds, list()), "eager": process.stdout.split()}
+
+    def actions(self):
+        """
+        Latency and API calls of one action, the ticket of the update and of the search is created before
+
+        :return:
+        """
+        ticketID = self.createTicket()
+        actions = {
+            "create": ["create", "--subject", "benchmark", "--description", "benchmark"],
+            "create_get_id": ["create", "--subject", "benchmark", "--description", "benchmark", "--get-id"],
+            "update": ["update", "-t", ticketID, "--status", "open", "--tags", "benchmark"],
+            "update_comment": ["update", "-t", ticketID, "--comment", "benchmark"],
+            "update_macro": ["update", "-t", ticketID, "--macro-ids", "1"],
+            "search": ["search", "-t", ticketID],
+        }
+        results = dict()
+        for name, arguments in actions.items():
+            seconds, calls = list(), list()
+            for run in range(self.runs):
+                runSeconds, runCalls, output = self.execute(*arguments)
+                seconds.append(runSeconds)
+                calls.append(runCalls)
+            results[name] = self.summary(seconds, calls)
+        return results
+
+    def bulk(self):
+        """
+        Throughput of the bulk actions with --count tickets
+
+        :return:
+        """
+        createFile = os.path.join(self.directory, "create.jsonl")
+        with open(createFile, "w") as createFileOpen:
+            for index in range(self.count):
+                createFileOpen.write(json.dumps({"subject": "benchmark {}".format(index), "description": "benchmark"}) + "\n")
+        created = self.execute("create", "--from-file", createFile, "--get-id")[2]
+        ticketIDs = list()
+        for line in created.splitlines():
+            try:
+                if json.loads(line).get("ticket_id") is not None:
+                    ticketIDs.append(str(json.loads(line)["ticket_id"]))
+            except (ValueError, AttributeError):
+                continue
+        if not ticketIDs:
+            ticketIDs = [self.createTicket() for index in range(self.count)]
+        serveActions = "".join(json.dumps({"id": ticketID, "values": {"status": "pending"},
+                                           "internal": {"action": "update", "ticketID": ticketID}}) + "\n"
+                               for ticketID in ticketIDs)
+        bulk = {
+            "create_from_file": (["create", "--from-file", createFile], None),
+            "update_many": (["update", "-t", ",".join(ticketIDs), "--status", "open"], None),
+            "search_many": (["search", "-t", ",".join(ticketIDs)], None),
+            "serve_update": (["serve", "--workers", str(self.concurrency)], serveActions),
+        }
+        if self.hasAiohttp():
+            bulk["serve_update_async"] = (["serve", "--concurrency", str(self.concurrency)], serveActions)
+        results = dict()
+        for name, (arguments, stdin) in bulk.items():
+            seconds, calls, output = self.execute(*arguments, stdin=stdin)
+            results[name] = {"tickets": len(ticketIDs), "seconds": round(seconds, 4),
+                             "per_second": round(len(ticketIDs) / seconds, 2), "api_calls": calls}
+        return results
+
+    def createTicket(self):
+        output = self.execute("create", "--subject", "benchmark", "--description", "benchmark", "--get-id")[2]
+        return output.strip().splitlines()[-1]
+
+    def hasAiohttp(self):
+        try:
+            import aiohttp
+            return True
+        except ImportError:
+            return False
+
+#libraries of zendesk.py imported in the first use, not by the import of the module
+HEAVY_IMPORTS = ("zenpy", "requests", "asyncio", "aiohttp", "sqlite3")
+
+def budget(results, previous, startupBudget=None, maxRegression=None):
+    """
+    Check the startup against the budget, the median of each startup in seconds and the regression in percent
+    against the previous results, the heavy libraries must not be imported with the module
+
+    :return: list with the failures
+    """
+    failures = ["imports.eager: {} imported with the module".format(name) for name in results["imports"]["eager"]]
+    for name, summary in list(results["startup"].items()) + [("imports.module", results["imports"]["module"])]:
+        if startupBudget is not None and summary["median"] > startupBudget:
+            failures.append("{}: median {}s over the budget of {}s".format(name, summary["median"], startupBudget))
+        if name.startswith("imports."):
+            before = (previous.get("imports") or dict()).get(name.split(".", 1)[1])
+        else:
+            before = (previous.get("startup") or dict()).get(name)
+        if maxRegression is not None and before and before.get("median") and (
+                summary["median"] - before["median"]) * 100 / before["median"] > maxRegression:
+            failures.append("{}: median {}s, {}s before, more than {}% slower".format(name, summary["median"], before["median"],
+                                                                                      maxRegression))
+    return failures
+
+def compare(results, previous, path=""):
+    """
+    Print the change of the numbers of the results against the previous results
+
+    :return:
+    """
+    for item, value in results.items():
+        if isinstance(value, dict) and isinstance(previous.get(item), dict):
+            compare(value, previous[item], "{}{}.".format(path, item))
+        elif (isinstance(value, (int, float)) and isinstance(previous.get(item), (int, float)) and
+              not isinstance(value, bool) and previous[item]):
+            print("{}{}: {} -> {} ({:+.1f}%)".format(path, item, previous[item], value,
+                                                    (value - previous[item]) * 100 / previous[item]))
+
+def main():
+    arguments = argparse.ArgumentParser()
+    arguments.add_argument("--api-url", dest="apiURL", default=None,
+                           help="URL of the API without /api/v2, default start the stub")
+    arguments.add_argument("--output", default="benchmark.json", help="file of the results in JSON")
+    arguments.add_argument("--compare", default=None, help="results of a previous run to compare")
+    arguments.add_argument("--runs", default=5, type=int, help="runs of each action")
+    arguments.add_argument("--count", default=200, type=int, help="tickets of the bulk actions")
+    arguments.add_argument("--concurrency", default=16, type=int, help="workers and concurrency of the serve")
+    arguments.add_argument("--latency", default=0.05, type=float, help="seconds added to each request of the stub")
+    arguments.add_argument("--rate-limit-every", default=0, type=int, dest="rateLimitEvery",
+                           help="the stub answer 429 in every N requests, 0 disable")
+    arguments.add_argument("--retry-after", default=1, type=int, dest="retryAfter")
+    arguments.add_argument("--job-delay", default=0.5, type=float, dest="jobDelay",
+                           help="seconds until a job of the stub is completed")
+    arguments.add_argument("--startup-only", default=False, action="store_true", dest="startupOnly",
+                           help="measure only the import and the startup, without the stub")
+    arguments.add_argument("--startup-budget", default=None, type=float, dest="startupBudget",
+                           help="maximum median in seconds of the import and of each startup, exit 1 over it")
+    arguments.add_argument("--max-regression", default=None, type=float, dest="maxRegression",
+                           help="maximum percent of the startup slower than --compare, exit 1 over it")
+    args = arguments.parse_args()
+
+    apiURL = args.apiURL
+    if apiURL is None and args.startupOnly is True:
+        apiURL = "http://127.0.0.1:9"
+    elif apiURL is None:
+        server = stubserver.createServer(latency=args.latency, rateLimitEvery=args.rateLimitEvery,
+                                         retryAfter=args.retryAfter, jobDelay=args.jobDelay)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        apiURL = "http://{}:{}".format(*server.server_address)
+
+    benchmark = Benchmark(apiURL, args.runs, args.count, args.concurrency)
+    results = {
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "api_url": args.apiURL,
+        "stub": None if args.apiURL is not None else {"latency": args.latency, "rate_limit_every": args.rateLimitEvery,
+                                                      "retry_after": args.retryAfter, "job_delay": args.jobDelay},
+        "runs": args.runs,
+        "count": args.count,
+        "concurrency": args.concurrency,
+    }
+    results["imports"] = benchmark.imports()
+    results["startup"] = benchmark.startup()
+    if args.startupOnly is False:
+        results["actions"] = benchmark.actions()
+        results["bulk"] = benchmark.bulk()
+    with open(args.output, "w") as outputOpen:
+        json.dump(results, outputOpen, indent=2)
+    print("Results - '{}'".format(args.output))
+    previous = dict()
+    if args.compare is not None:
+        with open(args.compare) as compareOpen:
+            previous = json.load(compareOpen)
+        for section in ("imports", "startup", "actions", "bulk"):
+            if section in results:
+                compare(results[section], previous.get(section) or dict(), "{}.".format(section))
+    failures = budget(results, previous, args.startupBudget, args.maxRegression)
+    for failure in failures:
+        print("Budget - {}".format(failure))
+    if failures:
+        exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,372 @@
+# -*- coding: utf-8 -*-
+"""
+Stub of the Zendesk API used by the benchmark, answer in memory the endpoints used by zendesk.py
+
+- Usage
+python stubserver.py --port 8080 --latency 0.05 --rate-limit-every 50 --job-delay 0.5
+
+- Use with zendesk.py
+ZENPY_FORCE_SCHEME=http ZENPY_FORCE_NETLOC=127.0.0.1:8080 python zendesk.py search -t 1
+
+- Diagnostics
+GET /__stats return the requests by endpoint and the 429 answered, GET /__reset clear the counters
+"""
+
+#libraries
+import re
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from datetime import datetime, timezone
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class StubState:
+
+    def __init__(self, latency=0.0, rateLimitEvery=0, retryAfter=1, jobDelay=0.0):
+        """
+        Define the data in memory of the stub
+        """
+        self.latency = latency
+        self.rateLimitEvery = rateLimitEvery
+        self.retryAfter = retryAfter
+        self.jobDelay = jobDelay
+        self.lock = threading.Lock()
+        self.tickets = dict()
+        self.users = dict()
+        self.jobs = dict()
+        self.macros = dict()
+        self.nextTicketID = 1
+        self.nextUserID = 1
+        self.nextJobID = 1
+        self.countRequests = 0
+        self.countEndpoints = dict()
+        self.countRateLimited = 0
+
+    def now(self):
+        return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+    def tagList(self, tags):
+        # the tags of a string are separated by spaces or commas as in Zendesk
+        if isinstance(tags, str):
+            return [tag for tag in re.split(r"[\s,]+", tags) if tag]
+        return list(tags or list())
+
+    def createTicket(self, values):
+        with self.lock:
+            ticket = dict(values)
+            ticket["id"] = self.nextTicketID
+            ticket.setdefault("status", "new")
+            ticket["tags"] = self.tagList(ticket.get("tags"))
+            ticket["created_at"] = ticket["updated_at"] = self.now()
+            ticket["updated_stamp"] = time.time()
+            ticket.pop("comment", None)
+            requester = ticket.pop("requester", None)
+            if isinstance(requester, dict):
+                ticket["requester_id"] = self.createUser(requester)["id"]
+            self.tickets[ticket["id"]] = ticket
+            self.nextTicketID += 1
+            return ticket
+
+    def updateTicket(self, ticketID, values):
+        with self.lock:
+            ticket = self.tickets.get(int(ticketID))
+            if ticket is None:
+                return None
+            values = dict(values)
+            values.pop("id", None)
+            values.pop("comment", None)
+            values.pop("safe_update", None)
+            values.pop("updated_stamp", None)
+            ticket["tags"] = self.tagList(ticket.get("tags"))
+            if "tags" in values:
+                values["tags"] = self.tagList(values["tags"])
+            for tag in self.tagList(values.pop("additional_tags", None)):
+                if tag not in ticket["tags"]:
+                    ticket["tags"].append(tag)
+            for tag in self.tagList(values.pop("remove_tags", None)):
+                if tag in ticket["tags"]:
+                    ticket["tags"].remove(tag)
+            requester = values.pop("requester", None)
+            if isinstance(requester, dict):
+                values["requester_id"] = self.createUser(requester)["id"]
+            ticket.update(values)
+            ticket["updated_at"] = self.now()
+            return ticket
+
+    def createUser(self, values):
+        for user in self.users.values():
+            if user.get("email") == values.get("email"):
+                return user
+        user = dict(values)
+        user["id"] = self.nextUserID
+        self.users[user["id"]] = user
+        self.nextUserID += 1
+        return user
+
+    def createJob(self, results):
+        with self.lock:
+            job = {"id": "job{}".format(self.nextJobID), "status": "queued", "results": results,
+                   "readyAt": time.time() + self.jobDelay}
+            self.jobs[job["id"]] = job
+            self.nextJobID += 1
+            return self.jobView(job)
+
+    def jobView(self, job):
+        if time.time() >= job["readyAt"]:
+            return {"id": job["id"], "status": "completed", "total": len(job["results"]),
+                    "progress": len(job["results"]), "results": job["results"],
+                    "url": "job_statuses/{}.json".format(job["id"])}
+        return {"id": job["id"], "status": "working", "total": len(job["results"]), "progress": 0,
+                "results": None, "url": "job_statuses/{}.json".format(job["id"])}
+
+class StubHandler(BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"
+    state = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body=None, headers=None):
+        content = json.dumps(body).encode() if body is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.send_header("X-Rate-Limit-Remaining", "700")
+        for key, value in (headers or dict()).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def _body(self):
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            content = b""
+            while True:
+                size = int(self.rfile.readline().strip() or b"0", 16)
+                if size == 0:
+                    self.rfile.readline()
+                    break
+                content += self.rfile.read(size)
+                self.rfile.readline()
+            return content
+        return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+    def _json(self, content):
+        try:
+            return json.loads(content or b"{}")
+        except ValueError:
+            return dict()
+
+    def _base(self):
+        return "http://{}/api/v2".format(self.headers.get("Host"))
+
+    def _handle(self, method):
+        state = self.state
+        url = urlparse(self.path)
+        path = url.path
+        query = {key: value[0] for key, value in parse_qs(url.query).items()}
+        content = self._body() if method in ("POST", "PUT") else b""
+        endpoint = re.sub(r"/\d+", "/:id", re.sub(r"/job\d+", "/:id", path))
+        if path == "/__stats":
+            return self._send(200, {"requests": state.countRequests, "endpoints": state.countEndpoints,
+                                    "rate_limited": state.countRateLimited})
+        if path == "/__reset":
+            with state.lock:
+                state.countRequests = 0
+                state.countEndpoints = dict()
+                state.countRateLimited = 0
+            return self._send(200, {})
+        with state.lock:
+            state.countRequests += 1
+            key = "{} {}".format(method, endpoint)
+            state.countEndpoints[key] = state.countEndpoints.get(key, 0) + 1
+            rateLimited = state.rateLimitEvery > 0 and state.countRequests % state.rateLimitEvery == 0
+            if rateLimited:
+                state.countRateLimited += 1
+        if state.latency > 0:
+            time.sleep(state.latency)
+        if rateLimited:
+            return self._send(429, {"error": "APIRateLimitExceeded"}, {"Retry-After": str(state.retryAfter)})
+        return self._route(method, path, query, content)
+
+    def _route(self, method, path, query, content):
+        state = self.state
+        body = self._json(content) if method in ("POST", "PUT") and not path.endswith("uploads.json") else dict()
+        match = re.match(r"^/api/v2/tickets/(\d+)\.json$", path)
+        if match and method == "GET":
+            ticket = state.tickets.get(int(match.group(1)))
+            if ticket is None:
+                return self._send(404, {"error": "RecordNotFound", "description": "Not found"})
+            return self._send(200, {"ticket": ticket})
+        if match and method == "PUT":
+            values = body.get("ticket", dict())
+            ticket = state.tickets.get(int(match.group(1)))
+            if ticket is None:
+                return self._send(404, {"error": "RecordNotFound", "description": "Not found"})
+            if values.get("safe_update") and values.get("updated_stamp") not in (None, ticket["updated_at"]):
+                return self._send(409, {"error": "UpdateConflict", "description": "Safe Update prevented the update"})
+            ticket = state.updateTicket(match.group(1), values)
+            return self._send(200, {"ticket": ticket, "audit": {"events": []}})
+        match = re.match(r"^/api/v2/tickets/(\d+)/tags\.json$", path)
+        if match and method == "PUT":
+            ticket = state.updateTicket(match.group(1), {"additional_tags": body.get("tags", list())})
+            return self._send(200, {"tags": ticket["tags"] if ticket else []})
+        if path == "/api/v2/tickets/show_many.json":
+            ids = [int(value) for value in query.get("ids", "").split(",") if value]
+            return self._send(200, {"tickets": [state.tickets[i] for i in ids if i in state.tickets],
+                                    "next_page": None, "previous_page": None, "count": len(ids)})
+        if path == "/api/v2/tickets.json" and method == "GET":
+            tickets = [ticket for ticket in state.tickets.values()
+                       if "external_id" not in query or ticket.get("external_id") == query["external_id"]]
+            return self._send(200, {"tickets": tickets, "next_page": None, "previous_page": None, "count": len(tickets)})
+        if path in ("/api/v2/tickets.json", "/api/v2/tickets/create_many.json") and method == "POST":
+            if "tickets" in body:
+                results = [{"index": index, "id": state.createTicket(values)["id"], "status": "Created"}
+                           for index, values in enumerate(body["tickets"])]
+                return self._send(200, {"job_status": state.createJob(results)})
+            return self._send(201, {"ticket": state.createTicket(body.get("ticket", dict())), "audit": {"events": []}})
+        if path == "/api/v2/tickets/update_many.json" and method == "PUT":
+            results = list()
+            if "tickets" in body:
+                changes = [(values.get("id"), values) for values in body["tickets"]]
+            else:
+                changes = [(int(value), body.get("ticket", dict())) for value in query.get("ids", "").split(",") if value]
+            for index, (ticketID, values) in enumerate(changes):
+                ticket = state.tickets.get(int(ticketID or 0))
+                if (ticket is not None and values.get("safe_update") and
+                        values.get("updated_stamp") not in (None, ticket["updated_at"])):
+                    results.append({"index": index, "id": ticketID, "error": "UpdateConflict",
+                                    "details": "Safe Update prevented the update", "status": "Failed"})
+                    continue
+                ticket = state.updateTicket(ticketID, values)
+                if ticket is None:
+                    results.append({"index": index, "id": ticketID, "error": "TicketNotFound", "status": "Failed"})
+                else:
+                    results.append({"index": index, "id": ticketID, "action": "update", "status": "Updated", "success": True})
+            return self._send(200, {"job_status": state.createJob(results)})
+        match = re.match(r"^/api/v2/job_statuses/([^/]+)\.json$", path)
+        if match and match.group(1) != "show_many":
+            job = state.jobs.get(match.group(1))
+            if job is None:
+                return self._send(404, {"error": "RecordNotFound", "description": "Not found"})
+            return self._send(200, {"job_status": state.jobView(job)})
+        if path == "/api/v2/job_statuses/show_many.json":
+            ids = [value for value in query.get("ids", "").split(",") if value]
+            return self._send(200, {"job_statuses": [state.jobView(state.jobs[i]) for i in ids if i in state.jobs]})
+        if path == "/api/v2/uploads.json" and method == "POST":
+            token = "token{}".format(random.randint(0, 1 << 30))
+            return self._send(201, {"upload": {"token": token, "attachment": {
+                "id": random.randint(1, 1 << 30), "file_name": query.get("filename"), "size": len(content)},
+                "attachments": []}})
+        match = re.match(r"^/api/v2/tickets/(\d+)/macros/(\d+)/apply\.json$", path)
+        if match:
+            macro = state.macros.get(int(match.group(2)), {"actions": [{"field": "status", "value": "solved"}]})
+            ticket = {"id": int(match.group(1))}
+            for action in macro["actions"]:
+                if action["field"] == "comment_value":
+                    ticket["comment"] = {"body": action["value"], "public": True}
+                elif action["field"] in ("status", "priority", "type", "group_id", "assignee_id"):
+                    ticket[action["field"]] = action["value"]
+            return self._send(200, {"result": {"ticket": ticket}})
+        match = re.match(r"^/api/v2/macros/(\d+)\.json$", path)
+        if match:
+            macro = state.macros.get(int(match.group(1)), {"actions": [{"field": "status", "value": "solved"}]})
+            macro = dict(macro, id=int(match.group(1)), title="macro", active=True)
+            return self._send(200, {"macro": macro})
+        if path in ("/api/v2/search.json", "/api/v2/search/export.json"):
+            terms = query.get("query", "")
+            objectType = "user" if "type:user" in terms else "ticket"
+            if objectType == "user":
+                emails = re.findall(r'email:"?([^"\s]+)"?', terms)
+                results = [dict(user, result_type="user") for user in state.users.values() if user.get("email") in emails]
+            else:
+                results = [dict(ticket, result_type="ticket") for ticket in state.tickets.values()
+                           if all(term.split(":", 1)[1] in str(ticket.get(term.split(":", 1)[0]))
+                                  for term in terms.split() if ":" in term and not term.startswith("type:"))]
+            return self._paginate(path, query, results)
+        if path.startswith("/api/v2/incremental/tickets/cursor.json"):
+            tickets = sorted(state.tickets.values(), key=lambda ticket: ticket["id"])
+            start = int(query.get("cursor", "0") or 0)
+            size = int(query.get("per_page", "100"))
+            page = tickets[start:start + size]
+            after = start + len(page)
+            return self._send(200, {"tickets": page, "after_cursor": str(after), "before_cursor": str(start),
+                                    "after_url": "{}/incremental/tickets/cursor.json?cursor={}&per_page={}".format(
+                                        self._base(), after, size),
+                                    "before_url": None, "end_of_stream": after >= len(tickets)})
+        if path == "/api/v2/users/create_or_update_many.json" and method == "POST":
+            results = [{"index": index, "id": state.createUser(values)["id"], "email": values.get("email"),
+                        "status": "Created"} for index, values in enumerate(body.get("users", list()))]
+            return self._send(200, {"job_status": state.createJob(results)})
+        return self._send(404, {"error": "InvalidEndpoint", "description": path})
+
+    def _paginate(self, path, query, results):
+        size = int(query.get("page[size]", query.get("per_page", "100")))
+        start = int(query.get("page[after]", "0") or 0)
+        page = results[start:start + size]
+        more = start + size < len(results)
+        link = None
+        if more:
+            link = "{}{}?query={}&page[size]={}&page[after]={}".format(
+                self._base(), path[len("/api/v2"):], query.get("query", ""), size, start + size)
+            if "filter[type]" in query:
+                link += "&filter[type]={}".format(query["filter[type]"])
+        return self._send(200, {"results": page, "count": len(results), "next_page": None,
+                                "meta": {"has_more": more, "after_cursor": str(start + size)},
+                                "links": {"next": link}})
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def do_PUT(self):
+        self._handle("PUT")
+
+class StubServer(ThreadingHTTPServer):
+
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # the clients close the keep-alive connections when they exit
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            return
+        super().handle_error(request, client_address)
+
+def createServer(host="127.0.0.1", port=0, latency=0.0, rateLimitEvery=0, retryAfter=1, jobDelay=0.0):
+    """
+    Create the stub server, port 0 choose a free port
+
+    :return: server, the state is in server.state
+    """
+    state = StubState(latency=latency, rateLimitEvery=rateLimitEvery, retryAfter=retryAfter, jobDelay=jobDelay)
+    handler = type("StubHandlerState", (StubHandler,), {"state": state})
+    server = StubServer((host, port), handler)
+    server.state = state
+    return server
+
+def main():
+    arguments = argparse.ArgumentParser()
+    arguments.add_argument("--host", default="127.0.0.1")
+    arguments.add_argument("--port", default=8080, type=int)
+    arguments.add_argument("--latency", default=0.0, type=float, help="seconds added to each request")
+    arguments.add_argument("--rate-limit-every", default=0, type=int, dest="rateLimitEvery",
+                           help="answer 429 in every N requests, 0 disable")
+    arguments.add_argument("--retry-after", default=1, type=int, dest="retryAfter")
+    arguments.add_argument("--job-delay", default=0.0, type=float, dest="jobDelay",
+                           help="seconds until a job is completed")
+    args = arguments.parse_args()
+    server = createServer(args.host, args.port, args.latency, args.rateLimitEvery, args.retryAfter, args.jobDelay)
+    print("Stub - http://{}:{}/api/v2".format(*server.server_address))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+Fixtures of the tests, the actions of zendesk.py are executed with main against the stub of stubserver.py,
+the local files of the caches, the index and the spool are in the tmp_path of the test
+
+- Usage
+python -m pytest -q tests
+"""
+
+#libraries
+import os
+import sys
+import json
+import threading
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import stubserver
+import zendesk
+
+@pytest.fixture
+def stub(monkeypatch, tmp_path):
+    """
+    Start the stub in a free port and point zenpy and the async engine to it
+
+    :return: state of the stub
+    """
+    server = stubserver.createServer()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setenv("ZENPY_FORCE_SCHEME", "http")
+    monkeypatch.setenv("ZENPY_FORCE_NETLOC", "127.0.0.1:{}".format(server.server_address[1]))
+    # the clients, caches and schedulers of the process are not shared between the tests
+    monkeypatch.setattr(zendesk.Zendesk, "_clients", dict())
+    monkeypatch.setattr(zendesk.Zendesk, "_caches", dict())
+    monkeypatch.setattr(zendesk.Zendesk, "_schedulers", dict())
+    initialize = zendesk.Zendesk.__init__
+
+    def initializeLocal(self):
+        initialize(self)
+        self._requesterIndexFile = str(tmp_path / "zendesk_requesters.sqlite")
+        self._macroCacheFile = str(tmp_path / "zendesk_macros.sqlite")
+        self._spoolFile = str(tmp_path / "zendesk_spool.jsonl")
+        self._rateState = str(tmp_path / "zendesk_ratelimit.json")
+        self._pollInterval = 0.05
+
+    monkeypatch.setattr(zendesk.Zendesk, "__init__", initializeLocal)
+    executeAction = zendesk.Zendesk.executeAction
+
+    def executeLocal(self):
+        # the default files of the arguments are in /tmp
+        for item, value in self._dictInternal.items():
+            if isinstance(value, str) and value.startswith("/tmp/zendesk_"):
+                self._dictInternal[item] = str(tmp_path / os.path.basename(value))
+        return executeAction(self)
+
+    monkeypatch.setattr(zendesk.Zendesk, "executeAction", executeLocal)
+    yield server.state
+    zendesk.Zendesk.closeZendesk()
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def run(stub, monkeypatch, capsys):
+    """
+    Execute zendesk.py with the arguments
+
+    :return: function that returns the lines of the stdout
+    """
+    def run(*argv):
+        monkeypatch.setattr(sys, "argv", ["zendesk.py"] + [str(argument) for argument in argv])
+        zendesk.main()
+        return capsys.readouterr().out.splitlines()
+
+    return run
+
+def jsonLines(lines):
+    """
+    Return the JSON objects of the lines of the output
+
+    :param lines:
+    :return:
+    """
+    return [json.loads(line) for line in lines if line.startswith("{")]
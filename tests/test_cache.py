@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the cache of the tickets and of the revalidation of the stale tickets with show_many
+"""
+
+#libraries
+import ast
+
+import zendesk
+from conftest import jsonLines
+
+SHOW = "GET /api/v2/tickets/:id.json"
+SHOW_MANY = "GET /api/v2/tickets/show_many.json"
+
+def searched(lines):
+    # the search of one ticket prints the dict of the ticket
+    return ast.literal_eval(lines[-1])
+
+def test_cache_size_removes_least_recently_used(tmp_path):
+    ticketCache = zendesk.TicketCache(str(tmp_path / "cache.sqlite"), 60, 2)
+    ticketCache.putMany([{"id": 1, "updated_at": "a"}, {"id": 2, "updated_at": "a"}])
+    ticketCache.get(1)
+    ticketCache.put({"id": 3, "updated_at": "a"})
+    assert sorted(ticketCache.getMany([1, 2, 3])) == [1, 3]
+    assert ticketCache.get(1) == ({"id": 1, "updated_at": "a"}, True)
+
+def test_cached_ticket_used_while_fresh(stub, run, tmp_path):
+    stub.createTicket({"subject": "s", "description": "d"})
+    cacheFile = tmp_path / "cache.sqlite"
+    run("search", "-t", 1, "--cache", "--cache-file", cacheFile)
+    stub.updateTicket(1, {"subject": "changed"})
+    ticket = searched(run("search", "-t", 1, "--cache", "--cache-file", cacheFile))
+    assert ticket["subject"] == "s"
+    assert stub.countEndpoints[SHOW] == 1 and SHOW_MANY not in stub.countEndpoints
+
+def test_stale_ticket_revalidated(stub, run, tmp_path):
+    stub.createTicket({"subject": "s", "description": "d"})
+    cacheFile = tmp_path / "cache.sqlite"
+    run("search", "-t", 1, "--cache", "--cache-file", cacheFile, "--cache-ttl", 0)
+    stub.updateTicket(1, {"subject": "changed"})
+    stub.tickets[1]["updated_at"] = "2099-01-01T00:00:00Z"
+    ticket = searched(run("search", "-t", 1, "--cache", "--cache-file", cacheFile, "--cache-ttl", 0))
+    assert ticket["subject"] == "changed"
+    assert stub.countEndpoints[SHOW] == 1 and stub.countEndpoints[SHOW_MANY] == 1
+
+def test_search_many_fetches_only_missing(stub, run, tmp_path):
+    for index in range(3):
+        stub.createTicket({"subject": "s{}".format(index), "description": "d"})
+    cacheFile = tmp_path / "cache.sqlite"
+    run("search", "-t", 1, "--cache", "--cache-file", cacheFile)
+    lines = jsonLines(run("search", "-t", "3,1,2", "--cache", "--cache-file", cacheFile))
+    assert [line["id"] for line in lines] == [3, 1, 2]
+    assert stub.countEndpoints[SHOW_MANY] == 1
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the export with the cursor of the state file
+"""
+
+#libraries
+import json
+
+import stubserver
+
+def exported(outputFile):
+    with open(outputFile) as outputOpen:
+        return [json.loads(line)["id"] for line in outputOpen]
+
+def test_export_resumes_from_cursor(stub, run, tmp_path):
+    for index in range(7):
+        stub.createTicket({"subject": "s{}".format(index), "description": "d"})
+    stateFile, outputFile = tmp_path / "state.json", tmp_path / "tickets.jsonl"
+    run("export", "--state-file", stateFile, "--output", outputFile, "--page-size", 3)
+    assert exported(outputFile) == list(range(1, 8))
+    assert json.loads(stateFile.read_text())["cursor"] == "7"
+    for index in range(2):
+        stub.createTicket({"subject": "n{}".format(index), "description": "d"})
+    run("export", "--state-file", stateFile, "--output", outputFile, "--page-size", 3)
+    assert exported(outputFile) == list(range(1, 10))
+    assert json.loads(stateFile.read_text())["cursor"] == "9"
+
+def test_export_interrupted_continues_after_saved_page(stub, run, tmp_path, monkeypatch):
+    for index in range(7):
+        stub.createTicket({"subject": "s{}".format(index), "description": "d"})
+    stateFile, outputFile = tmp_path / "state.json", tmp_path / "tickets.jsonl"
+    original = stubserver.StubHandler._route
+    failed = list()
+
+    def failLastPage(self, method, path, query, content):
+        if "incremental" in path and query.get("cursor") == "6" and not failed:
+            failed.append(path)
+            return self._send(500, {"error": "InternalError"})
+        return original(self, method, path, query, content)
+
+    monkeypatch.setattr(stubserver.StubHandler, "_route", failLastPage)
+    run("export", "--state-file", stateFile, "--output", outputFile, "--page-size", 3)
+    assert failed
+    # the cursor is saved only after the tickets of the page are written
+    cursor = int(json.loads(stateFile.read_text())["cursor"])
+    assert cursor <= len(exported(outputFile))
+    run("export", "--state-file", stateFile, "--output", outputFile, "--page-size", 3)
+    assert set(exported(outputFile)) == set(range(1, 8))
+    assert exported(outputFile)[-1] == 7
+    assert json.loads(stateFile.read_text())["cursor"] == "7"
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the macros applied locally from the macro cache and with show_macro_effect
+"""
+
+#libraries
+from conftest import jsonLines
+
+APPLY = "GET /api/v2/tickets/:id/macros/:id/apply.json"
+MACRO = "GET /api/v2/macros/:id.json"
+
+def createTicket(stub):
+    return stub.createTicket({"subject": "s", "description": "d", "tags": ["a"],
+                              "custom_fields": [{"id": 10, "value": "x"}, {"id": 20, "value": "y"}]})
+
+def test_macro_applied_locally(stub, run):
+    createTicket(stub)
+    stub.macros[5] = {"actions": [{"field": "status", "value": "solved"}, {"field": "custom_fields_20", "value": "z"},
+                                  {"field": "current_tags", "value": "m"}]}
+    report = jsonLines(run("update", "-t", 1, "--macro-ids", 5))[-1]
+    assert report["put"] is True and report["error"] is None
+    assert APPLY not in stub.countEndpoints
+    ticket = stub.tickets[1]
+    assert ticket["status"] == "solved" and ticket["tags"] == ["a", "m"]
+    # the custom fields of the macro replace only the fields with the same ID
+    assert {field["id"]: field["value"] for field in ticket["custom_fields"]} == {10: "x", 20: "z"}
+    # the second update uses the macro of the cache
+    run("update", "-t", 1, "--macro-ids", 5)
+    assert stub.countEndpoints[MACRO] == 1 and APPLY not in stub.countEndpoints
+
+def test_macro_with_placeholder_applied_by_server(stub, run):
+    createTicket(stub)
+    stub.macros[6] = {"actions": [{"field": "status", "value": "pending"},
+                                  {"field": "comment_value", "value": "Hi {{ticket.requester.name}}"}]}
+    report = jsonLines(run("update", "-t", 1, "--macro-ids", 6))[-1]
+    assert report["put"] is True and report["error"] is None
+    assert stub.countEndpoints[APPLY] == 1
+    assert stub.tickets[1]["status"] == "pending"
+
+def test_no_local_macro(stub, run):
+    createTicket(stub)
+    stub.macros[7] = {"actions": [{"field": "status", "value": "solved"}]}
+    run("update", "-t", 1, "--macro-ids", 7, "--no-local-macro")
+    assert stub.countEndpoints[APPLY] == 1 and MACRO not in stub.countEndpoints
+    assert stub.tickets[1]["status"] == "solved"
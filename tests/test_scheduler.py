@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the token bucket of the scheduler and of the requests retried after a 429
+"""
+
+#libraries
+import io
+import sys
+import json
+import pytest
+
+import stubserver
+import zendesk
+from conftest import jsonLines
+
+def test_bucket_waits_when_empty(tmp_path):
+    scheduler = zendesk.RequestScheduler(3, str(tmp_path / "rate.json"))
+    assert [scheduler.tryAcquire() for index in range(3)] == [0, 0, 0]
+    assert 0 < scheduler.tryAcquire() <= 1.0
+
+def test_bucket_keeps_reserve_for_interactive(tmp_path):
+    scheduler = zendesk.RequestScheduler(10, str(tmp_path / "rate.json"), bulkReserve=0.2)
+    with scheduler.bulk():
+        assert scheduler.priority() == "bulk"
+        assert [scheduler.tryAcquire() for index in range(8)] == [0] * 8
+        # 2 tokens are left to the interactive requests
+        assert scheduler.tryAcquire() > 0
+    assert scheduler.priority() == "interactive"
+    assert scheduler.tryAcquire() == 0
+
+def test_bucket_shared_by_state_file(tmp_path):
+    first = zendesk.RequestScheduler(2, str(tmp_path / "rate.json"))
+    second = zendesk.RequestScheduler(2, str(tmp_path / "rate.json"))
+    assert first.tryAcquire() == 0 and second.tryAcquire() == 0
+    assert first.tryAcquire() > 0
+
+def test_observe_429_blocks_bucket(tmp_path):
+    scheduler = zendesk.RequestScheduler(60, str(tmp_path / "rate.json"))
+    assert scheduler.observe(200, {}) is None
+    assert scheduler.observe(429, {"Retry-After": "5"}) == 5.0
+    assert scheduler.tryAcquire() == 1.0
+    with open(str(tmp_path / "rate.json")) as stateOpen:
+        state = json.load(stateOpen)
+    assert state["tokens"] < 1 and state["blockedUntil"] > state["updated"]
+
+def test_observe_remaining_caps_tokens(tmp_path):
+    scheduler = zendesk.RequestScheduler(60, str(tmp_path / "rate.json"))
+    assert scheduler.observe(200, {"X-Rate-Limit-Remaining": "0"}) is None
+    assert scheduler.tryAcquire() > 0
+
+@pytest.mark.parametrize("statusCode, headers, expected", [(200, {"Retry-After": "5"}, None), (429, {}, 60.0),
+                                                           (429, {"Retry-After": "x"}, 60.0), (429, {"Retry-After": "-1"}, 0)])
+def test_retry_after(statusCode, headers, expected):
+    assert zendesk.RequestScheduler.retryAfter(statusCode, headers) == expected
+
+@pytest.mark.parametrize("rateLimit", [None, 600])
+def test_update_retried_after_429(stub, run, tmp_path, rateLimit):
+    stub.createTicket({"subject": "s", "description": "d"})
+    # the GET of the ticket is the request 1, the PUT is the request 2 and answered with 429
+    stub.rateLimitEvery = 2
+    arguments = ["update", "-t", 1, "--status", "open"] + (["--rate-limit", rateLimit] if rateLimit else [])
+    report = jsonLines(run(*arguments))[-1]
+    assert report["put"] is True and report["error"] is None
+    assert stub.countRateLimited == 1 and stub.countEndpoints["PUT /api/v2/tickets/:id.json"] == 2
+    assert stub.tickets[1]["status"] == "open"
+    if rateLimit:
+        with open(str(tmp_path / "zendesk_ratelimit.json")) as stateOpen:
+            assert json.load(stateOpen)["blockedUntil"] > 0
+
+def test_async_search_retried_after_429(stub, run, monkeypatch):
+    stub.createTicket({"subject": "s", "description": "d"})
+    original = stubserver.StubHandler._route
+    limited = list()
+
+    def limitFirst(self, method, path, query, content):
+        # only the first request of the engine is answered with 429
+        if not limited:
+            limited.append(path)
+            return self._send(429, {"error": "APIRateLimitExceeded"}, {"Retry-After": "1"})
+        return original(self, method, path, query, content)
+
+    monkeypatch.setattr(stubserver.StubHandler, "_route", limitFirst)
+    payload = {"id": "s", "internal": {"action": "search", "ticketID": "1"}}
+    monkeypatch.setattr(sys, "stdin", io.StringIO(json.dumps(payload) + "\n"))
+    result = jsonLines(run("serve", "--concurrency", 2))[-1]
+    assert limited and result["ok"] is True and result["errors"] == []
+    assert [ticket["id"] for ticket in result["output"]] == [1]
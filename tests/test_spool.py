@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the spool of the actions, the replay of the segments by the flush and the dedup of the creates
+"""
+
+#libraries
+import os
+import glob
+
+import zendesk
+from conftest import jsonLines
+
+def test_flush_replays_spooled_actions(stub, run, tmp_path):
+    stub.createTicket({"subject": "s", "description": "d"})
+    run("create", "--subject", "a", "--description", "d", "--spool")
+    run("update", "-t", "1", "--status", "open", "--tags", "x", "--spool")
+    run("update", "-t", "1", "--priority", "high", "--spool")
+    assert len(stub.tickets) == 1
+    lines = jsonLines(run("flush"))
+    assert len(stub.tickets) == 2
+    assert stub.tickets[1]["status"] == "open" and stub.tickets[1]["priority"] == "high" and stub.tickets[1]["tags"] == ["x"]
+    assert stub.tickets[2].get("external_id") is None
+    assert all(line.get("error") is None for line in lines)
+    # the segments are removed after the flush
+    assert not glob.glob(str(tmp_path / "zendesk_spool.jsonl*.segment"))
+
+def test_flush_continues_segment_after_offset(stub, run, tmp_path):
+    stub.createTicket({"subject": "s", "description": "d"})
+    run("update", "-t", "1", "--status", "solved", "--spool")
+    run("update", "-t", "1", "--priority", "low", "--spool")
+    spool = zendesk.ActionSpool(str(tmp_path / "zendesk_spool.jsonl"))
+    segment = spool.segments()[0]
+    # the first line was done by a flush interrupted
+    spool.done(segment, 1)
+    run("flush")
+    assert stub.tickets[1]["status"] == "new" and stub.tickets[1]["priority"] == "low"
+    assert not os.path.exists(segment)
+
+def test_flush_dedup_create_after_failed_job(stub, run, tmp_path):
+    run("create", "--subject", "a", "--description", "d", "--spool")
+    run("create", "--subject", "b", "--description", "d", "--spool")
+    createJob = stub.createJob
+    calls = list()
+
+    def failFirstJob(results):
+        # the tickets are created and the response of the request is lost
+        calls.append(results)
+        if len(calls) == 1:
+            raise RuntimeError("connection lost")
+        return createJob(results)
+
+    stub.createJob = failFirstJob
+    lines = jsonLines(run("flush", "--retry-delay", 0.01, "--dedup-external-id"))
+    assert len(stub.tickets) == 2
+    assert sorted(line["ticket_id"] for line in lines if line.get("created_before") is True) == [1, 2]
+    assert {ticket["external_id"] for ticket in stub.tickets.values()} == {"spool-{}".format(line["id"]) for line in lines}
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the safe update of the single, blind, bulk and async updates
+"""
+
+#libraries
+import io
+import sys
+import json
+import pytest
+
+from conftest import jsonLines
+
+#updated_at older than the tickets of the stub
+STALE = "2000-01-01T00:00:00Z"
+
+def test_safe_update_conflict(stub, run):
+    stub.createTicket({"subject": "s", "description": "d"})
+    report = jsonLines(run("update", "-t", 1, "--status", "open", "--safe-update", "--updated-stamp", STALE))[-1]
+    assert report["put"] is False and report["error"] is not None
+    assert stub.tickets[1]["status"] == "new"
+
+def test_safe_update_with_fetched_ticket(stub, run):
+    stub.createTicket({"subject": "s", "description": "d"})
+    report = jsonLines(run("update", "-t", 1, "--status", "open", "--safe-update"))[-1]
+    assert report["put"] is True and report["error"] is None
+    assert stub.tickets[1]["status"] == "open"
+
+def test_blind_safe_update_conflict(stub, run):
+    stub.createTicket({"subject": "s", "description": "d"})
+    report = jsonLines(run("update", "-t", 1, "--status", "open", "--no-fetch", "--safe-update", "--updated-stamp", STALE))[-1]
+    assert report["fetch"] is False and report["put"] is False and report["error"] is not None
+    assert not any(key.startswith("GET ") for key in stub.countEndpoints)
+    assert stub.tickets[1]["status"] == "new"
+
+def test_bulk_safe_update_reports_conflicts_per_line(stub, run, tmp_path):
+    for index in range(3):
+        stub.createTicket({"subject": "s{}".format(index), "description": "d"})
+    stamp = stub.tickets[1]["updated_at"]
+    stub.tickets[2]["updated_at"] = "2099-01-01T00:00:00Z"
+    fromFile = tmp_path / "update.jsonl"
+    fromFile.write_text("\n".join(json.dumps(record) for record in (
+        {"id": 1, "status": "open", "updated_stamp": stamp},
+        {"id": 2, "status": "open", "updated_stamp": stamp},
+        {"id": 3, "status": "open"})) + "\n")
+    lines = {line["line"]: line for line in jsonLines(run("update", "--from-file", fromFile, "--safe-update")) if "line" in line}
+    assert lines[1].get("error") is None and lines[1]["ticket_id"] == 1
+    assert "UpdateConflict" in lines[2]["error"]
+    assert "updated_stamp" in lines[3]["error"]
+    assert [stub.tickets[ticketID]["status"] for ticketID in (1, 2, 3)] == ["open", "new", "new"]
+
+def test_bulk_safe_update_needs_from_file(stub, run):
+    with pytest.raises(SystemExit):
+        run("update", "-t", "1,2", "--status", "open", "--safe-update")
+
+def test_async_safe_update_of_many_tickets_fails(stub, run, monkeypatch):
+    for index in range(2):
+        stub.createTicket({"subject": "s{}".format(index), "description": "d"})
+    payload = {"id": "u", "values": {"status": "open"}, "internal": {"action": "update", "ticketID": "1,2", "safeUpdate": True}}
+    monkeypatch.setattr(sys, "stdin", io.StringIO(json.dumps(payload) + "\n"))
+    result = jsonLines(run("serve", "--concurrency", 2))[-1]
+    assert result["ok"] is False and any("--safe-update" in error for error in result["errors"])
+    assert [ticket["status"] for ticket in stub.tickets.values()] == ["new", "new"]
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the LF to CRLF conversion of the uploads and of the upload retried after a 429
+"""
+
+#libraries
+import io
+import re
+import pytest
+
+import stubserver
+import zendesk
+from conftest import jsonLines
+
+def converted(content):
+    return re.sub(b'(?<!\r)\n', b'\r\n', content)
+
+@pytest.mark.parametrize("content", [b"a\nb\r\nc\n", b"\r\n\r\n\n\n", b"ab\r\ncd\r\n", b"\r\r\n\n\r", b"no newline", b""])
+@pytest.mark.parametrize("chunkSize", [1, 2, 3, 5, 64])
+def test_crlf_chunk_boundaries(tmp_path, content, chunkSize):
+    uploadFile = tmp_path / "upload.txt"
+    uploadFile.write_bytes(content)
+    with zendesk.UploadBody(str(uploadFile), chunkSize=chunkSize) as uploadBody:
+        assert b"".join(uploadBody) == converted(content)
+        assert len(uploadBody) == len(converted(content))
+    assert uploadFile.read_bytes() == content
+
+def test_body_rewind_and_sent(tmp_path):
+    uploadFile = tmp_path / "upload.txt"
+    uploadFile.write_bytes(b"a\nb\nc\n")
+    with zendesk.UploadBody(str(uploadFile), chunkSize=2) as uploadBody:
+        assert uploadBody.sent == 0
+        assert uploadBody.read(4) == b"a\r\nb"
+        uploadBody.seek(0)
+        assert uploadBody.read() == b"a\r\nb\r\nc\r\n"
+        assert uploadBody.sent == 9
+        with pytest.raises(io.UnsupportedOperation):
+            uploadBody.seek(2)
+
+def test_body_without_convert(tmp_path):
+    uploadFile = tmp_path / "upload.bin"
+    uploadFile.write_bytes(b"a\nb\n")
+    with zendesk.UploadBody(str(uploadFile), convert=False) as uploadBody:
+        assert uploadBody.read() == b"a\nb\n"
+        assert len(uploadBody) == 4
+
+def test_upload_retried_after_429_sends_whole_body(stub, run, tmp_path, monkeypatch):
+    uploadFile = tmp_path / "upload.txt"
+    uploadFile.write_bytes(b"line 1\nline 2\n")
+    stub.createTicket({"subject": "s", "description": "d"})
+    sizes = list()
+    original = stubserver.StubHandler._route
+
+    def recordRoute(self, method, path, query, content):
+        if path.endswith("uploads.json"):
+            sizes.append(len(content))
+        return original(self, method, path, query, content)
+
+    monkeypatch.setattr(stubserver.StubHandler, "_route", recordRoute)
+    # the GET of the ticket is the request 1, the upload is the request 2 and answered with 429
+    stub.rateLimitEvery = 2
+    lines = jsonLines(run("update", "-t", 1, "--comment", "c", "--upload", uploadFile))
+    assert stub.countEndpoints["POST /api/v2/uploads.json"] == 2
+    assert sizes == [16]
+    upload = [line for line in lines if "upload" in line][0]
+    assert upload["bytes"] == 14 and upload["bytes_sent"] == 16 and upload["ok"] is True
+    assert lines[-1]["put"] is True and lines[-1]["error"] is None
@@ -12,14 +12,55 @@ http://docs.facetoe.com.au/zenpy.html
 """
 
 #libraries
+import time
+#start of the run, the startup time of the stats counts the imports of the module
+moduleStarted = time.perf_counter()
 import sys
 import logging
+import logging.handlers
+import queue
+import atexit
 import argparse
-import time
+import importlib
+import csv
+import json
+import io
+import os
+import re
+import glob
+import random
+import threading
+import fcntl
+import base64
+from types import SimpleNamespace
 from datetime import datetime
-from zenpy import Zenpy
-from zenpy.lib.api_objects import Ticket, Comment, User
-from contextlib import closing
+from urllib.parse import urlparse
+from contextlib import contextmanager, nullcontext
+
+class LazyModule:
+
+    def __init__(self, moduleName):
+        """
+        Module imported in the first access of an attribute, zenpy, requests and asyncio are most of the
+        startup and the help, the validation of the arguments and the spool do not use them
+        """
+        self._moduleName = moduleName
+
+    def __getattr__(self, item):
+        return getattr(importlib.import_module(self._moduleName), item)
+
+#libraries imported in the first use
+uuid = LazyModule("uuid")
+asyncio = LazyModule("asyncio")
+sqlite3 = LazyModule("sqlite3")
+socketserver = LazyModule("socketserver")
+cProfile = LazyModule("cProfile")
+pstats = LazyModule("pstats")
+futures = LazyModule("concurrent.futures")
+requests = LazyModule("requests")
+zenpy = LazyModule("zenpy")
+apiObjects = LazyModule("zenpy.lib.api_objects")
+zenpyExceptions = LazyModule("zenpy.lib.exception")
 
 class Usage:
 
@@ -33,12 +74,21 @@ class Usage:
             self.arguments = argparse.ArgumentParser()
             #subarguments to define action in zendesk
             self.action = self.arguments.add_subparsers(help='action in zendesk', required=True, dest='action')
-            #create arguments
-            self._createArguments()
-            #search arguments
-            self._searchArguments()
-            #update arguments
-            self._updateArguments()
+            #arguments of each action, only the action requested is built, the others are added empty for the help
+            self._actions = {
+                "create": self._createArguments,
+                "search": self._searchArguments,
+                "update": self._updateArguments,
+                "serve": self._serveArguments,
+                "export": self._exportArguments,
+                "flush": self._flushArguments,
+            }
+            self._actionName = next((item for item in sys.argv[1:] if not item.startswith("-")), None)
+            for action, arguments in self._actions.items():
+                if action == self._actionName:
+                    arguments()
+                else:
+                    self.action.add_parser(action)
             self._args = vars(self.arguments.parse_args())
             #set variables with values of the arguments
             self._initializeValues()
@@ -79,6 +129,50 @@ class Usage:
                 "ticketID": self._args.get("ticketID"),
                 "jobID": self._args.get("jobID"),
                 "getID": self._args.get("get_id"),
+                "poolSize": self._args.get("poolSize"),
+                "connectTimeout": self._args.get("connectTimeout"),
+                "readTimeout": self._args.get("readTimeout"),
+                "fromFile": self._args.get("fromFile"),
+                "batchSize": self._args.get("batchSize"),
+                "idsFile": self._args.get("idsFile"),
+                "jobTimeout": self._args.get("jobTimeout"),
+                "pollInterval": self._args.get("pollInterval"),
+                "socket": self._args.get("socket"),
+                "workers": self._args.get("workers"),
+                "concurrency": self._args.get("concurrency"),
+                "cache": self._args.get("cache"),
+                "cacheFile": self._args.get("cacheFile"),
+                "cacheTTL": self._args.get("cacheTTL"),
+                "cacheSize": self._args.get("cacheSize"),
+                "query": self._args.get("query"),
+                "pageSize": self._args.get("pageSize"),
+                "stateFile": self._args.get("stateFile"),
+                "startTime": self._args.get("startTime"),
+                "output": self._args.get("output"),
+                "format": self._args.get("format"),
+                "noCRLF": self._args.get("noCRLF"),
+                "uploadWorkers": self._args.get("uploadWorkers"),
+                "rateLimit": self._args.get("rateLimit"),
+                "rateState": self._args.get("rateState"),
+                "bulkReserve": self._args.get("bulkReserve"),
+                "macroCacheFile": self._args.get("macroCacheFile"),
+                "macroTTL": self._args.get("macroTTL"),
+                "noLocalMacro": self._args.get("noLocalMacro"),
+                "requesterIndexFile": self._args.get("requesterIndexFile"),
+                "noRequesterIndex": self._args.get("noRequesterIndex"),
+                "fetch": self._args.get("fetch"),
+                "safeUpdate": self._args.get("safeUpdate"),
+                "updatedStamp": self._args.get("updatedStamp"),
+                "spool": self._args.get("spool"),
+                "spoolFile": self._args.get("spoolFile"),
+                "maxRetries": self._args.get("maxRetries"),
+                "maxAttempts": self._args.get("maxAttempts"),
+                "retryDelay": self._args.get("retryDelay"),
+                "interval": self._args.get("interval"),
+                "dedupExternalID": self._args.get("dedupExternalID"),
+                "stats": self._args.get("stats"),
+                "metricsFile": self._args.get("metricsFile"),
+                "profile": self._args.get("profile"),
             }
             self._zendesk._listValues = [
                 "description", "subject", "tags", "assignee_id", "requester",
@@ -89,14 +183,277 @@ class Usage:
             self._zendesk._listInternal = [
                 "token", "action", "noVirtualenv", "noDefaultToken", "logFile",
                 "upload", "internalMacroID", "ticketID", "noKeepTags", "getID",
-                "jobID",
+                "jobID", "poolSize", "connectTimeout", "readTimeout", "fromFile", "batchSize",
+                "idsFile", "jobTimeout", "pollInterval", "socket", "workers", "concurrency",
+                "cache", "cacheFile", "cacheTTL", "cacheSize", "query", "pageSize",
+                "stateFile", "startTime", "output", "format", "noCRLF",
+                "uploadWorkers", "rateLimit", "rateState", "bulkReserve",
+                "macroCacheFile", "macroTTL", "noLocalMacro", "requesterIndexFile", "noRequesterIndex",
+                "fetch", "safeUpdate", "updatedStamp", "spool", "spoolFile", "maxRetries", "maxAttempts", "retryDelay", "interval",
+                "dedupExternalID",
+                "stats", "metricsFile", "profile",
             ]
             self._zendesk._comment.public = self._args.get("private")
             self._zendesk._comment.uploads = self._args.get("upload")
-            # check use together of the ticketid and jobid
-            if self._zendesk._dictInternal["ticketID"] is not None and self._zendesk._dictInternal["jobID"] is not None:
-                print("search: error: the following arguments can not be used together: -t, -j")
+            # check the arguments required by other arguments
+            if self._zendesk._dictInternal["noDefaultToken"] is True and self._zendesk._dictInternal["token"] is None:
+                print("{}: error: the following arguments are required with --no-default-token: --token".format(
+                    self._zendesk._dictInternal["action"]))
+                exit(1)
+            if self._zendesk._dictInternal["action"] == "update" and self._args.get("noKeepTags") is True and self._args.get("tags") is None:
+                print("update: error: the following arguments are required with --no-keep-tags: --tags")
+                exit(1)
+            if self._zendesk._dictInternal["action"] == "update" and all(self._zendesk._dictInternal[item] is None for item in (
+                    "ticketID", "idsFile", "fromFile")):
+                print("update: error: one of the following arguments is required: -t, --ids-file, --from-file")
+                exit(1)
+            if self._zendesk._dictInternal["action"] == "search" and all(self._zendesk._dictInternal[item] is None for item in (
+                    "ticketID", "jobID", "query")):
+                print("search: error: one of the following arguments is required: -t, -j, --query")
+                exit(1)
+            # check use together of the ticketid, jobid and query
+            if len([item for item in ("ticketID", "jobID", "query") if self._zendesk._dictInternal[item] is not None]) > 1:
+                print("search: error: the following arguments can not be used together: -t, -j, --query")
+                exit(1)
+            if self._zendesk._dictInternal["pageSize"] is not None and not 1 <= self._zendesk._dictInternal["pageSize"] <= 1000:
+                print("{}: error: argument --page-size: must be between 1 and 1000".format(self._zendesk._dictInternal["action"]))
+                exit(1)
+            # check limit of the bulk endpoints
+            if self._zendesk._dictInternal["batchSize"] is not None and not 1 <= self._zendesk._dictInternal["batchSize"] <= 100:
+                print("{}: error: argument --batch-size: must be between 1 and 100".format(self._zendesk._dictInternal["action"]))
                 exit(1)
+            if self._zendesk._dictInternal["rateLimit"] is not None and self._zendesk._dictInternal["rateLimit"] <= 0:
+                print("{}: error: argument --rate-limit: must be greater than 0".format(self._zendesk._dictInternal["action"]))
+                exit(1)
+            if self._zendesk._dictInternal["bulkReserve"] is not None and not 0 <= self._zendesk._dictInternal["bulkReserve"] < 1:
+                print("{}: error: argument --bulk-reserve: must be between 0 and 1".format(self._zendesk._dictInternal["action"]))
+                exit(1)
+            if self._zendesk._dictInternal["workers"] is not None and self._zendesk._dictInternal["workers"] < 1:
+                print("serve: error: argument --workers: must be greater than 0")
+                exit(1)
+            if self._zendesk._dictInternal["concurrency"] is not None and self._zendesk._dictInternal["concurrency"] < 1:
+                print("serve: error: argument --concurrency: must be greater than 0")
+                exit(1)
+            # the spooled create is executed by the flush, the ID of the ticket is not known
+            if self._zendesk._dictInternal["spool"] is True and self._zendesk._dictInternal["getID"] is True:
+                print("create: error: the following arguments can not be used together: --spool, --get-id")
+                exit(1)
+            if self._zendesk._dictInternal["updatedStamp"] is not None and self._zendesk._dictInternal["safeUpdate"] is not True:
+                print("update: error: argument --updated-stamp: used only with --safe-update")
+                exit(1)
+            if (self._zendesk._dictInternal["safeUpdate"] is True and self._zendesk._dictInternal["updatedStamp"] is None and
+                    self._zendesk._dictInternal["fetch"] == "never"):
+                print("update: error: argument --safe-update: --no-fetch needs the --updated-stamp")
+                exit(1)
+            # the bulk update has not the updated_at of the tickets, the records of --from-file have the updated_stamp
+            if (self._zendesk._dictInternal["action"] == "update" and self._zendesk._dictInternal["spool"] is not True and
+                    self._zendesk._dictInternal["safeUpdate"] is True and (self._zendesk._dictInternal["idsFile"] is not None or
+                                                                         "," in str(self._zendesk._dictInternal["ticketID"] or ""))):
+                print("update: error: argument --safe-update: many tickets need --from-file with the updated_stamp of each ticket")
+                exit(1)
+            if self._zendesk._dictInternal["updatedStamp"] is not None and (
+                    self._zendesk._dictInternal["idsFile"] is not None or self._zendesk._dictInternal["fromFile"] is not None or
+                    "," in str(self._zendesk._dictInternal["ticketID"] or "")):
+                print("update: error: argument --updated-stamp: used only with one ticket of -t")
+                exit(1)
+            if self._zendesk._dictInternal["maxRetries"] is not None and self._zendesk._dictInternal["maxRetries"] < 0:
+                print("flush: error: argument --max-retries: must be 0 or greater")
+                exit(1)
+            if self._zendesk._dictInternal["maxAttempts"] is not None and self._zendesk._dictInternal["maxAttempts"] < 1:
+                print("flush: error: argument --max-attempts: must be greater than 0")
+                exit(1)
+
+        except Exception as er:
+            print("{} - {}".format(self.__class__.__name__, er))
+            exit(1)
+
+    def _connectionArguments(self, parser):
+        try:
+            parser.add_argument("--pool-size", help="maximum of keep-alive connections in the pool",
+                                action="store", default=10, type=int, dest="poolSize", metavar="poolSize")
+            parser.add_argument("--connect-timeout", help="timeout in seconds to open the connection",
+                                action="store", default=10, type=float, dest="connectTimeout", metavar="connectTimeout")
+            parser.add_argument("--read-timeout", help="timeout in seconds to wait the response",
+                                action="store", default=60, type=float, dest="readTimeout", metavar="readTimeout")
+            parser.add_argument("--rate-limit", help="maximum of requests per minute shared by the processes",
+                                action="store", default=None, type=float, dest="rateLimit", metavar="rateLimit")
+            parser.add_argument("--rate-state", help="file with the state of the rate limit shared by the processes",
+                                action="store", default="/tmp/zendesk_ratelimit.json", dest="rateState", metavar="rateState")
+            parser.add_argument("--bulk-reserve", help="fraction of the rate limit reserved to the interactive requests",
+                                action="store", default=0.2, type=float, dest="bulkReserve", metavar="bulkReserve")
+
+        except Exception as er:
+            print("{} - {}".format(self.__class__.__name__, er))
+            exit(1)
+
+    def _metricsArguments(self, parser):
+        try:
+            parser.add_argument("--stats", help="print the summary of the API calls in the stderr at the end",
+                                default=None, action="store_true", dest="stats")
+            parser.add_argument("--metrics-file", help="write the metrics of the API calls, Prometheus textfile if "
+                                "the extension is .prom, else JSON", action="store", default=None, dest="metricsFile",
+                                metavar="metricsFile")
+            parser.add_argument("--profile", help="write the cProfile of the run in the file and print the top functions "
+                                "in the stderr", action="store", default=None, dest="profile", metavar="profile")
+
+        except Exception as er:
+            print("{} - {}".format(self.__class__.__name__, er))
+            exit(1)
+
+    def _serveArguments(self):
+        try:
+            self.argServe = self.action.add_parser('serve')
+            self.argServe.add_argument('--socket', dest='socket', help='path of the Unix socket, default read the stdin',
+                                       metavar="socket", action="store", default=None)
+            self.argServe.add_argument('--workers', dest='workers', help='actions executed at the same time',
+                                       metavar="workers", type=int, action="store", default=4)
+            self.argServe.add_argument('--concurrency', dest='concurrency', metavar="concurrency", type=int,
+                                       help='execute the actions with asyncio and at most concurrency requests at the same time',
+                                       action="store", default=None)
+            self.argServe.add_argument("--token", help="specific the token, only use if set --no-default-token",
+                                       action="store", default=None, dest="token", metavar="token")
+            self.argServe.add_argument("--no-virtualenv", help="no use virtualenv", action="store_true",
+                                       default=None, dest="noVirtualenv")
+            self.argServe.add_argument("--no-default-token", help="set for use the default token",
+                                       default=None, action="store_true", dest="noDefaultToken")
+            self.argServe.add_argument("--log-file", help="write the log in JSON lines in /tmp/zendesk_<date>.log, rotated by size",
+                                       default=None, action="store_true", dest="logFile")
+            self._connectionArguments(self.argServe)
+            self._metricsArguments(self.argServe)
+            self._cacheArguments(self.argServe)
+            self._macroArguments(self.argServe)
+            self._requesterArguments(self.argServe)
+            self._jobArguments(self.argServe)
+
+        except Exception as er:
+            print("{} - {}".format(self.__class__.__name__, er))
+            exit(1)
+
+    def _exportArguments(self):
+        try:
+            self.argExport = self.action.add_parser('export')
+            self.argExport.add_argument('--state-file', dest='stateFile', help='file with the cursor of the export',
+                                        metavar="stateFile", action="store", default="/tmp/zendesk_export.json")
+            self.argExport.add_argument('--start-time', dest='startTime', help='epoch of the first export, used without state file',
+                                        metavar="startTime", type=int, action="store", default=0)
+            self.argExport.add_argument('--output', dest='output', help='file to append the tickets, default stdout',
+                                        metavar="output", action="store", default=None)
+            self.argExport.add_argument('--format', dest='format', help='jsonl with the ticket, or flat with nested fields as columns',
+                                        choices=["jsonl", "flat"], action="store", default="jsonl")
+            self.argExport.add_argument('--page-size', dest='pageSize', help='tickets per page, maximum 1000',
+                                        metavar="pageSize", type=int, action="store", default=1000)
+            self.argExport.add_argument("--token", help="specific the token, only use if set --no-default-token",
+                                        action="store", default=None, dest="token", metavar="token")
+            self.argExport.add_argument("--no-virtualenv", help="no use virtualenv", action="store_true",
+                                        default=None, dest="noVirtualenv")
+            self.argExport.add_argument("--no-default-token", help="set for use the default token",
+                                        default=None, action="store_true", dest="noDefaultToken")
+            self.argExport.add_argument("--log-file", help="write the log in JSON lines in /tmp/zendesk_<date>.log, rotated by size",
+                                        default=None, action="store_true", dest="logFile")
+            self._connectionArguments(self.argExport)
+            self._metricsArguments(self.argExport)
+
+        except Exception as er:
+            print("{} - {}".format(self.__class__.__name__, er))
+            exit(1)
+
+    def _flushArguments(self):
+        try:
+            self.argFlush = self.action.add_parser('flush')
+            self.argFlush.add_argument('--batch-size', dest='batchSize', help='tickets per bulk job, maximum 100',
+                                       metavar="batchSize", type=int, default=100)
+            self.argFlush.add_argument('--max-retries', dest='maxRetries', help='retries of a bulk job that fails with 429, 5xx or '
+                                       'a connection error, after that the actions are spooled again',
+                                       metavar="maxRetries", type=int, action="store", default=5)
+            self.argFlush.add_argument('--max-attempts', dest='maxAttempts', help='flushes of an action before it is moved '
+                                       'to the .failed file of the spool', metavar="maxAttempts", type=int, action="store", default=5)
+            self.argFlush.add_argument('--retry-delay', dest='retryDelay', help='seconds of the first retry, doubled in each retry',
+                                       metavar="retryDelay", type=float, action="store", default=1)
+            self.argFlush.add_argument('--interval', dest='interval', help='flush the spool every interval seconds until '
+                                       'interrupted, default flush once', metavar="interval", type=float, action="store", default=None)
+            self.argFlush.add_argument('--dedup-external-id', dest='dedupExternalID', help='set the external_id spool-<ID> in '
+                                       'the created tickets without external_id, a create retried after a request lost is '
+                                       'not duplicated, the external_id is kept in the ticket. Without it only the tickets '
+                                       'with an external_id are deduplicated', action="store_true", default=None)
+            self.argFlush.add_argument("--token", help="specific the token, only use if set --no-default-token",
+                                       action="store", default=None, dest="token", metavar="token")
+            self.argFlush.add_argument("--no-virtualenv", help="no use virtualenv", action="store_true",
+                                       default=None, dest="noVirtualenv")
+            self.argFlush.add_argument("--no-default-token", help="set for use the default token",
+                                       default=None, action="store_true", dest="noDefaultToken")
+            self.argFlush.add_argument("--log-file", help="write the log in JSON lines in /tmp/zendesk_<date>.log, rotated by size",
+                                       default=None, action="store_true", dest="logFile")
+            self._spoolArguments(self.argFlush, flush=True)
+            self._jobArguments(self.argFlush)
+            self._connectionArguments(self.argFlush)
+            self._metricsArguments(self.argFlush)
+            self._cacheArguments(self.argFlush)
+            self._macroArguments(self.argFlush)
+            self._requesterArguments(self.argFlush)
+
+        except Exception as er:
+            print("{} - {}".format(self.__class__.__name__, er))
+            exit(1)
+
+    def _spoolArguments(self, parser, flush=False):
+        try:
+            if flush is False:
+                parser.add_argument("--spool", help="append the action to the spool and return, the action is executed by flush",
+                                    default=None, action="store_true", dest="spool")
+            parser.add_argument("--spool-file", help="path of the spool of the actions",
+                                action="store", default="/tmp/zendesk_spool.jsonl", dest="spoolFile", metavar="spoolFile")
+
+        except Exception as er:
+            print("{} - {}".format(self.__class__.__name__, er))
+            exit(1)
+
+    def _cacheArguments(self, parser):
+        try:
+            parser.add_argument("--cache", help="use the local cache of the tickets", action="store_true",
+                                default=None, dest="cache")
+            parser.add_argument("--cache-file", help="path of the SQLite file of the cache",
+                                action="store", default="/tmp/zendesk_cache.sqlite", dest="cacheFile", metavar="cacheFile")
+            parser.add_argument("--cache-ttl", help="seconds a cached ticket is used without revalidate",
+                                action="store", default=300, type=float, dest="cacheTTL", metavar="cacheTTL")
+            parser.add_argument("--cache-size", help="maximum of tickets in the cache, the least recently used are removed",
+                                action="store", default=10000, type=int, dest="cacheSize", metavar="cacheSize")
+
+        except Exception as er:
+            print("{} - {}".format(self.__class__.__name__, er))
+            exit(1)
+
+    def _macroArguments(self, parser):
+        try:
+            parser.add_argument("--macro-cache-file", help="path of the SQLite file of the cache of the macros",
+                                action="store", default="/tmp/zendesk_macros.sqlite", dest="macroCacheFile",
+                                metavar="macroCacheFile")
+            parser.add_argument("--macro-ttl", help="seconds a cached macro is used without fetch again",
+                                action="store", default=600, type=float, dest="macroTTL", metavar="macroTTL")
+            parser.add_argument("--no-local-macro", help="apply the macro with the API, not locally",
+                                default=None, action="store_true", dest="noLocalMacro")
+
+        except Exception as er:
+            print("{} - {}".format(self.__class__.__name__, er))
+            exit(1)
+
+    def _requesterArguments(self, parser):
+        try:
+            parser.add_argument("--requester-index-file", help="path of the SQLite file of the user IDs of the requesters",
+                                action="store", default="/tmp/zendesk_requesters.sqlite", dest="requesterIndexFile",
+                                metavar="requesterIndexFile")
+            parser.add_argument("--no-requester-index", help="send the requester e-mail in each ticket, not the user ID",
+                                default=None, action="store_true", dest="noRequesterIndex")
+
+        except Exception as er:
+            print("{} - {}".format(self.__class__.__name__, er))
+            exit(1)
+
+    def _jobArguments(self, parser):
+        try:
+            parser.add_argument("--job-timeout", help="seconds to wait the jobs before report timeout",
+                                action="store", default=60, type=float, dest="jobTimeout", metavar="jobTimeout")
+            parser.add_argument("--poll-interval", help="seconds of the first poll of the jobs, doubled in each poll",
+                                action="store", default=0.25, type=float, dest="pollInterval", metavar="pollInterval")
 
         except Exception as er:
             print("{} - {}".format(self.__class__.__name__, er))
@@ -105,8 +462,15 @@ class Usage:
     def _updateArguments(self):
         try:
             self.argUpdate = self.action.add_parser('update')
-            self.argUpdate.add_argument('-t', dest='ticketID', help='ID of the ticket', metavar="ticketID",
-                                        required=True, action="store")
+            self.argUpdate.add_argument('-t', dest='ticketID', help='ID of the ticket, or IDs separated by comma',
+                                        metavar="ticketID", action="store", default=None)
+            self.argUpdate.add_argument('--ids-file', dest='idsFile', help='file with one ticket ID per line',
+                                        metavar="path_file", action="store", default=None)
+            self.argUpdate.add_argument('--from-file', dest='fromFile', help='JSONL or CSV file with the ID and the changes of each ticket, '
+                                        'and the updated_stamp of the ticket used by --safe-update',
+                                        metavar="path_file", action="store", default=None)
+            self.argUpdate.add_argument('--batch-size', dest='batchSize', help='tickets per bulk job, maximum 100',
+                                        metavar="batchSize", type=int, default=100)
             self.argUpdate.add_argument('--subject', dest='subject', help='subject of the comment',
                                         metavar="subject", action="store", default=None)
             self.argUpdate.add_argument('--comment', dest='comment', help='description of the comment',
@@ -114,7 +478,7 @@ class Usage:
             self.argUpdate.add_argument('--private', dest='private', help='set private comment',
                                         action="store_false", default=True)
             self.argUpdate.add_argument('--tags', dest='tags', help='tags of the ticket',
-                                        metavar="tags", required='--no-keep-tags' in sys.argv, action="store", default=None)
+                                        metavar="tags", action="store", default=None)
             self.argUpdate.add_argument('--status', dest='status', help='status of the ticket',
                                         metavar="status", action="store", default=None)
             self.argUpdate.add_argument('--macro-ids', dest='macro_ids', help='macro id to the ticket',
@@ -143,19 +507,38 @@ class Usage:
                                         metavar="priority", action="store", default=None)
             self.argUpdate.add_argument('--no-keep-tags', dest='noKeepTags', help='this options clear the existing tags',
                                         action="store_true", default=None)
-            self.argUpdate.add_argument('--upload', dest='upload', help='path of the file',
-                                        metavar="path_file", action="store", default=None)
+            self.argUpdate.add_argument('--fetch', dest='fetch', help='fetch the ticket before the update, always, never, or '
+                                        'auto when the changes do not need the ticket', choices=["always", "never", "auto"],
+                                        action="store", default="always")
+            self.argUpdate.add_argument('--no-fetch', dest='fetch', help='update without fetch the ticket, same as --fetch never',
+                                        action="store_const", const="never")
+            self.argUpdate.add_argument('--safe-update', dest='safeUpdate', help='fail the update if the ticket changed after '
+                                        'the --updated-stamp, or after the ticket fetched, with --from-file after the '
+                                        'updated_stamp of each record', action="store_true", default=None)
+            self.argUpdate.add_argument('--updated-stamp', dest='updatedStamp', help='updated_at of the ticket known by the '
+                                        'caller, used by --safe-update', metavar="updatedStamp", action="store", default=None)
+            self.argUpdate.add_argument('--upload', dest='upload', help='paths or globs of the files',
+                                        metavar="path_file", action="store", nargs="+", default=None)
+            self.argUpdate.add_argument('--upload-workers', dest='uploadWorkers', help='files uploaded at the same time',
+                                        metavar="uploadWorkers", type=int, action="store", default=4)
+            self.argUpdate.add_argument('--no-crlf', dest='noCRLF', help='upload the file without convert LF to CRLF, for binary files',
+                                        action="store_true", default=None)
             self.argUpdate.add_argument('--macro-id-internal', dest='internalMacroID', help='use a internal macro to comment in ticket',
                                         metavar="internalMacroID", action="store", default=None)
             self.argUpdate.add_argument("--token", help="specific the token, only use if set --no-default-token",
-                                        action="store", default=None, dest="token", metavar="token",
-                                        required='--no-default-token' in sys.argv)
+                                        action="store", default=None, dest="token", metavar="token")
             self.argUpdate.add_argument("--no-virtualenv", help="no use virtualenv", action="store_true",
                                         default=None, dest="noVirtualenv")
             self.argUpdate.add_argument("--no-default-token", help="set for use the default token",
                                         default=None, action="store_true", dest="noDefaultToken")
-            self.argUpdate.add_argument("--log-file", help="create log file in /tmp/zendesk_{date}.log",
+            self.argUpdate.add_argument("--log-file", help="write the log in JSON lines in /tmp/zendesk_<date>.log, rotated by size",
                                         default=None, action="store_true", dest="logFile")
+            self._connectionArguments(self.argUpdate)
+            self._metricsArguments(self.argUpdate)
+            self._cacheArguments(self.argUpdate)
+            self._macroArguments(self.argUpdate)
+            self._requesterArguments(self.argUpdate)
+            self._spoolArguments(self.argUpdate)
 
         except Exception as er:
             print("{} - {}".format(self.__class__.__name__, er))
@@ -164,19 +547,26 @@ class Usage:
     def _searchArguments(self):
         try:
             self.argSearch = self.action.add_parser('search')
-            self.argSearch.add_argument('-t', dest='ticketID', help='ID of the ticket', metavar="ticketID",
-                                        required='-j' not in sys.argv, action="store", default=None)
-            self.argSearch.add_argument('-j', dest='jobID', help='ID of the job', metavar="jobID",
-                                        required='-t' not in sys.argv, action="store", default=None)
+            self.argSearch.add_argument('-t', dest='ticketID', help='ID of the ticket, or IDs separated by comma', metavar="ticketID",
+                                        action="store", default=None)
+            self.argSearch.add_argument('-j', dest='jobID', help='ID of the job, or IDs separated by comma', metavar="jobID",
+                                        action="store", default=None)
+            self.argSearch.add_argument('--query', dest='query', help='search query of the tickets, e.g. "status:open tags:foo"',
+                                        metavar="query", action="store", default=None)
+            self.argSearch.add_argument('--page-size', dest='pageSize', help='tickets per page of the query, maximum 1000',
+                                        metavar="pageSize", type=int, action="store", default=100)
             self.argSearch.add_argument("--token", help="specific the token, only use if set --no-default-token",
-                                        action="store", default=None, dest="token", metavar="token",
-                                        required='--no-default-token' in sys.argv)
+                                        action="store", default=None, dest="token", metavar="token")
             self.argSearch.add_argument("--no-virtualenv", help="no use virtualenv", action="store_true",
                                         default=None, dest="noVirtualenv")
             self.argSearch.add_argument("--no-default-token", help="set for use the default token",
                                         default=None, action="store_true", dest="noDefaultToken")
-            self.argSearch.add_argument("--log-file", help="create log file in /tmp/zendesk_{date}.log",
+            self.argSearch.add_argument("--log-file", help="write the log in JSON lines in /tmp/zendesk_<date>.log, rotated by size",
                                         default=None, action="store_true", dest="logFile")
+            self._connectionArguments(self.argSearch)
+            self._metricsArguments(self.argSearch)
+            self._cacheArguments(self.argSearch)
+            self._jobArguments(self.argSearch)
 
         except Exception as er:
             print("{} - {}".format(self.__class__.__name__, er))
@@ -191,6 +581,10 @@ class Usage:
                                         metavar="subject", action="store", default=None)
             self.argCreate.add_argument('--get-id', dest='get_id', help='wait return ticket id',
                                         action="store_true", default=False)
+            self.argCreate.add_argument('--from-file', dest='fromFile', help='JSONL or CSV file with one ticket per line',
+                                        metavar="path_file", action="store", default=None)
+            self.argCreate.add_argument('--batch-size', dest='batchSize', help='tickets per bulk job, maximum 100',
+                                        metavar="batchSize", type=int, default=100)
             self.argCreate.add_argument('--tags', dest='tags', help='tags of the ticket',
                                         metavar="tags", action="store", default=None)
             self.argCreate.add_argument('--status', dest='status', help='status of the ticket',
@@ -225,301 +619,3429 @@ class Usage:
                                         help='use a internal macro to comment in ticket',
                                         metavar="internalMacroID", action="store", default=None)
             self.argCreate.add_argument("--token", help="specific the token, only use if set --no-default-token",
-                                        action="store", default=None, dest="token", metavar="token",
-                                        required='--no-default-token' in sys.argv)
+                                        action="store", default=None, dest="token", metavar="token")
             self.argCreate.add_argument("--no-virtualenv", help="no use virtualenv", action="store_true",
                                         default=None, dest="noVirtualenv")
             self.argCreate.add_argument("--no-default-token", help="set for use the default token",
                                         default=None, action="store_true", dest="noDefaultToken")
-            self.argCreate.add_argument("--log-file", help="create log file in /tmp/zendesk_{date}.log",
+            self.argCreate.add_argument("--log-file", help="write the log in JSON lines in /tmp/zendesk_<date>.log, rotated by size",
                                         default=None, action="store_true", dest="logFile")
+            self._connectionArguments(self.argCreate)
+            self._metricsArguments(self.argCreate)
+            self._jobArguments(self.argCreate)
+            self._requesterArguments(self.argCreate)
+            self._spoolArguments(self.argCreate)
 
         except Exception as er:
             print("{} - {}".format(self.__class__.__name__, er))
             exit(1)
 
-class ModuleLog:
+class JSONFormatter(logging.Formatter):
 
-	def __init__(self):
-		"""
-		Define values for create log instance
-		"""
-		try:
-			#configuration logging
-			self.logFormat = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-			self.logFile = "/tmp/zendesk_{}.log".format(str((datetime.now().date())))
-			self.logLevel = logging.INFO
-			#configuration log
-			self.log = logging.getLogger(__name__)
-			self.log.setLevel(self.logLevel)
-			with closing(logging.FileHandler(self.logFile)) as self.logHandler:
-				self.logHandler.setLevel(self.logLevel)
-				self.logFormatter = logging.Formatter(self.logFormat)
-				self.logHandler.setFormatter(self.logFormatter)
-				self.log.addHandler(self.logHandler)
-
-		except Exception as er:
-			print("{} - {}".format(self.__class__.__name__, er))
+    #fields added to the records with extra
+    fields = ("action", "ticket_id", "payload_id", "duration")
 
-class Zendesk:
+    def format(self, record):
+        content = {
+            "time": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for item in self.fields:
+            if getattr(record, item, None) is not None:
+                content[item] = getattr(record, item)
+        if record.exc_info:
+            content["exception"] = self.formatException(record.exc_info)
+        return json.dumps(content, default=str)
 
-    def __init__(self):
-        self._log = None
-        self._token = "XXXXX"
-        self._subdomain = "example"
-        self._email = "apizendesk@example.com"
-        #fields for comments in ticket
-        self._comment = Comment
-        self._comment.public = None
-        self._comment.body = None
-        self._comment.uploads = None
-        #fields for create a ticket
-        self._dictValues = dict()
-        self._listValues = list()
-        #fields of the application
-        self._dictInternal = dict()
-        self._listInternal = list()
-        #objects
-        self._updateObject = None
-        self._searchObject = None
-        self._createObject = None
-        #LF and CRLF
-        self._crlf = b'\r\n'
-        self._lf = b'\n'
+class RotatingLogHandler(logging.handlers.RotatingFileHandler):
 
-    #return object with connection of the zendesk
-    @property
-    def connectZendesk(self):
+    def __init__(self, logPattern, maxBytes, backupCount):
+        """
+        File handler of the file of the day, {} of logPattern is the date and the file of the new day is used
+        after midnight. The file is rotated when it has more than maxBytes, the rotated files have the time of
+        the rotation in the name and only the last backupCount files are kept. The processes that write the
+        same file rotate it under the lock of the .lock file, the file rotated by other process is opened again
         """
+        self.logPattern = logPattern
+        self.lockFile = os.path.abspath(re.sub(r"_?\{\}", "", logPattern) + ".lock")
+        self.lockOpen = None
+        super().__init__(self.dayFile(), maxBytes=maxBytes, backupCount=backupCount, encoding="utf-8", delay=True)
+
+    def dayFile(self):
+        return os.path.abspath(self.logPattern.format(datetime.now().date()))
+
+    def isRotated(self):
+        """
+        Check if the open file was rotated or removed by other process
 
         :return:
         """
         try:
-            self._credentials = {
-                "email" : self._email,
-                "token" : self._token,
-                "subdomain" : self._subdomain
-            }
-            return Zenpy(**self._credentials)
-
-        except Exception as er:
-            if self._log is not None:
-                self._log.error("{} - {}".format(self.__class__.__name__, er))
-            else:
-                print("{} - {}".format(self.__class__.__name__, er))
-            return False
+            return os.stat(self.baseFilename).st_ino != os.fstat(self.stream.fileno()).st_ino
+        except FileNotFoundError:
+            return True
 
-    def executeAction(self):
+    def emit(self, record):
         try:
-            if self._dictInternal["noDefaultToken"] is True and self._dictInternal["token"] is not None:
-                self._token = self._dictInternal["token"]
-            if self._dictInternal["action"] == "create":
-                self.resultCreate = self.createTicket()
-                if self._dictInternal['getID'] is True:
-                    print(self.jobStatus(self.resultCreate.id))
-                else:
-                    print(self.resultCreate.id)
+            if self.lockOpen is None:
+                self.lockOpen = open(self.lockFile, "a")
+            fcntl.flock(self.lockOpen, fcntl.LOCK_EX)
+        except Exception:
+            self.handleError(record)
+            return
+        try:
+            if self.stream is not None and (self.baseFilename != self.dayFile() or self.isRotated()):
+                self.stream.close()
+                self.stream = None
+            self.baseFilename = self.dayFile()
+            super().emit(record)
+        finally:
+            fcntl.flock(self.lockOpen, fcntl.LOCK_UN)
 
-            elif self._dictInternal["action"] == "update":
-                self._updateObject = self.searchID()
-                for self.item in self._listValues:
-                    if self._dictValues[self.item] is not None and self._dictValues[self.item] is not False:
-                        if self._dictInternal["noKeepTags"] is not True and self.item == "tags":
-                            self._updateObject.tags.append(self._dictValues["tags"])
-                        elif self.item == "requester" and self._dictValues[self.item] is not None:
-                            self._updateObject.requester = User(name=self._dictValues[self.item].split("@")[0], email=self._dictValues[self.item])
-                        elif self.item == "comment" and self._dictValues[self.item] is not None:
-                            self.commentTicket()
-                        elif self.item == "macro_ids" and self._dictValues[self.item] is not None:
-                            self.updateTicket(self.macroID().ticket)
-                        else:
-                            print(self.item)
-                            setattr(self._updateObject, self.item, self._dictValues[self.item])
-                self.updateTicket(self._updateObject)
-            elif self._dictInternal["action"] == "search":
-                if self._dictInternal["ticketID"] is not None:
-                    self._searchObject = self.searchID()
-                    print(self._searchObject.to_dict())
-                elif self._dictInternal["jobID"] is not None:
-                    print(self.jobStatus(self._dictInternal["jobID"]))
+    def shouldRollover(self, record):
+        if self.maxBytes > 0:
+            if self.stream is None:
+                self.stream = self._open()
+            # the other processes append to the file, the record is not formatted again and the file can pass
+            # maxBytes by the last record
+            return self.stream.seek(0, os.SEEK_END) >= self.maxBytes
+        return False
+
+    def doRollover(self):
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+        if os.path.exists(self.baseFilename):
+            self.rotate(self.baseFilename, "{}.{}".format(self.baseFilename, datetime.now().strftime("%Y-%m-%d_%H-%M-%S-%f")))
+        if self.backupCount > 0:
+            for rotatedFile in sorted(glob.glob(glob.escape(self.baseFilename) + ".[0-9]*"))[:-self.backupCount]:
+                os.remove(rotatedFile)
+
+    def close(self):
+        super().close()
+        if self.lockOpen is not None:
+            self.lockOpen.close()
+            self.lockOpen = None
+
+class ModuleLog:
+
+    def __init__(self, logPattern="/tmp/zendesk_{}.log", maxBytes=10 * 1024 * 1024, backupCount=7):
+        """
+        Define values for create log instance, the records are JSON lines sent to a queue and written in the
+        file of the day by a thread, so the writes do not block the actions, the file is rotated by size
+        """
+        try:
+            #configuration logging
+            self.logPattern = logPattern
+            self.logFile = logPattern.format(datetime.now().date())
+            self.logLevel = logging.INFO
+            self.logQueue = queue.Queue(-1)
+            self.logStarted = False
+            #configuration log
+            self.log = logging.getLogger(__name__)
+            self.log.setLevel(self.logLevel)
+            self.log.propagate = False
+            self.logHandler = RotatingLogHandler(self.logPattern, maxBytes, backupCount)
+            self.logHandler.setLevel(self.logLevel)
+            self.logHandler.setFormatter(JSONFormatter())
+            self.logListener = logging.handlers.QueueListener(self.logQueue, self.logHandler, respect_handler_level=True)
+            self.logListener.start()
+            self.logStarted = True
+            self.log.addHandler(logging.handlers.QueueHandler(self.logQueue))
+            # write the records of the queue at the exit, also after exit(1)
+            atexit.register(self.close)
 
         except Exception as er:
-            if self._log is not None:
-                self._log.error("{} - {}".format(self.__class__.__name__, er))
-            else:
-                print("{} - {}".format(self.__class__.__name__, er))
-            return False
+            print("{} - {}".format(self.__class__.__name__, er))
 
-    # create a ticket, necessary define the subject and description
-    def createTicket(self):
+    def close(self):
         """
+        Write the records of the queue and close the file
 
         :return:
         """
-        try:
-            if self._dictValues["subject"]is not None and self._dictValues["description"] is not None:
-                print("Ok")
-                if self._dictValues['requester'] is not None:
-                    self.createTicketObject = self.connectZendesk.tickets.create(
-                        [Ticket(subject=self._dictValues["subject"], description=self._dictValues["description"],
-                                assignee_id=self._dictValues["assignee_id"], group_id=self._dictValues["group_id"],
-                                organization_id=self._dictValues["organization_id"],
-                                priority=self._dictValues["priority"],
-                                problem_id=self._dictValues["problem_id"], status=self._dictValues["status"],
-                                tags=self._dictValues["tags"],
-                                requester=User(name=self._dictValues['requester'].split("@")[0], email=self._dictValues['requester']),
-                                submitter_id=self._dictValues["submitter_id"],
-                                ticket_form_id=self._dictValues["ticket_form_id"],
-                                assignee_email=self._dictValues["assignee_email"],
-                                collaborator_ids=self._dictValues["collaborator_ids"])])
-                else:
-                    self.createTicketObject = self.connectZendesk.tickets.create(
-                        [Ticket(subject=self._dictValues["subject"], description=self._dictValues["description"],
-                                assignee_id=self._dictValues["assignee_id"], group_id=self._dictValues["group_id"],
-                                organization_id=self._dictValues["organization_id"], priority=self._dictValues["priority"],
-                                problem_id=self._dictValues["problem_id"], status=self._dictValues["status"], tags=self._dictValues["tags"],
-                                requester_id=self._dictValues["requester_id"],
-                                submitter_id=self._dictValues["submitter_id"], ticket_form_id=self._dictValues["ticket_form_id"],
-                                assignee_email=self._dictValues["assignee_email"],
-                                collaborator_ids=self._dictValues["collaborator_ids"])])
-                return self.createTicketObject
-            else:
-                self._log.error("{} - {}".format(self.__class__.__name__, "Object description or subject empty"))
-                return False
+        if self.logStarted:
+            self.logStarted = False
+            self.logListener.stop()
+            self.logHandler.close()
 
-        except Exception as er:
-            if self._log is not None:
-                self._log.error("{} - {}".format(self.__class__.__name__, er))
-            else:
-                print("{} - {}".format(self.__class__.__name__, er))
-            return False
+class ActionLog:
 
-    #update a ticket
-    def jobStatus(self, resultJobID):
-        try:
-            self.countStatus = 0
-            self.resultJobID = resultJobID
-            while self.countStatus <= 10:
-                time.sleep(5)
-                self.resultJobStatus = self.connectZendesk.job_status(id=self.resultJobID)
-                if self.resultJobStatus.status == "completed":
-                    return self.resultJobStatus.results[0].id
-                self.countStatus += 1
+    def __init__(self, log=None, extra=None):
+        """
+        Collect the errors of one action, the messages are also sent to the log with the fields of the action
+        in extra, the fields of a message have priority
+        """
+        self.log = log
+        self.extra = extra or dict()
+        self.errors = list()
 
-        except Exception as er:
-            if self._log is not None:
-                self._log.error("{} - {}".format(self.__class__.__name__, er))
-            else:
-                print("{} - {}".format(self.__class__.__name__, er))
-            return False
+    def error(self, message, *args, **kwargs):
+        self.errors.append(message % args if args else message)
+        if self.log is not None:
+            self.log.error(message, *args, **self.fields(kwargs))
 
-    #update a ticket
-    def updateTicket(self, updateObject):
+    def warning(self, message, *args, **kwargs):
+        if self.log is not None:
+            self.log.warning(message, *args, **self.fields(kwargs))
+
+    def info(self, message, *args, **kwargs):
+        if self.log is not None:
+            self.log.info(message, *args, **self.fields(kwargs))
+
+    def fields(self, kwargs):
+        kwargs["extra"] = dict(self.extra, **(kwargs.get("extra") or dict()))
+        return kwargs
+
+class RequestScheduler:
+
+    def __init__(self, requestsPerMinute, stateFile, bulkReserve=0.2):
         """
+        Token bucket of the requests per minute, the state is in a file locked with flock so the processes
+        of the same account share the limit. The bulk requests leave a reserve of the bucket to the
+        interactive requests, the 429 and X-Rate-Limit-Remaining of the responses update the bucket
+        """
+        self.requestsPerMinute = float(requestsPerMinute)
+        self.stateFile = stateFile
+        self.bulkReserve = self.requestsPerMinute * bulkReserve
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def priority(self):
+        return getattr(self.local, "priority", "interactive")
+
+    @contextmanager
+    def bulk(self):
+        """
+        The requests of the thread inside the context are bulk requests
 
-        :param updateObject:
         :return:
         """
+        previous = self.priority()
+        self.local.priority = "bulk"
         try:
-            self.updateObject = updateObject
-            return self.connectZendesk.tickets.update(self.updateObject)
+            yield self
+        finally:
+            self.local.priority = previous
 
-        except Exception as er:
-            if self._log is not None:
-                self._log.error("{} - {}".format(self.__class__.__name__, er))
-            else:
-                print("{} - {}".format(self.__class__.__name__, er))
-            return False
+    @contextmanager
+    def _state(self):
+        with self.lock:
+            stateFileOpen = os.open(self.stateFile, os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                fcntl.flock(stateFileOpen, fcntl.LOCK_EX)
+                content = os.read(stateFileOpen, 4096)
+                try:
+                    state = json.loads(content)
+                except ValueError:
+                    state = {"tokens": self.requestsPerMinute, "updated": time.time(), "blockedUntil": 0}
+                # refill the bucket with the time since the last update
+                now = time.time()
+                state["tokens"] = min(self.requestsPerMinute,
+                                      state["tokens"] + (now - state["updated"]) * self.requestsPerMinute / 60)
+                state["updated"] = now
+                yield state
+                os.lseek(stateFileOpen, 0, os.SEEK_SET)
+                os.ftruncate(stateFileOpen, 0)
+                os.write(stateFileOpen, json.dumps(state).encode())
+            finally:
+                os.close(stateFileOpen)
 
-    #id search
-    def searchID(self):
-        try:
-            return self.connectZendesk.tickets(id=self._dictInternal['ticketID'])
+    def tryAcquire(self, priority=None):
+        """
+        Take a token of the bucket for one request when there is one, without wait
 
-        except Exception as er:
-            if self._log is not None:
-                self._log.error("{} - {}".format(self.__class__.__name__, er))
+        :param priority: default the priority of the thread
+        :return: 0 when the token was taken, else the seconds to wait before try again
+        """
+        needed = 1 + (self.bulkReserve if (priority or self.priority()) == "bulk" else 0)
+        with self._state() as state:
+            if state["blockedUntil"] > state["updated"]:
+                wait = state["blockedUntil"] - state["updated"]
+            elif state["tokens"] >= needed:
+                state["tokens"] -= 1
+                return 0
             else:
-                print("{} - {}".format(self.__class__.__name__, er))
-            return False
+                wait = (needed - state["tokens"]) * 60 / self.requestsPerMinute
+        # wait at most 1 second to see the tokens released by other processes
+        return min(wait, 1.0)
 
-    #id search
-    def macroID(self):
-        try:
-            return self.connectZendesk.tickets.show_macro_effect(self._updateObject, self._dictValues['macro_ids'])
+    def acquire(self, priority=None):
+        """
+        Wait a token of the bucket for one request
 
-        except Exception as er:
-            if self._log is not None:
-                self._log.error("{} - {}".format(self.__class__.__name__, er))
-            else:
-                print("{} - {}".format(self.__class__.__name__, er))
-            return False
+        :param priority: default the priority of the thread
+        :return: seconds waited
+        """
+        waited = 0.0
+        wait = self.tryAcquire(priority)
+        while wait > 0:
+            time.sleep(wait)
+            waited += wait
+            wait = self.tryAcquire(priority)
+        return waited
 
-    def commentTicket(self):
+    @staticmethod
+    def retryAfter(statusCode, headers):
         """
+        Return the seconds to wait before retry when the response is 429, else None
 
+        :param statusCode:
+        :param headers:
         :return:
         """
+        if statusCode != 429:
+            return None
         try:
-            self._comment.body = self._dictValues['comment']
-            if self._comment.uploads is not None:
-                self._updateObject.comment = Comment(body=self._comment.body, public=self._comment.public, uploads=[self.uploadFile(self._comment.uploads).token])
-            else:
-                self._updateObject.comment = Comment(body=self._comment.body, public=self._comment.public)
+            return max(float(headers.get("Retry-After", 60)), 0)
+        except ValueError:
+            return 60.0
 
-        except Exception as er:
-            if self._log is not None:
-                self._log.error("{} - {}".format(self.__class__.__name__, er))
-            else:
-                print("{} - {}".format(self.__class__.__name__, er))
-            return False
+    def observe(self, statusCode, headers):
+        """
+        Update the bucket with the rate limit headers of the response
 
-    def uploadFile(self, uploadFile):
+        :param statusCode:
+        :param headers:
+        :return: seconds to wait before retry when the response is 429, else None
         """
+        remaining = headers.get("X-Rate-Limit-Remaining")
+        retryAfter = self.retryAfter(statusCode, headers)
+        if remaining is None and retryAfter is None:
+            return None
+        with self._state() as state:
+            if remaining is not None:
+                try:
+                    state["tokens"] = min(state["tokens"], float(remaining))
+                except ValueError:
+                    pass
+            if retryAfter is not None:
+                state["tokens"] = 0
+                state["blockedUntil"] = max(state["blockedUntil"], state["updated"] + retryAfter)
+        return retryAfter
 
-        :param uploadFile:
-        :return:
+class CallMetrics:
+
+    def __init__(self, started=None):
         """
-        try:
-            self.uploadFile = uploadFile
-            self.convertLFtoCRLF(self.uploadFile)
-            return self.connectZendesk.attachments.upload(self.uploadFile)
+        Count and time the API calls of the process by method, endpoint and status code, with the bytes
+        sent and received and the retries of the 429 responses, the wall time is counted from started
+        """
+        self.lock = threading.Lock()
+        self.started = started if started is not None else time.perf_counter()
+        self.calls = dict()
+        self.phases = dict()
+        self.lastWrite = 0
 
-        except Exception as er:
-            if self._log is not None:
-                self._log.error("{} - {}".format(self.__class__.__name__, er))
-            else:
-                print("{} - {}".format(self.__class__.__name__, er))
-            return False
+    def endpoint(self, url):
+        """
+        Return the path of the URL without /api/v2 and with the IDs replaced by :id
 
-    def convertLFtoCRLF(self, convertFile):
-        try:
-            self.convertFile = convertFile
-            # open file
-            with open(self.convertFile, 'rb') as convertFileOpen:
-                self.convertContent = convertFileOpen.read()
-            # convert LF to CRLF
-            self.convertContent = self.convertContent.replace(self._lf, self._crlf)
-            # save file
-            with open(self.convertFile, 'wb') as convertFileOpen:
-                convertFileOpen.write(self.convertContent)
+        :param url:
+        :return:
+        """
+        path = re.sub(r"^/api/v2", "", urlparse(url).path)
+        path = re.sub(r"/job_statuses/(?!show_many)[^/.]+", "/job_statuses/:id", path)
+        return re.sub(r"/\d+(?=[/.]|$)", "/:id", path)
 
-        except Exception as er:
+    def record(self, method, url, status, seconds, sent=0, received=0):
+        """
+        Add one call, status is the status code of the response or error when the request failed
+
+        :return:
+        """
+        key = (method, self.endpoint(url), str(status))
+        with self.lock:
+            call = self.calls.setdefault(key, {"count": 0, "seconds": 0.0, "bytes_sent": 0, "bytes_received": 0, "retries": 0})
+            call["count"] += 1
+            call["seconds"] += seconds
+            call["bytes_sent"] += sent or 0
+            call["bytes_received"] += received or 0
+
+    def retry(self, method, url, status):
+        key = (method, self.endpoint(url), str(status))
+        with self.lock:
+            self.calls.setdefault(key, {"count": 0, "seconds": 0.0, "bytes_sent": 0, "bytes_received": 0, "retries": 0})["retries"] += 1
+
+    def summary(self):
+        """
+        Return the totals and the calls of each endpoint, the network seconds are the sum of the calls
+        and are greater than the wall seconds when the calls are at the same time
+
+        :return:
+        """
+        with self.lock:
+            endpoints = [dict(call, method=method, endpoint=endpoint, status=status, seconds=round(call["seconds"], 4))
+                         for (method, endpoint, status), call in sorted(self.calls.items())]
+        summary = {"wall_seconds": round(time.perf_counter() - self.started, 4)}
+        summary.update(self.phases)
+        summary.update({"calls": sum(call["count"] for call in endpoints),
+                        "retries": sum(call["retries"] for call in endpoints),
+                        "network_seconds": round(sum(call["seconds"] for call in endpoints), 4),
+                        "bytes_sent": sum(call["bytes_sent"] for call in endpoints),
+                        "bytes_received": sum(call["bytes_received"] for call in endpoints),
+                        "endpoints": endpoints})
+        return summary
+
+    def prometheus(self):
+        """
+        Return the metrics in the text format of Prometheus, for the textfile collector of the node exporter
+
+        :return:
+        """
+        summary = self.summary()
+        lines = list()
+        for name, item, kind, description in (
+                ("zendesk_api_calls_total", "count", "counter", "API calls by method, endpoint and status"),
+                ("zendesk_api_call_seconds_total", "seconds", "counter", "seconds of the API calls"),
+                ("zendesk_api_bytes_sent_total", "bytes_sent", "counter", "bytes sent in the API calls"),
+                ("zendesk_api_bytes_received_total", "bytes_received", "counter", "bytes received in the API calls"),
+                ("zendesk_api_retries_total", "retries", "counter", "API calls retried after a 429")):
+            lines.append("# HELP {} {}".format(name, description))
+            lines.append("# TYPE {} {}".format(name, kind))
+            for call in summary["endpoints"]:
+                lines.append('{}{{method="{}",endpoint="{}",status="{}"}} {}'.format(
+                    name, call["method"], call["endpoint"].replace('"', '\\"'), call["status"], call[item]))
+        for item in [item for item in summary if item.endswith("_seconds") and item != "network_seconds"]:
+            lines.append("# TYPE zendesk_{} gauge".format(item))
+            lines.append("zendesk_{} {}".format(item, summary[item]))
+        return "\n".join(lines) + "\n"
+
+    def write(self, metricsFile, interval=0):
+        """
+        Write the metrics in the file, Prometheus textfile if the extension is .prom, else JSON, the file is
+        replaced at once so the readers never see a partial file
+
+        :param metricsFile:
+        :param interval: seconds since the last write to write again, 0 always write
+        :return:
+        """
+        if interval and time.monotonic() - self.lastWrite < interval:
+            return
+        self.lastWrite = time.monotonic()
+        content = self.prometheus() if metricsFile.endswith(".prom") else json.dumps(self.summary(), indent=2)
+        with open(metricsFile + ".tmp", "w") as metricsFileOpen:
+            metricsFileOpen.write(content)
+        os.replace(metricsFile + ".tmp", metricsFile)
+
+class MeteredAdapter:
+
+    def __init__(self, metrics, **kwargs):
+        """
+        Adapter of the session that records each request in the metrics, the requests are sent by
+        a HTTPAdapter with the pool of connections
+        """
+        self.metrics = metrics
+        self.adapter = requests.adapters.HTTPAdapter(**kwargs)
+
+    def send(self, request, **kwargs):
+        sent = [0]
+        # the upload body is read again in each send, the retries send the whole content
+        if isinstance(request.body, UploadBody):
+            request.body.seek(0)
+        if request.headers.get("Content-Length") is not None:
+            sent[0] = int(request.headers["Content-Length"])
+        elif isinstance(request.body, (bytes, str)):
+            sent[0] = len(request.body.encode("utf-8") if isinstance(request.body, str) else request.body)
+        elif request.body is not None:
+            request.body = self.countChunks(request.body, sent)
+        start = time.perf_counter()
+        try:
+            response = self.adapter.send(request, **kwargs)
+            # the session reads the content when it is not a stream, read here to time it
+            received = len(response.content) if not kwargs.get("stream") else int(response.headers.get("Content-Length") or 0)
+        except Exception:
+            self.metrics.record(request.method, request.url, "error", time.perf_counter() - start, sent[0])
+            raise
+        self.metrics.record(request.method, request.url, response.status_code, time.perf_counter() - start, sent[0], received)
+        if self.isRetried(response):
+            self.metrics.retry(request.method, request.url, response.status_code)
+        return response
+
+    def isRetried(self, response):
+        """
+        Check if the response is sent again by zenpy, it retries the 429 responses with a Retry-After
+
+        :param response:
+        :return:
+        """
+        try:
+            return response.status_code == 429 and int(response.headers.get("Retry-After", 0)) > 0
+        except ValueError:
+            return False
+
+    def countChunks(self, chunks, sent):
+        for chunk in chunks:
+            sent[0] += len(chunk)
+            yield chunk
+
+    def close(self):
+        self.adapter.close()
+
+class ScheduledAdapter(MeteredAdapter):
+
+    def __init__(self, scheduler, metrics, maxRetries=5, **kwargs):
+        """
+        Adapter that sends all requests of the session through the scheduler, the 429 responses are
+        retried after the Retry-After
+        """
+        self.scheduler = scheduler
+        self.maxRetries = maxRetries
+        super().__init__(metrics, **kwargs)
+
+    def send(self, request, **kwargs):
+        attempt = 0
+        while True:
+            self.scheduler.acquire()
+            response = super().send(request, **kwargs)
+            retryAfter = self.scheduler.observe(response.status_code, response.headers)
+            # a body of a generator can not be sent again, the 429 returned can be retried by zenpy
+            if retryAfter is None or attempt >= self.maxRetries or not isinstance(request.body, (bytes, str, UploadBody, type(None))):
+                if super().isRetried(response):
+                    self.metrics.retry(request.method, request.url, response.status_code)
+                return response
+            self.metrics.retry(request.method, request.url, response.status_code)
+            response.close()
+            attempt += 1
+
+    def isRetried(self, response):
+        # the retries are counted in the send, they depend on the scheduler
+        return False
+
+class UploadBody:
+
+    #LF without CR before
+    convertLF = re.compile(b'(?<!\r)\n')
+
+    def __init__(self, uploadFile, convert=True, chunkSize=65536):
+        """
+        Body of an upload that reads the file in chunks, with LF converted to CRLF if convert, the existing CRLF
+        are kept also when the CR and the LF are in different chunks and the file in the disk is not changed.
+        The length is counted before the upload and the body is rewound before each send, so a retry of the
+        request sends the whole content, sent has the bytes read after the last rewind
+        """
+        self.uploadFile = uploadFile
+        self.name = os.path.basename(uploadFile)
+        self.convert = convert
+        self.chunkSize = chunkSize
+        # open here to raise the errors of the file before the upload starts
+        self.fileOpen = open(uploadFile, "rb")
+        self.seek(0)
+        self.length = os.path.getsize(uploadFile)
+        if self.convert is True:
+            self.length = sum(len(chunk) for chunk in self)
+            self.seek(0)
+
+    def seek(self, offset, whence=0):
+        """
+        Rewind the body, only the offset 0 is supported
+
+        :return:
+        """
+        if offset != 0 or whence != 0:
+            raise io.UnsupportedOperation("the upload body can only be rewound")
+        self.fileOpen.seek(0)
+        self.buffer = b""
+        self.previousCR = False
+        self.sent = 0
+        return 0
+
+    def read(self, size=-1):
+        while size is None or size < 0 or len(self.buffer) < size:
+            chunk = self.fileOpen.read(self.chunkSize)
+            if not chunk:
+                break
+            if self.convert is True:
+                converted = self.convertLF.sub(b"\r\n", chunk)
+                # the LF of a CRLF split between the chunks was converted, remove the CR added
+                if self.previousCR and chunk.startswith(b"\n"):
+                    converted = converted[1:]
+                self.previousCR = chunk.endswith(b"\r")
+                chunk = converted
+            self.buffer += chunk
+        if size is None or size < 0:
+            size = len(self.buffer)
+        content, self.buffer = self.buffer[:size], self.buffer[size:]
+        self.sent += len(content)
+        return content
+
+    def __iter__(self):
+        while True:
+            chunk = self.read(self.chunkSize)
+            if not chunk:
+                break
+            yield chunk
+
+    def __len__(self):
+        return self.length
+
+    def close(self):
+        self.fileOpen.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+class TicketCache:
+
+    def __init__(self, cacheFile, ttl, maxSize):
+        """
+        Cache of the tickets in a SQLite file, a ticket is fresh for ttl seconds after fetched and the least
+        recently used tickets are removed when the cache has more than maxSize tickets
+        """
+        self.cacheFile = cacheFile
+        self.ttl = ttl
+        self.maxSize = maxSize
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(self.cacheFile, timeout=10, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute("CREATE TABLE IF NOT EXISTS tickets (id INTEGER PRIMARY KEY, data TEXT NOT NULL, "
+                                    "updated_at TEXT, fetched_at REAL NOT NULL, accessed_at REAL NOT NULL)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS tickets_accessed_at ON tickets (accessed_at)")
+
+    def getMany(self, ticketIDs):
+        """
+        Return the cached tickets
+
+        :param ticketIDs:
+        :return: dict with ID and a tuple (ticket dict, fresh)
+        """
+        ticketIDs = [int(ticketID) for ticketID in ticketIDs]
+        now = time.time()
+        tickets = dict()
+        with self.lock, self.connection:
+            for index in range(0, len(ticketIDs), 500):
+                chunk = ticketIDs[index:index + 500]
+                rows = self.connection.execute("SELECT id, data, fetched_at FROM tickets WHERE id IN ({})".format(
+                    ",".join("?" * len(chunk))), chunk).fetchall()
+                for ticketID, data, fetchedAt in rows:
+                    tickets[ticketID] = (json.loads(data), now - fetchedAt < self.ttl)
+                self.connection.executemany("UPDATE tickets SET accessed_at = ? WHERE id = ?",
+                                            [(now, ticketID) for ticketID in tickets if ticketID in chunk])
+        return tickets
+
+    def get(self, ticketID):
+        return self.getMany([ticketID]).get(int(ticketID))
+
+    def putMany(self, tickets):
+        """
+        Save the ticket dicts, the entries are fresh again
+
+        :param tickets:
+        :return:
+        """
+        now = time.time()
+        with self.lock, self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO tickets (id, data, updated_at, fetched_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                [(ticket["id"], json.dumps(ticket), ticket.get("updated_at"), now, now) for ticket in tickets])
+            count = self.connection.execute("SELECT COUNT(*) FROM tickets").fetchone()[0]
+            if count > self.maxSize:
+                self.connection.execute("DELETE FROM tickets WHERE id IN (SELECT id FROM tickets "
+                                        "ORDER BY accessed_at LIMIT ?)", (count - self.maxSize,))
+
+    def put(self, ticket):
+        self.putMany([ticket])
+
+    def invalidate(self, ticketIDs):
+        ticketIDs = [int(ticketID) for ticketID in ticketIDs]
+        with self.lock, self.connection:
+            self.connection.executemany("DELETE FROM tickets WHERE id = ?", [(ticketID,) for ticketID in ticketIDs])
+
+class MacroCache:
+
+    def __init__(self, cacheFile, ttl):
+        """
+        Cache of the macro definitions in a SQLite file, a macro is fresh for ttl seconds after fetched
+        """
+        self.cacheFile = cacheFile
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(self.cacheFile, timeout=10, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute("CREATE TABLE IF NOT EXISTS macros (id INTEGER PRIMARY KEY, data TEXT NOT NULL, "
+                                    "fetched_at REAL NOT NULL)")
+
+    def get(self, macroID):
+        """
+        Return the dict of the macro, None if it is not cached or it is not fresh
+
+        :param macroID:
+        :return:
+        """
+        with self.lock, self.connection:
+            row = self.connection.execute("SELECT data, fetched_at FROM macros WHERE id = ?", (int(macroID),)).fetchone()
+        if row is None or time.time() - row[1] >= self.ttl:
+            return None
+        return json.loads(row[0])
+
+    def put(self, macro):
+        with self.lock, self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO macros (id, data, fetched_at) VALUES (?, ?, ?)",
+                                    (int(macro["id"]), json.dumps(macro), time.time()))
+
+class RequesterIndex:
+
+    def __init__(self, indexFile):
+        """
+        Index of the user IDs of the requesters by e-mail in a SQLite file, the e-mails are in lower case
+        """
+        self.indexFile = indexFile
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(self.indexFile, timeout=10, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute("CREATE TABLE IF NOT EXISTS users (email TEXT PRIMARY KEY, id INTEGER NOT NULL, "
+                                    "updated_at REAL NOT NULL)")
+
+    def getMany(self, emails):
+        """
+        Return the user IDs of the e-mails in the index
+
+        :param emails:
+        :return: dict with e-mail and user ID
+        """
+        emails = [email.lower() for email in emails]
+        users = dict()
+        with self.lock, self.connection:
+            for index in range(0, len(emails), 500):
+                chunk = emails[index:index + 500]
+                users.update(self.connection.execute("SELECT email, id FROM users WHERE email IN ({})".format(
+                    ",".join("?" * len(chunk))), chunk).fetchall())
+        return users
+
+    def get(self, email):
+        return self.getMany([email]).get(email.lower())
+
+    def putMany(self, users):
+        """
+        Save the user IDs, users is a dict with e-mail and user ID
+
+        :param users:
+        :return:
+        """
+        now = time.time()
+        with self.lock, self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO users (email, id, updated_at) VALUES (?, ?, ?)",
+                                        [(email.lower(), userID, now) for email, userID in users.items()])
+
+class ActionSpool:
+
+    def __init__(self, spoolFile):
+        """
+        Append-only queue of the actions in a JSON lines file, the producers append with a lock of the file,
+        the flush moves the file to a segment before read it, the line of the last action done of a segment is
+        saved in the .offset, a segment of a flush interrupted is read again from the offset in the next flush
+        """
+        self.spoolFile = spoolFile
+
+    @property
+    def failedFile(self):
+        return self.spoolFile + ".failed"
+
+    def append(self, payloads, failed=False):
+        """
+        Append the payloads to the spool, or to the .failed file of the actions not executed, the file
+        is synced before return
+
+        :param payloads:
+        :param failed:
+        :return:
+        """
+        appendFile = self.failedFile if failed is True else self.spoolFile
+        while True:
+            spoolOpen = open(appendFile, "ab")
+            fcntl.flock(spoolOpen, fcntl.LOCK_EX)
+            # the flush moved the file while waiting the lock, open the new file
+            try:
+                if os.fstat(spoolOpen.fileno()).st_ino == os.stat(appendFile).st_ino:
+                    break
+            except FileNotFoundError:
+                pass
+            spoolOpen.close()
+        with spoolOpen:
+            spoolOpen.write("".join(json.dumps(payload, default=str) + "\n" for payload in payloads).encode("utf-8"))
+            spoolOpen.flush()
+            os.fsync(spoolOpen.fileno())
+
+    def segments(self):
+        """
+        Move the spool to a new segment and return the segments to flush, the oldest first
+
+        :return:
+        """
+        if os.path.exists(self.spoolFile):
+            with open(self.spoolFile, "rb") as spoolOpen:
+                fcntl.flock(spoolOpen, fcntl.LOCK_EX)
+                os.rename(self.spoolFile, "{}.{}.segment".format(self.spoolFile, time.time_ns()))
+        return sorted(glob.glob("{}.[0-9]*.segment".format(glob.escape(self.spoolFile))))
+
+    def read(self, segment):
+        """
+        Read the actions of the segment after the offset
+
+        :param segment:
+        :return: generator with (line, payload, error)
+        """
+        offset = 0
+        if os.path.exists(segment + ".offset"):
+            with open(segment + ".offset") as offsetOpen:
+                offset = int(offsetOpen.read().strip() or 0)
+        with open(segment, encoding="utf-8") as segmentOpen:
+            for line, content in enumerate(segmentOpen, start=1):
+                if line <= offset or not content.strip():
+                    continue
+                try:
+                    yield line, json.loads(content), None
+                except ValueError as er:
+                    yield line, None, "invalid JSON - {}".format(er)
+
+    def done(self, segment, line):
+        with open(segment + ".offset.tmp", "w") as offsetOpen:
+            offsetOpen.write(str(line))
+        os.replace(segment + ".offset.tmp", segment + ".offset")
+
+    def remove(self, segment):
+        for path in (segment, segment + ".offset"):
+            if os.path.exists(path):
+                os.unlink(path)
+
+class Zendesk:
+
+    #zenpy clients shared by all instances of the process, key is the credentials and the pool options
+    _clients = dict()
+    #reentrant, the client is created with the lock and uses the scheduler
+    _clientsLock = threading.RLock()
+    #ticket caches shared by all instances of the process, key is the path and the options of the cache
+    _caches = dict()
+    #request schedulers shared by all instances of the process, key is the options of the scheduler
+    _schedulers = dict()
+    #metrics of the API calls of the process
+    _metrics = CallMetrics(moduleStarted)
+
+    def __init__(self):
+        self._log = None
+        self._token = "XXXXX"
+        self._subdomain = "example"
+        self._email = "apizendesk@example.com"
+        #pool of connections and timeouts (connect, read) of the requests
+        self._poolSize = 10
+        self._connectTimeout = 10
+        self._readTimeout = 60
+        #rate limit of the requests per minute shared by the processes, None disable
+        self._rateLimit = None
+        self._rateState = "/tmp/zendesk_ratelimit.json"
+        self._bulkReserve = 0.2
+        #poll of the jobs, first interval, maximum interval and deadline in seconds
+        self._pollInterval = 0.25
+        self._pollMaxInterval = 5
+        self._jobTimeout = 60
+        #local cache of the tickets, used only if the cache file is defined
+        self._cacheFile = None
+        self._cacheTTL = 300
+        self._cacheSize = 10000
+        #index of the user IDs of the requesters, the tickets use the requester_id of the e-mails resolved
+        self._requesterIndexFile = "/tmp/zendesk_requesters.sqlite"
+        self._useRequesterIndex = True
+        self._requesterIDs = dict()
+        #local cache of the macro definitions, the macros without placeholders are applied locally
+        self._localMacro = True
+        self._macroCacheFile = "/tmp/zendesk_macros.sqlite"
+        self._macroTTL = 600
+        #files uploaded at the same time
+        self._uploadWorkers = 4
+        #spool of the actions, the flush retries the bulk jobs with backoff
+        self._spoolFile = "/tmp/zendesk_spool.jsonl"
+        self._maxRetries = 5
+        self._maxAttempts = 5
+        self._retryDelay = 1
+        #settings of the action saved in the spool, the others are of the flush
+        self._spoolInternal = ("action", "noKeepTags", "internalMacroID", "noCRLF", "fetch", "safeUpdate", "updatedStamp")
+        #fields for comments in ticket
+        self._comment = SimpleNamespace()
+        self._comment.public = None
+        self._comment.body = None
+        self._comment.uploads = None
+        #fields for create a ticket
+        self._dictValues = dict()
+        self._listValues = list()
+        #fields of the application
+        self._dictInternal = dict()
+        self._listInternal = list()
+        #objects
+        self._updateObject = None
+        self._searchObject = None
+        self._createObject = None
+        #files uploaded with a token for the comment of the update, counted in the API calls
+        self.uploadedPaths = list()
+        #results of the actions, replaced in serve to send the results to the client
+        self._output = self.printOutput
+        #LF and CRLF
+        self._crlf = b'\r\n'
+        self._lf = b'\n'
+        #API calls of the macros, the definitions fetched and the show_macro_effect
+        self.macroCalls = 0
+        #fields of the ticket of the macro effect that are not applied
+        self._macroSkipFields = ("id", "url", "created_at", "updated_at", "via", "fields", "description",
+                                 "satisfaction_rating", "sharing_agreement_ids", "has_incidents")
+        #actions of the macro that set a field and are applied locally
+        self._macroLocalFields = ("status", "priority", "type", "subject", "group_id", "assignee_id", "brand_id",
+                                  "ticket_form_id")
+
+    def printOutput(self, content):
+        """
+        Print a result of the action, the stdout is flushed so each result is sent when it is printed,
+        also when the stdout is a pipe
+
+        :param content:
+        :return:
+        """
+        print(content, flush=True)
+
+    #return object with connection of the zendesk
+    @property
+    def connectZendesk(self):
+        """
+        Return the zenpy client of the process, the client is created in the first access
+        and reused while the credentials and the pool options are the same
+
+        :return:
+        """
+        try:
+            self._credentials = {
+                "email" : self._email,
+                "token" : self._token,
+                "subdomain" : self._subdomain
+            }
+            self._clientKey = (self._email, self._token, self._subdomain, self._poolSize, self._connectTimeout,
+                               self._readTimeout, self._rateLimit, self._rateState, self._bulkReserve)
+            with self._clientsLock:
+                if self._clientKey not in self._clients:
+                    self._clients[self._clientKey] = zenpy.Zenpy(session=self.createSession(),
+                                                           timeout=(self._connectTimeout, self._readTimeout),
+                                                           **self._credentials)
+                return self._clients[self._clientKey]
+
+        except Exception as er:
+            if self._log is not None:
+                self._log.error("{} - {}".format(self.__class__.__name__, er))
+            else:
+                print("{} - {}".format(self.__class__.__name__, er))
+            return False
+
+    @property
+    def ticketCache(self):
+        """
+        Return the ticket cache of the process, None if the cache is not used
+
+        :return:
+        """
+        if self._cacheFile is None:
+            return None
+        self._cacheKey = (self._cacheFile, self._cacheTTL, self._cacheSize)
+        with self._clientsLock:
+            if self._cacheKey not in self._caches:
+                self._caches[self._cacheKey] = TicketCache(self._cacheFile, self._cacheTTL, self._cacheSize)
+            return self._caches[self._cacheKey]
+
+    @property
+    def macroCache(self):
+        """
+        Return the macro cache of the process
+
+        :return:
+        """
+        self._macroCacheKey = ("macros", self._macroCacheFile, self._macroTTL)
+        with self._clientsLock:
+            if self._macroCacheKey not in self._caches:
+                self._caches[self._macroCacheKey] = MacroCache(self._macroCacheFile, self._macroTTL)
+            return self._caches[self._macroCacheKey]
+
+    @property
+    def requesterIndex(self):
+        """
+        Return the requester index of the process, None if the index is not used
+
+        :return:
+        """
+        if self._useRequesterIndex is not True or self._dictInternal.get("noRequesterIndex") is True:
+            return None
+        self._requesterIndexKey = ("requesters", self._requesterIndexFile)
+        with self._clientsLock:
+            if self._requesterIndexKey not in self._caches:
+                self._caches[self._requesterIndexKey] = RequesterIndex(self._requesterIndexFile)
+            return self._caches[self._requesterIndexKey]
+
+    @property
+    def requestScheduler(self):
+        """
+        Return the request scheduler of the process, None if the rate limit is not used
+
+        :return:
+        """
+        if self._rateLimit is None:
+            return None
+        self._schedulerKey = (self._rateLimit, self._rateState, self._bulkReserve)
+        with self._clientsLock:
+            if self._schedulerKey not in self._schedulers:
+                self._schedulers[self._schedulerKey] = RequestScheduler(self._rateLimit, self._rateState, self._bulkReserve)
+            return self._schedulers[self._schedulerKey]
+
+    def bulkPriority(self):
+        """
+        Context of the bulk requests, they wait while the bucket has only the reserve of the interactive requests
+
+        :return:
+        """
+        if self.requestScheduler is None:
+            return nullcontext()
+        return self.requestScheduler.bulk()
+
+    def createSession(self):
+        """
+        Create the requests session with a pool of keep-alive connections
+
+        :return:
+        """
+        self.session = requests.Session()
+        if self.requestScheduler is not None:
+            self.sessionAdapter = ScheduledAdapter(self.requestScheduler, self._metrics, pool_connections=self._poolSize,
+                                                   pool_maxsize=self._poolSize, **zenpy.Zenpy.http_adapter_kwargs())
+        else:
+            self.sessionAdapter = MeteredAdapter(self._metrics, pool_connections=self._poolSize, pool_maxsize=self._poolSize,
+                                                 **zenpy.Zenpy.http_adapter_kwargs())
+        self.session.mount("https://", self.sessionAdapter)
+        self.session.mount("http://", self.sessionAdapter)
+        return self.session
+
+    @classmethod
+    def closeZendesk(cls):
+        """
+        Close the sessions of all zenpy clients of the process
+
+        :return:
+        """
+        with cls._clientsLock:
+            for client in cls._clients.values():
+                client.users.session.close()
+            cls._clients.clear()
+
+    def executeAction(self):
+        try:
+            if self._dictInternal["noDefaultToken"] is True and self._dictInternal["token"] is not None:
+                self._token = self._dictInternal["token"]
+            if self._dictInternal.get("poolSize") is not None:
+                self._poolSize = self._dictInternal["poolSize"]
+            if self._dictInternal.get("connectTimeout") is not None:
+                self._connectTimeout = self._dictInternal["connectTimeout"]
+            if self._dictInternal.get("readTimeout") is not None:
+                self._readTimeout = self._dictInternal["readTimeout"]
+            if self._dictInternal.get("jobTimeout") is not None:
+                self._jobTimeout = self._dictInternal["jobTimeout"]
+            if self._dictInternal.get("pollInterval") is not None:
+                self._pollInterval = self._dictInternal["pollInterval"]
+            for item, attribute in (("rateLimit", "_rateLimit"), ("rateState", "_rateState"), ("bulkReserve", "_bulkReserve")):
+                if self._dictInternal.get(item) is not None:
+                    setattr(self, attribute, self._dictInternal[item])
+            if self._dictInternal.get("uploadWorkers") is not None:
+                self._uploadWorkers = max(self._dictInternal["uploadWorkers"], 1)
+            for item, attribute in (("macroCacheFile", "_macroCacheFile"), ("macroTTL", "_macroTTL")):
+                if self._dictInternal.get(item) is not None:
+                    setattr(self, attribute, self._dictInternal[item])
+            if self._dictInternal.get("noLocalMacro") is True:
+                self._localMacro = False
+            if self._dictInternal.get("requesterIndexFile") is not None:
+                self._requesterIndexFile = self._dictInternal["requesterIndexFile"]
+            if self._dictInternal.get("noRequesterIndex") is True:
+                self._useRequesterIndex = False
+            for item, attribute in (("spoolFile", "_spoolFile"), ("maxRetries", "_maxRetries"), ("maxAttempts", "_maxAttempts"),
+                                    ("retryDelay", "_retryDelay")):
+                if self._dictInternal.get(item) is not None:
+                    setattr(self, attribute, self._dictInternal[item])
+            if self._dictInternal.get("cache") is True:
+                for item, attribute in (("cacheFile", "_cacheFile"), ("cacheTTL", "_cacheTTL"), ("cacheSize", "_cacheSize")):
+                    if self._dictInternal.get(item) is not None:
+                        setattr(self, attribute, self._dictInternal[item])
+                if self._cacheFile is None:
+                    self._cacheFile = "/tmp/zendesk_cache.sqlite"
+            if self._dictInternal["action"] in ("create", "update") and self._dictInternal.get("spool") is True:
+                self.spoolAction()
+            elif self._dictInternal["action"] == "create" and self._dictInternal.get("fromFile") is not None:
+                with self.bulkPriority():
+                    self.createTicketsFromFile()
+            elif self._dictInternal["action"] == "create":
+                self.resultCreate = self.createTicket()
+                if self._dictInternal['getID'] is True:
+                    self._output(self.jobStatus(self.resultCreate.id))
+                else:
+                    self._output(self.resultCreate.id)
+
+            elif self._dictInternal["action"] == "update" and self.isBulkUpdate():
+                with self.bulkPriority():
+                    # the lines that failed are printed, the action failed
+                    if self.updateTicketsBulk() is False or self.updateLineErrors > 0:
+                        return False
+            elif self._dictInternal["action"] == "update":
+                self.updateResult = self.updateBlind() if self.isBlindUpdate() else self.updateSingle()
+                self._output(json.dumps(self.updateResult))
+                if self.updateResult["error"] is not None:
+                    return False
+            elif self._dictInternal["action"] == "search":
+                if self._dictInternal.get("query") is not None:
+                    with self.bulkPriority():
+                        self.searchQuery()
+                elif "," in str(self._dictInternal["ticketID"] or ""):
+                    with self.bulkPriority():
+                        self.searchMany()
+                elif self._dictInternal["ticketID"] is not None and self.ticketCache is not None:
+                    self._output(self.searchCached())
+                elif self._dictInternal["ticketID"] is not None:
+                    self._searchObject = self.searchID()
+                    self._output(self._searchObject.to_dict())
+                elif self._dictInternal["jobID"] is not None:
+                    self.resultJobs = self.waitJobs([jobID.strip() for jobID in self._dictInternal["jobID"].split(",") if jobID.strip()])
+                    for jobID in self.resultJobs:
+                        self._output(json.dumps(self.resultJobs[jobID]))
+            elif self._dictInternal["action"] == "serve":
+                self.serve()
+            elif self._dictInternal["action"] == "export":
+                with self.bulkPriority():
+                    self.exportTickets()
+            elif self._dictInternal["action"] == "flush":
+                with self.bulkPriority():
+                    self.flushSpool()
+            return True
+
+        except Exception as er:
+            if self._log is not None:
+                self._log.error("{} - {}".format(self.__class__.__name__, er))
+            else:
+                print("{} - {}".format(self.__class__.__name__, er))
+            return False
+
+    def writeMetrics(self, interval=0):
+        """
+        Write the metrics of the API calls in --metrics-file
+
+        :param interval: seconds since the last write to write again, 0 always write
+        :return:
+        """
+        try:
+            if self._dictInternal.get("metricsFile") is not None:
+                self._metrics.write(self._dictInternal["metricsFile"], interval)
+
+        except Exception as er:
+            if self._log is not None:
+                self._log.error("{} - {}".format(self.__class__.__name__, er))
+            else:
+                print("{} - {}".format(self.__class__.__name__, er), file=sys.stderr)
+
+    def printStats(self):
+        """
+        Print the summary of the API calls in the stderr, the stdout has the results of the actions
+
+        :return:
+        """
+        self.statsSummary = self._metrics.summary()
+        print("Stats - {} calls, {} retries, {}s network, {}s wall, {}s startup, {} bytes sent, {} bytes received".format(
+            self.statsSummary["calls"], self.statsSummary["retries"], self.statsSummary["network_seconds"],
+            self.statsSummary["wall_seconds"], self.statsSummary.get("startup_seconds"), self.statsSummary["bytes_sent"],
+            self.statsSummary["bytes_received"]), file=sys.stderr)
+        for call in self.statsSummary["endpoints"]:
+            print("Stats - {} {} {} - {} calls, {} retries, {}s, {} bytes sent, {} bytes received".format(
+                call["method"], call["endpoint"], call["status"], call["count"], call["retries"], call["seconds"],
+                call["bytes_sent"], call["bytes_received"]), file=sys.stderr)
+
+    def serve(self):
+        """
+        Execute the actions received as JSON lines in the Unix socket of --socket, or in the stdin,
+        with at most --workers actions at the same time, the result of each action is a JSON line,
+        with --concurrency the actions are executed by the AsyncZendesk
+
+        :return:
+        """
+        if self._dictInternal.get("concurrency") is not None:
+            return AsyncZendesk(self, self._dictInternal["concurrency"]).serve()
+        self.serveExecutor = futures.ThreadPoolExecutor(max_workers=self._dictInternal["workers"])
+        # limit the actions read and not finished, the reading stops while the workers are busy
+        self.serveSlots = threading.BoundedSemaphore(self._dictInternal["workers"] * 2)
+        try:
+            if self._dictInternal.get("socket") is not None:
+                self.serveSocket(self._dictInternal["socket"])
+            else:
+                self.serveStream(sys.stdin, sys.stdout)
+        finally:
+            self.serveExecutor.shutdown(wait=True)
+
+    def serveStream(self, streamIn, streamOut):
+        """
+        Read the actions of the stream and write the results in the other stream, return after the
+        end of the input and the results of all actions
+
+        :param streamIn:
+        :param streamOut:
+        :return:
+        """
+        writeLock = threading.Lock()
+        # actions of this stream with the result not written yet
+        pending = threading.Condition()
+        pendingCount = [0]
+
+        def write(future):
+            try:
+                with writeLock:
+                    streamOut.write(json.dumps(future.result(), default=str) + "\n")
+                    streamOut.flush()
+            except Exception as er:
+                if self._log is not None:
+                    self._log.error("{} - {}".format(self.__class__.__name__, er))
+            finally:
+                self.serveSlots.release()
+                with pending:
+                    pendingCount[0] -= 1
+                    pending.notify_all()
+
+        for content in streamIn:
+            if isinstance(content, bytes):
+                content = content.decode("utf-8")
+            if not content.strip():
+                continue
+            self.serveSlots.acquire()
+            with pending:
+                pendingCount[0] += 1
+            self.serveExecutor.submit(self.serveAction, content).add_done_callback(write)
+        with pending:
+            pending.wait_for(lambda: pendingCount[0] == 0)
+
+    def serveSocket(self, socketPath):
+        """
+        Listen in the Unix socket, each connection send actions as JSON lines and receive the results
+
+        :param socketPath:
+        :return:
+        """
+        zendesk = self
+
+        class ServeHandler(socketserver.StreamRequestHandler):
+
+            def handle(self):
+                streamOut = io.TextIOWrapper(self.wfile, encoding="utf-8", write_through=True)
+                zendesk.serveStream(self.rfile, streamOut)
+
+        if os.path.exists(socketPath):
+            os.unlink(socketPath)
+        with socketserver.ThreadingUnixStreamServer(socketPath, ServeHandler) as server:
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+            finally:
+                os.unlink(socketPath)
+
+    def serveAction(self, content):
+        """
+        Execute one action of the serve, the payload is a JSON object with the "values" and "internal" of the
+        action in the format of the _dictValues and _dictInternal, and an optional "id" returned in the result
+
+        :param content:
+        :return: dict with the result of the action
+        """
+        # local variables, the actions are executed at the same time in the workers
+        result = {"id": None, "ok": False, "output": list(), "errors": list()}
+        actionStart = time.perf_counter()
+        try:
+            payload = json.loads(content)
+            result["id"] = payload.get("id")
+            zendesk = self.actionZendesk(payload)
+            zendesk._output = result["output"].append
+            if zendesk._dictInternal.get("action") not in ("create", "update", "search"):
+                raise ValueError("invalid action {}".format(zendesk._dictInternal.get("action")))
+            result["ok"] = zendesk.executeAction() is True and not zendesk._log.errors
+            result["errors"] = zendesk._log.errors
+            zendesk._log.info("action finished, ok %s", result["ok"],
+                              extra={"duration": round(time.perf_counter() - actionStart, 4)})
+            return result
+
+        except Exception as er:
+            if self._log is not None:
+                self._log.error("{} - {}".format(self.__class__.__name__, er))
+            result["errors"].append("{} - {}".format(self.__class__.__name__, er))
+            return result
+        finally:
+            self.writeMetrics(interval=10)
+
+    def actionZendesk(self, payload):
+        """
+        Create the Zendesk of one action of the serve, it has the settings of the serve and uses the same
+        client, the missing fields of the payload are None as in the arguments
+
+        :param payload:
+        :return:
+        """
+        zendesk = Zendesk()
+        # the errors of the action are collected only in its ActionLog, not in the ActionLog of the serve
+        zendesk._log = ActionLog(self._log.log if isinstance(self._log, ActionLog) else self._log)
+        zendesk._token = self._token
+        zendesk._subdomain = self._subdomain
+        zendesk._email = self._email
+        zendesk._poolSize = self._poolSize
+        zendesk._connectTimeout = self._connectTimeout
+        zendesk._readTimeout = self._readTimeout
+        zendesk._jobTimeout = self._jobTimeout
+        zendesk._pollInterval = self._pollInterval
+        zendesk._cacheFile = self._cacheFile
+        zendesk._cacheTTL = self._cacheTTL
+        zendesk._cacheSize = self._cacheSize
+        zendesk._uploadWorkers = self._uploadWorkers
+        zendesk._macroCacheFile = self._macroCacheFile
+        zendesk._macroTTL = self._macroTTL
+        zendesk._localMacro = self._localMacro
+        zendesk._requesterIndexFile = self._requesterIndexFile
+        zendesk._useRequesterIndex = self._useRequesterIndex
+        zendesk._rateLimit = self._rateLimit
+        zendesk._rateState = self._rateState
+        zendesk._bulkReserve = self._bulkReserve
+        zendesk._listValues = self._listValues
+        zendesk._listInternal = self._listInternal
+        zendesk._dictValues = dict.fromkeys(self._listValues)
+        zendesk._dictValues.update(payload.get("values") or dict())
+        zendesk._dictInternal = dict.fromkeys(self._listInternal)
+        zendesk._dictInternal["batchSize"] = 100
+        zendesk._dictInternal.update(payload.get("internal") or dict())
+        zendesk._comment.public = zendesk._dictInternal.get("public", True)
+        zendesk._comment.uploads = zendesk._dictInternal.get("upload")
+        zendesk._log.extra = {"action": zendesk._dictInternal.get("action"), "ticket_id": zendesk._dictInternal.get("ticketID"),
+                              "payload_id": payload.get("id")}
+        return zendesk
+
+    # create a ticket, necessary define the subject and description
+    def createTicket(self):
+        """
+
+        :return:
+        """
+        try:
+            if self._dictValues["subject"]is not None and self._dictValues["description"] is not None:
+                self._output("Ok")
+                self.createTicketObject = self.connectZendesk.tickets.create([self.ticketObject(self._dictValues)])
+                return self.createTicketObject
+            else:
+                self._log.error("{} - {}".format(self.__class__.__name__, "Object description or subject empty"))
+                return False
+
+        except Exception as er:
+            if self._log is not None:
+                self._log.error("{} - {}".format(self.__class__.__name__, er))
+            else:
+                print("{} - {}".format(self.__class__.__name__, er))
+            return False
+
+    def ticketObject(self, values):
+        """
+        Build the Ticket object of the create with the values in the format of the _dictValues
+
+        :param values:
+        :return:
+        """
+        ticketValues = {
+            "subject": values.get("subject"), "description": values.get("description"),
+            "assignee_id": values.get("assignee_id"), "group_id": values.get("group_id"),
+            "organization_id": values.get("organization_id"), "priority": values.get("priority"),
+            "problem_id": values.get("problem_id"), "status": values.get("status"), "tags": values.get("tags"),
+            "submitter_id": values.get("submitter_id"), "ticket_form_id": values.get("ticket_form_id"),
+            "assignee_email": values.get("assignee_email"), "collaborator_ids": values.get("collaborator_ids"),
+        }
+        self.ticketRequesterID = self.requesterID(values["requester"]) if values.get("requester") is not None else None
+        if self.ticketRequesterID is not None:
+            ticketValues["requester_id"] = self.ticketRequesterID
+        elif values.get("requester") is not None:
+            ticketValues["requester"] = apiObjects.User(name=values["requester"].split("@")[0], email=values["requester"])
+        else:
+            ticketValues["requester_id"] = values.get("requester_id")
+        return apiObjects.Ticket(**ticketValues)
+
+    def requesterID(self, email):
+        """
+        Return the user ID of the e-mail resolved before or in the requester index, None if it is unknown
+
+        :param email:
+        :return:
+        """
+        email = email.strip().lower()
+        if email not in self._requesterIDs and self.requesterIndex is not None:
+            self.requesterIndexID = self.requesterIndex.get(email)
+            if self.requesterIndexID is not None:
+                self._requesterIDs[email] = self.requesterIndexID
+        return self._requesterIDs.get(email)
+
+    def resolveRequesters(self, emails):
+        """
+        Resolve the user IDs of the e-mails before a bulk action, the e-mails missing in the index are searched
+        in chunks and the users not found are created with create_or_update_many, the IDs are saved in the index
+
+        :param emails:
+        :return: dict with e-mail and user ID
+        """
+        try:
+            if self.requesterIndex is None:
+                return dict()
+            self.requesterEmails = sorted(set(email.strip().lower() for email in emails if email and email.strip()))
+            self._requesterIDs.update(self.requesterIndex.getMany(self.requesterEmails))
+            self.requesterMissing = [email for email in self.requesterEmails if email not in self._requesterIDs]
+            self.requesterFound = dict()
+            for index in range(0, len(self.requesterMissing), 50):
+                for user in self.connectZendesk.search(type="user", email=self.requesterMissing[index:index + 50]):
+                    if user.email:
+                        self.requesterFound[user.email.lower()] = user.id
+            self.requesterMissing = [email for email in self.requesterMissing if email not in self.requesterFound]
+            for index in range(0, len(self.requesterMissing), 100):
+                self.requesterJob = self.connectZendesk.users.create_or_update(
+                    [apiObjects.User(name=email.split("@")[0], email=email) for email in self.requesterMissing[index:index + 100]])
+                for result in self.waitJobs([self.requesterJob.id])[self.requesterJob.id]["results"]:
+                    if result.get("email") and result.get("id"):
+                        self.requesterFound[result["email"].lower()] = result["id"]
+            self.requesterIndex.putMany(self.requesterFound)
+            self._requesterIDs.update(self.requesterFound)
+            return {email: self._requesterIDs[email] for email in self.requesterEmails if email in self._requesterIDs}
+
+        except Exception as er:
+            if self._log is not None:
+                self._log.error("{} - {}".format(self.__class__.__name__, er))
+            else:
+                print("{} - {}".format(self.__class__.__name__, er))
+            return False
+
+    def resolveStream(self, records, requester):
+        """
+        Pass the records of a bulk action and resolve the requesters of each chunk of --batch-size records
+        before the records of the chunk are used, the IDs of the previous chunks are released, so the memory
+        is bounded by the chunk and the IDs are kept in the index
+
+        :param records: generator of the records
+        :param requester: function that returns the e-mail of the requester of a record, or None
+        :return: generator with the records
+        """
+        chunk = list()
+        for record in records:
+            chunk.append(record)
+            if len(chunk) >= (self._dictInternal.get("batchSize") or 100):
+                yield from self.resolveRecords(chunk, requester)
+                chunk = list()
+        yield from self.resolveRecords(chunk, requester)
+
+    def resolveRecords(self, records, requester):
+        """
+        Resolve the requesters of a chunk of records of the resolveStream
+
+        :param records: list of the records
+        :param requester: function that returns the e-mail of the requester of a record, or None
+        :return: list with the records
+        """
+        if self.requesterIndex is not None and records:
+            self._requesterIDs = dict()
+            self.resolveRequesters(email for email in (requester(record) for record in records) if isinstance(email, str))
+        return records
+
+    def readRecords(self, recordsFile):
+        """
+        Read the records of a JSONL or CSV (extension .csv) file, one record is read at a time
+
+        :param recordsFile:
+        :return: generator with (line, record, error)
+        """
+        with open(recordsFile, newline='') as recordsFileOpen:
+            if recordsFile.lower().endswith(".csv"):
+                # line 1 is the header of the csv
+                for line, record in enumerate(csv.DictReader(recordsFileOpen), start=2):
+                    yield line, {key: value if value != "" else None for key, value in record.items()}, None
+            else:
+                for line, content in enumerate(recordsFileOpen, start=1):
+                    if not content.strip():
+                        continue
+                    try:
+                        record = json.loads(content)
+                    except ValueError as er:
+                        yield line, None, "invalid json - {}".format(er)
+                        continue
+                    if not isinstance(record, dict):
+                        yield line, None, "record is not a object"
+                        continue
+                    yield line, record, None
+
+    def createTicketsFromFile(self):
+        """
+        Create the tickets of the file with bulk jobs, print a result for each line of the file
+
+        :return:
+        """
+        try:
+            self.createBatch = list()
+            # the requesters are resolved before the tickets, the tickets use the requester_id
+            for line, record, error in self.resolveStream(self.readRecords(self._dictInternal["fromFile"]),
+                                                          lambda item: item[1].get("requester") if item[2] is None else None):
+                if error is None and (record.get("subject") is None or record.get("description") is None):
+                    error = "Object description or subject empty"
+                if error is not None:
+                    self._output(json.dumps({"line": line, "error": error}))
+                    continue
+                try:
+                    self.createBatch.append((line, self.ticketObject(record)))
+                except Exception as er:
+                    self._output(json.dumps({"line": line, "error": str(er)}))
+                    continue
+                if len(self.createBatch) >= self._dictInternal["batchSize"]:
+                    self.createTicketsBatch(self.createBatch)
+                    self.createBatch = list()
+            if self.createBatch:
+                self.createTicketsBatch(self.createBatch)
+            return True
+
+        except Exception as er:
+            if self._log is not None:
+                self._log.error("{} - {}".format(self.__class__.__name__, er))
+            else:
+                print("{} - {}".format(self.__class__.__name__, er))
+            return False
+
+    def createTicketsBatch(self, batch):
+        """
+        Create a batch of tickets in one job, batch is a list of (line, Ticket)
+
+        :param batch:
+        :return:
+        """
+        try:
+            self.resultBatch = self.connectZendesk.tickets.create([ticket for line, ticket in batch])
+            self.resultBatchIDs = dict()
+            if self._dictInternal['getID'] is True:
+                self.resultBatchJob = self.waitJobs([self.resultBatch.id])[self.resultBatch.id]
+                for result in self.resultBatchJob["results"]:
+                    self.resultBatchIDs[result.get("index")] = result
+            for index, (line, ticket) in enumerate(batch):
+                self.resultLine = {"line": line, "job_id": self.resultBatch.id, "index": index}
+                if index in self.resultBatchIDs:
+                    self.resultLine["ticket_id"] = self.resultBatchIDs[index].get("id")
+                    if self.resultBatchIDs[index].get("error") is not None:
+                        self.resultLine["error"] = self.resultBatchIDs[index]["error"]
+                elif self._dictInternal['getID'] is True:
+                    self.resultLine["status"] = self.resultBatchJob["status"]
+                    self.resultLine["timeout"] = self.resultBatchJob["timeout"]
+                self._output(json.dumps(self.resultLine))
+            return self.resultBatch
+
+        except Exception as er:
+            for line, ticket in batch:
+                self._output(json.dumps({"line": line, "error": str(er)}))
+            if self._log is not None:
+                self._log.error("{} - {}".format(self.__class__.__name__, er))
+            else:
+                print("{} - {}".format(self.__class__.__name__, er))
+            return False
+
+    #wait the job and return the id of the first result
+    def jobStatus(self, resultJobID):
+        try:
+            return self.jobResultID(resultJobID, self.waitJobs([resultJobID])[resultJobID])
+
+        except Exception as er:
+            if self._log is not None:
+                self._log.error("{} - {}".format(self.__class__.__name__, er))
+            else:
+                print("{} - {}".format(self.__class__.__name__, er))
+            return False
+
+    def jobResultID(self, jobID, job):
+        """
+        Return the id of the first result of the job waited, raise an error when the job is not completed
+
+        :param jobID:
+        :param job: dict of the job returned by the waitJobs
+        :return:
+        """
+        if job["timeout"] is True:
+            raise TimeoutError("job {} not completed in {} seconds, status {}".format(jobID, self._jobTimeout, job["status"]))
+        if job["status"] != "completed":
+            raise ValueError("job {} finished with status {} - {}".format(jobID, job["status"], job["message"]))
+        return job["results"][0]["id"]
+
+    def waitJobs(self, jobIDs):
+        """
+        Poll the jobs until all are finished or the deadline, the steps of the poll are of the pollJobs
+
+        :param jobIDs:
+        :return: dict with job ID and a dict with status, message, results and timeout of each job
+        """
+        self.jobsPoll = self.pollJobs(jobIDs)
+        try:
+            self.jobsWait, self.jobsChunks = next(self.jobsPoll)
+            while True:
+                time.sleep(self.jobsWait)
+                self.jobsWait, self.jobsChunks = self.jobsPoll.send([job for chunk in self.jobsChunks
+                                                                     for job in self.jobStatuses(chunk)])
+        except StopIteration as stop:
+            return stop.value
+
+    def pollJobs(self, jobIDs):
+        """
+        Steps of the poll of the jobs of the waitJobs of the Zendesk and of the AsyncZendesk, the first poll is
+        fast and the interval grows with exponential backoff and jitter, the pending jobs are polled together.
+        The generator yields the seconds to wait and the chunks of the pending jobs to poll, and receives the
+        statuses of the jobs found, the result is the value of the StopIteration
+
+        :param jobIDs:
+        :return: dict with job ID and a dict with status, message, results and timeout of each job
+        """
+        jobs = {jobID: {"job_id": jobID, "status": None, "message": None, "results": list(), "timeout": False}
+                for jobID in jobIDs}
+        pending = list(jobs)
+        deadline = time.monotonic() + self._jobTimeout
+        interval = self._pollInterval
+        while pending:
+            statuses = yield (min(interval * random.uniform(0.5, 1.0), max(deadline - time.monotonic(), 0)),
+                              [pending[index:index + 100] for index in range(0, len(pending), 100)])
+            # jobs missing in the response do not exist or expired
+            for jobID in set(pending) - set(job["id"] for job in statuses):
+                jobs[jobID]["status"] = "not_found"
+            for job in statuses:
+                jobs[job["id"]].update({"status": job["status"], "message": job["message"], "results": job["results"]})
+            pending = [jobID for jobID in pending
+                       if jobs[jobID]["status"] not in ("completed", "failed", "killed", "not_found")]
+            if pending and time.monotonic() >= deadline:
+                for jobID in pending:
+                    jobs[jobID]["timeout"] = True
+                break
+            interval = min(interval * 2, self._pollMaxInterval)
+        return jobs
+
+    def jobStatuses(self, jobIDs):
+        """
+        Return the status of the jobs, at most 100 jobs
+
+        :param jobIDs:
+        :return: list with a dict of each job found
+        """
+        if len(jobIDs) == 1:
+            try:
+                self.jobsStatus = [self.connectZendesk.job_status(id=jobIDs[0])]
+            except zenpyExceptions.RecordNotFoundException:
+                return list()
+        else:
+            self.jobsStatus = self.connectZendesk.job_status(ids=jobIDs)["job_statuses"]
+        return [{"id": job.id, "status": job.status, "message": getattr(job, "message", None),
+                 "results": [result.to_dict() if hasattr(result, "to_dict") else result for result in job.results or list()]}
+                for job in self.jobsStatus]
+
+    @contextmanager
+    def cacheWrite(self, ticketIDs):
+        """
+        Invalidate the cached tickets before and after the write of the block, also when the write fails,
+        so a ticket read by another action during the write is not kept in the cache
+
+        :param ticketIDs:
+        :return:
+        """
+        if self.ticketCache is not None:
+            self.ticketCache.invalidate(ticketIDs)
+        try:
+            yield
+        finally:
+            if self.ticketCache is not None:
+                self.ticketCache.invalidate(ticketIDs)
+
+    #update a ticket
+    def updateTicket(self, updateObject):
+        """
+
+        :param updateObject:
+        :return:
+        """
+        try:
+            self.updateObject = updateObject
+            with self.cacheWrite([self.updateObject.id]):
+                return self.connectZendesk.tickets.update(self.updateObject)
+
+        except Exception as er:
+            if self._log is not None:
+                self._log.error("{} - {}".format(self.__class__.__name__, er))
+            else:
+                print("{} - {}".format(self.__class__.__name__, er))
+            return False
+
+    def updateSingle(self):
+        """
+        Update one ticket with a single PUT, the effect of the macro, the comment, the tags and the fields are
+        merged in the ticket fetched, the values equal to the ticket are not sent and the PUT is skipped when
+        nothing changed
+
+        :return: dict with the changed and skipped fields, the API calls used and saved, and the error of the update
+        """
+        self.updateReport = {"ticket_id": self._dictInternal["ticketID"], "changed": list(), "skipped": list(),
+                             "put": False, "api_calls": 0, "api_calls_saved": 0, "error": None}
+        # calls of the previous flow, GET, the PUT of the macro, and the final PUT
+        self.updatePreviousCalls = 2
+        self.uploadedPaths = list()
+        self._updateObject = self.searchID()
+        self.updateReport["api_calls"] += 1
+        if self._updateObject is False:
+            self.updateReport["error"] = "the ticket was not fetched"
+            return self.updateReport
+        self.updateComment = None
+        if self._dictValues.get("macro_ids") is not None:
+            self.updatePreviousCalls += 2
+            # the macro definition fetched by --fetch auto is counted
+            self.macroValues = self.macroEffect()
+            self.updateReport["api_calls"] += self.macroCalls
+            if self.macroValues is False:
+                self.updateReport["error"] = "the effect of the macro was not fetched"
+                return self.updateReport
+            self.updateComment = self.applyMacroEffect(self._updateObject, self.macroValues, self.updateReport)
+        for item in self._listValues:
+            value = self._dictValues[item]
+            if value is None or value is False or item == "macro_ids":
+                continue
+            if item == "comment":
+                if self.updateComment is not None:
+                    value = "{}\n\n{}".format(self.updateComment["body"], value)
+                    self.updateComment = None
+                self.commented = self.commentTicket(body=value)
+                self.updateReport["api_calls"] += len(self.uploadedPaths)
+                self.updatePreviousCalls += len(self.uploadedPaths)
+                # the ticket is not updated without the comment or its files
+                if self.commented is False:
+                    self.updateReport["error"] = "the comment or its files failed"
+                    self.updateReport["api_calls_saved"] = self.updatePreviousCalls - self.updateReport["api_calls"]
+                    return self.updateReport
+                self.updateReport["changed"].append(item)
+            else:
+                self.applyValue(self._updateObject, item, value, self.updateReport)
+        if self.updateComment is not None:
+            self._updateObject.comment = apiObjects.Comment(body=self.updateComment["body"], public=self.updateComment["public"])
+            self.updateReport["changed"].append("comment")
+        if self.updateReport["changed"]:
+            if self._dictInternal.get("safeUpdate") is True:
+                self._updateObject.safe_update = True
+                self._updateObject.updated_stamp = self._dictInternal.get("updatedStamp") or self._updateObject.updated_at
+            self.updateReport["put"] = self.updateTicket(self._updateObject) is not False
+            self.updateReport["api_calls"] += 1
+            if self.updateReport["put"] is False:
+                self.updateReport["error"] = "the update was rejected"
+        self.updateReport["changed"] = list(dict.fromkeys(self.updateReport["changed"]))
+        self.updateReport["api_calls_saved"] = self.updatePreviousCalls - self.updateReport["api_calls"]
+        return self.updateReport
+
+    def applyValue(self, ticket, item, value, report):
+        """
+        Apply one value of the update in the ticket fetched, the value equal to the ticket is skipped, the tags
+        are added to the tags of the ticket unless --no-keep-tags
+
+        :param ticket: Ticket fetched
+        :param item: field in the format of the _dictValues, not the comment and the macro
+        :param value:
+        :param report: report of the update with the changed and skipped fields
+        :return:
+        """
+        if item == "tags":
+            value = [value] if isinstance(value, str) else list(value)
+            if self._dictInternal.get("noKeepTags") is not True:
+                value = list(ticket.tags or list()) + [tag for tag in value if tag not in (ticket.tags or list())]
+            if value == list(ticket.tags or list()):
+                report["skipped"].append(item)
+            else:
+                ticket.tags = value
+                report["changed"].append(item)
+        elif item == "requester":
+            self.valueRequesterID = self.requesterID(value)
+            if self.valueRequesterID is not None and self.valueRequesterID == ticket.requester_id:
+                report["skipped"].append(item)
+            elif self.valueRequesterID is not None:
+                ticket.requester_id = self.valueRequesterID
+                report["changed"].append(item)
+            else:
+                ticket.requester = apiObjects.User(name=value.split("@")[0], email=value)
+                report["changed"].append(item)
+        elif str(getattr(ticket, item, None)) == str(value):
+            report["skipped"].append(item)
+        else:
+            setattr(ticket, item, value)
+            report["changed"].append(item)
+
+    def isBlindUpdate(self):
+        """
+        Check if the ticket is updated without fetch it, with --fetch never, or with --fetch auto when the
+        macro is applied locally and --safe-update has the --updated-stamp
+
+        :return:
+        """
+        if self._dictInternal.get("fetch") == "never":
+            return True
+        if self._dictInternal.get("fetch") != "auto":
+            return False
+        if self._dictInternal.get("safeUpdate") is True and self._dictInternal.get("updatedStamp") is None:
+            return False
+        if self._dictValues.get("macro_ids") is not None:
+            return self.useLocalMacro() and self.macroChanges(self.macroDefinition(self._dictValues["macro_ids"])) is not None
+        return True
+
+    def updateBlind(self):
+        """
+        Update one ticket without fetch it, the changes are sent in a partial PUT as in the bulk update,
+        the tags are added with additional_tags in the PUT, or with the tags endpoint when they are the only
+        change, the values equal to the ticket are not detected
+
+        :return: dict with the changed fields, the API calls used and saved, and the error of the update
+        """
+        self.updateReport = {"ticket_id": self._dictInternal["ticketID"], "changed": list(), "skipped": list(),
+                             "put": False, "api_calls": 0, "api_calls_saved": 0, "fetch": False, "error": None}
+        self.uploadedPaths = list()
+        try:
+            self.blindChanges = self.updateChanges(self._dictValues, self._dictInternal["ticketID"])
+            if self._comment.uploads is not None and self.blindChanges.get("comment") is not None:
+                self.blindChanges["comment"] = apiObjects.Comment(body=self.blindChanges["comment"].body, public=self._comment.public,
+                                                       uploads=self.uploadFiles(self._comment.uploads))
+            self.updateReport["changed"] = list(dict.fromkeys("tags" if item in ("additional_tags", "remove_tags") else item
+                                                              for item in self.blindChanges))
+            if list(self.blindChanges) == ["additional_tags"] and self._dictInternal.get("safeUpdate") is not True:
+                with self.cacheWrite([int(self._dictInternal["ticketID"])]):
+                    self.connectZendesk.tickets.add_tags(int(self._dictInternal["ticketID"]), self.blindChanges["additional_tags"])
+                self.updateReport["put"] = True
+                self.updateReport["api_calls"] += 1
+            elif self.blindChanges:
+                self._updateObject = apiObjects.Ticket(id=int(self._dictInternal["ticketID"]), **self.blindChanges)
+                if self._dictInternal.get("safeUpdate") is True:
+                    if self._dictInternal.get("updatedStamp") is None:
+                        raise ValueError("--safe-update needs the updated_stamp of the ticket")
+                    self._updateObject.safe_update = True
+                    self._updateObject.updated_stamp = self._dictInternal["updatedStamp"]
+                self.updateReport["put"] = self.updateTicket(self._updateObject) is not False
+                self.updateReport["api_calls"] += 1
+                if self.updateReport["put"] is False:
+                    self.updateReport["error"] = "the update was rejected"
+
+        except Exception as er:
+            self.updateReport["error"] = str(er)
+            if self._log is not None:
+                self._log.error("{} - {}".format(self.__class__.__name__, er))
+            else:
+                print("{} - {}".format(self.__class__.__name__, er))
+        # the calls of the macro, also the definition fetched by --fetch auto, and the files uploaded also when
+        # other upload failed and the ticket is not updated
+        self.updateReport["api_calls"] += self.macroCalls + len(self.uploadedPaths)
+        # the update with fetch makes the same calls and the GET of the ticket
+        self.updatePreviousCalls = self.updateReport["api_calls"] + 1
+        self.updateReport["api_calls_saved"] = self.updatePreviousCalls - self.updateReport["api_calls"]
+        return self.updateReport
+
+    def macroEffect(self):
+        """
+        Return the ticket with the effect of the macro in the _updateObject, the macro is applied locally
+        when its actions do not depend on the server, else with show_macro_effect
+
+        :return: dict of the ticket
+        """
+        try:
+            if self.useLocalMacro():
+                self.macroLocal = self.macroChanges(self.macroDefinition(self._dictValues["macro_ids"]))
+                if self.macroLocal is not None:
+                    return self.localMacroEffect(self._updateObject.to_dict(), self.macroLocal)
+            self.macroCalls += 1
+            self.macroResult = self.macroID()
+            if self.macroResult is False:
+                return False
+            return self.macroResult.ticket.to_dict()
+
+        except Exception as er:
+            if self._log is not None:
+                self._log.error("{} - {}".format(self.__class__.__name__, er))
+            else:
+                print("{} - {}".format(self.__class__.__name__, er))
+            return False
+
+    def useLocalMacro(self):
+        return self._localMacro is True and self._dictInternal.get("noLocalMacro") is not True
+
+    def macroDefinition(self, macroID):
+        """
+        Return the dict of the macro, from the macro cache or fetched and cached
+
+        :param macroID:
+        :return:
+        """
+        self.macroDict = self.macroCache.get(macroID)
+        if self.macroDict is None:
+            self.macroCalls += 1
+            self.macroDict = self.connectZendesk.macros(id=int(macroID)).to_dict()
+            self.macroCache.put(self.macroDict)
+        return self.macroDict
+
+    def macroChanges(self, macro):
+        """
+        Translate the actions of the macro in changes of the ticket, None when an action is not supported
+        locally or depends on the server, as the placeholders {{...}} and the current_user
+
+        :param macro: dict of the macro
+        :return: dict with fields, comment, set_tags, add_tags and remove_tags, or None
+        """
+        changes = {"fields": dict(), "comment": None, "set_tags": None, "add_tags": list(), "remove_tags": list()}
+        body = None
+        public = True
+        for action in macro.get("actions") or list():
+            field, value = action.get("field"), action.get("value")
+            # the comment can be a list with the channel and the body
+            if field == "comment_value" and isinstance(value, list):
+                value = value[-1]
+            if "{{" in str(value) or str(value).startswith("current_"):
+                return None
+            if field in self._macroLocalFields:
+                changes["fields"][field] = int(value) if field.endswith("_id") and str(value).isdigit() else value
+            elif str(field).startswith("custom_fields_") and field[len("custom_fields_"):].isdigit():
+                changes["fields"].setdefault("custom_fields", list()).append({"id": int(field[len("custom_fields_"):]),
+                                                                             "value": value})
+            elif field == "comment_value":
+                body = value
+            elif field == "comment_mode_is_public":
+                public = str(value).lower() == "true"
+            elif field == "set_tags":
+                changes["set_tags"] = str(value).split()
+            elif field == "current_tags":
+                changes["add_tags"].extend(str(value).split())
+            elif field == "remove_tags":
+                changes["remove_tags"].extend(str(value).split())
+            else:
+                return None
+        if body is not None:
+            changes["comment"] = {"body": body, "public": public}
+        return changes
+
+    def localMacroEffect(self, ticket, changes):
+        """
+        Return the ticket with the changes of the macro in the format of the ticket of show_macro_effect
+
+        :param ticket: dict of the ticket
+        :param changes: changes of the macroChanges
+        :return:
+        """
+        effect = dict(ticket)
+        effect.update({field: value for field, value in changes["fields"].items() if field != "custom_fields"})
+        # the custom fields of the macro replace the fields of the ticket with the same ID, the others are kept
+        if changes["fields"].get("custom_fields"):
+            customFields = {field["id"]: field for field in ticket.get("custom_fields") or list()}
+            customFields.update({field["id"]: field for field in changes["fields"]["custom_fields"]})
+            effect["custom_fields"] = list(customFields.values())
+        tags = list(changes["set_tags"]) if changes["set_tags"] is not None else list(ticket.get("tags") or list())
+        tags.extend(tag for tag in changes["add_tags"] if tag not in tags)
+        effect["tags"] = [tag for tag in tags if tag not in changes["remove_tags"]]
+        effect["comment"] = dict(changes["comment"]) if changes["comment"] is not None else None
+        return effect
+
+    def macroBulkChanges(self, macroID, ticketID=None):
+        """
+        Return the changes of the macro for the bulk update, the macro is applied locally without the
+        ticket when its actions do not depend on the server, else with show_macro_effect of the ticket
+
+        :param macroID:
+        :param ticketID:
+        :return:
+        """
+        self.macroLocal = self.macroChanges(self.macroDefinition(macroID)) if self.useLocalMacro() else None
+        self.macroUpdate = dict()
+        if self.macroLocal is None:
+            if ticketID is None:
+                raise ValueError("macro {} depends on the server, the ticket is needed".format(macroID))
+            self.macroCalls += 1
+            self.macroValues = self.connectZendesk.tickets.show_macro_effect(int(ticketID), int(macroID)).ticket.to_dict()
+            self.macroComment = self.macroValues.pop("comment", None)
+            self.macroUpdate = {item: value for item, value in self.macroValues.items()
+                                if value is not None and item not in self._macroSkipFields}
+            if self.macroComment and self.macroComment.get("body"):
+                self.macroUpdate["comment"] = apiObjects.Comment(body=self.macroComment["body"], public=self.macroComment.get("public", True))
+            return self.macroUpdate
+        self.macroUpdate.update(self.macroLocal["fields"])
+        if self.macroLocal["set_tags"] is not None:
+            self.macroUpdate["tags"] = self.macroLocal["set_tags"]
+        if self.macroLocal["add_tags"]:
+            self.macroUpdate["additional_tags"] = self.macroLocal["add_tags"]
+        if self.macroLocal["remove_tags"]:
+            self.macroUpdate["remove_tags"] = self.macroLocal["remove_tags"]
+        if self.macroLocal["comment"] is not None:
+            self.macroUpdate["comment"] = apiObjects.Comment(**self.macroLocal["comment"])
+        return self.macroUpdate
+
+    def applyMacroEffect(self, ticket, macroTicket, report):
+        """
+        Apply in the ticket the fields changed by the macro, the fields equal to the ticket are not changed
+
+        :param ticket: Ticket fetched
+        :param macroTicket: dict of the ticket with the effect of the macro
+        :param report: report of the update with the changed fields
+        :return: dict with the body and public of the comment of the macro, or None
+        """
+        self.macroValues = dict(macroTicket)
+        self.macroComment = self.macroValues.pop("comment", None)
+        for item, value in self.macroValues.items():
+            if value is None or item in self._macroSkipFields:
+                continue
+            if getattr(ticket, item, None) != value:
+                setattr(ticket, item, value)
+                report["changed"].append(item)
+        if self.macroComment and self.macroComment.get("body"):
+            return {"body": self.macroComment["body"], "public": self.macroComment.get("public", True)}
+        return None
+
+    def isBulkUpdate(self):
+        """
+        Check if the update is for many tickets, -t with IDs separated by comma, --ids-file or --from-file
+
+        :return:
+        """
+        return (self._dictInternal.get("fromFile") is not None or self._dictInternal.get("idsFile") is not None or
+                "," in str(self._dictInternal.get("ticketID") or ""))
+
+    def updateRecords(self):
+        """
+        Read the tickets of the bulk update, the changes of the --from-file records are merged over the arguments
+
+        :return: generator with (line, ticketID, values, error)
+        """
+        if self._dictInternal.get("fromFile") is not None:
+            for line, record, error in self.readRecords(self._dictInternal["fromFile"]):
+                if error is not None:
+                    yield line, None, None, error
+                    continue
+                self.recordValues = dict(self._dictValues)
+                self.recordValues.update({key: value for key, value in record.items() if key != "id"})
+                yield line, record.get("id"), self.recordValues, None
+        elif self._dictInternal.get("idsFile") is not None:
+            with open(self._dictInternal["idsFile"]) as idsFileOpen:
+                for line, content in enumerate(idsFileOpen, start=1):
+                    if content.strip():
+                        yield line, content.strip(), self._dictValues, None
+        else:
+            for line, ticketID in enumerate(str(self._dictInternal["ticketID"]).split(","), start=1):
+                if ticketID.strip():
+                    yield line, ticketID.strip(), self._dictValues, None
+
+    def updateChanges(self, values, ticketID=None):
+        """
+        Build the fields of the bulk update with the values in the format of the _dictValues,
+        tags are added with additional_tags unless --no-keep-tags, the changes of the macro are
+        merged and the values have priority over the macro
+
+        :param values:
+        :param ticketID: used when the macro depends on the server
+        :return:
+        """
+        self.changes = dict()
+        if values.get("macro_ids") is not None:
+            self.changes.update(self.macroBulkChanges(values["macro_ids"], ticketID))
+        for item, value in values.items():
+            # the updated_stamp of a record is sent only by --safe-update
+            if value is None or value is False or item in ("macro_ids", "updated_stamp"):
+                continue
+            if item == "tags":
+                value = [value] if isinstance(value, str) else list(value)
+                if self._dictInternal.get("noKeepTags") is True:
+                    self.changes["tags"] = value
+                else:
+                    self.changes["additional_tags"] = list(dict.fromkeys(self.changes.get("additional_tags", list()) + value))
+            elif item == "requester":
+                self.changesRequesterID = self.requesterID(value)
+                if self.changesRequesterID is not None:
+                    self.changes["requester_id"] = self.changesRequesterID
+                else:
+                    self.changes["requester"] = apiObjects.User(name=value.split("@")[0], email=value)
+            elif item == "comment":
+                if self.changes.get("comment") is not None:
+                    value = "{}\n\n{}".format(self.changes["comment"].body, value)
+                self.changes["comment"] = apiObjects.Comment(body=value, public=self._comment.public)
+            else:
+                self.changes[item] = value
+        return self.changes
+
+    def updateTicketsBulk(self):
+        """
+        Update many tickets with update_many jobs, print the job of each batch
+
+        :return: list with the job IDs
+        """
+        try:
+            if self._comment.uploads is not None:
+                raise ValueError("upload is not supported in bulk update")
+            self.updateBatch = list()
+            self.updateJobs = list()
+            self.updateLineErrors = 0
+            # the requesters are resolved before the changes, the tickets use the requester_id
+            for line, ticketID, values, error in self.resolveStream(self.updateRecords(),
+                                                                    lambda item: item[2].get("requester") if item[3] is None else None):
+                if error is None:
+                    try:
+                        self.updateValues = self.updateChanges(values, ticketID)
+                        # the safe update of many tickets uses the updated_stamp of each record
+                        if self._dictInternal.get("safeUpdate") is True:
+                            if values.get("updated_stamp") is None:
+                                raise ValueError("--safe-update needs the updated_stamp of the ticket")
+                            self.updateValues.update(safe_update=True, updated_stamp=values["updated_stamp"])
+                        self.updateBatch.append((line, apiObjects.Ticket(id=int(ticketID), **self.updateValues)))
+                    except Exception as er:
+                        error = str(er)
+                if error is not None:
+                    self._output(json.dumps({"line": line, "error": error}))
+                    self.updateLineErrors += 1
+                    continue
+                if len(self.updateBatch) >= self._dictInternal["batchSize"]:
+                    self.updateJobs.append(self.updateTicketsBatch(self.updateBatch))
+                    self.updateBatch = list()
+            if self.updateBatch:
+                self.updateJobs.append(self.updateTicketsBatch(self.updateBatch))
+            return [jobID for jobID in self.updateJobs if jobID is not False]
+
+        except Exception as er:
+            if self._log is not None:
+                self._log.error("{} - {}".format(self.__class__.__name__, er))
+            else:
+                print("{} - {}".format(self.__class__.__name__, er))
+            return False
+
+    def updateTicketsBatch(self, batch):
+        """
+        Update a batch of tickets in one job, batch is a list of (line, Ticket), with --safe-update the job is
+        waited and the result of each line is printed, the tickets changed after the updated_stamp have the error
+
+        :param batch:
+        :return: ID of the job
+        """
+        try:
+            # the job applies the changes after the request, a ticket read before the end of the job is cached
+            # until the --cache-ttl
+            with self.cacheWrite([ticket.id for line, ticket in batch]):
+                self.resultBatch = self.connectZendesk.tickets.update([ticket for line, ticket in batch])
+            self._output(json.dumps({"job_id": self.resultBatch.id, "lines": [line for line, ticket in batch],
+                              "ticket_ids": [ticket.id for line, ticket in batch]}))
+            if self._dictInternal.get("safeUpdate") is True:
+                self.resultBatchJob = self.waitJobs([self.resultBatch.id])[self.resultBatch.id]
+                # the results of update_many have the ticket ID
+                self.resultBatchIDs = {result.get("id"): result for result in self.resultBatchJob["results"] if isinstance(result, dict)}
+                for line, ticket in batch:
+                    self.resultLine = {"line": line, "job_id": self.resultBatch.id, "ticket_id": ticket.id}
+                    result = self.resultBatchIDs.get(ticket.id)
+                    if result is not None and (result.get("error") is not None or result.get("status") == "Failed"):
+                        self.resultLine["error"] = "{} {}".format(result.get("error"), result.get("details") or "").strip()
+                        self.updateLineErrors += 1
+                    elif result is not None:
+                        self.resultLine["status"] = result.get("status")
+                    else:
+                        self.resultLine["status"] = self.resultBatchJob["status"]
+                        self.resultLine["timeout"] = self.resultBatchJob["timeout"]
+                    self._output(json.dumps(self.resultLine))
+            return self.resultBatch.id
+
+        except Exception as er:
+            for line, ticket in batch:
+                self._output(json.dumps({"line": line, "error": str(er)}))
+            self.updateLineErrors += len(batch)
+            if self._log is not None:
+                self._log.error("{} - {}".format(self.__class__.__name__, er))
+            else:
+                print("{} - {}".format(self.__class__.__name__, er))
+            return False
+
+    @property
+    def actionSpool(self):
+        return ActionSpool(self._spoolFile)
+
+    def spoolRecords(self):
+        """
+        Read the actions to spool, the tickets of --from-file and --ids-file and the IDs of -t are one action each
+
+        :return: generator with (line, ticketID, values, error)
+        """
+        if self._dictInternal["action"] == "update":
+            yield from self.updateRecords()
+        elif self._dictInternal.get("fromFile") is not None:
+            for line, record, error in self.readRecords(self._dictInternal["fromFile"]):
+                yield line, None, record, error
+        else:
+            yield 1, None, self._dictValues, None
+
+    def spoolAction(self):
+        """
+        Append the create or update to the spool without call the API, the actions are executed by the flush,
+        print the ID of the action of each line
+
+        :return: number of actions spooled
+        """
+        try:
+            self.spoolSettings = {item: self._dictInternal[item] for item in self._spoolInternal
+                                  if self._dictInternal.get(item) is not None}
+            if self._comment.public is not None:
+                self.spoolSettings["public"] = self._comment.public
+            if self._comment.uploads is not None:
+                # the flush can run in other directory
+                self.spoolSettings["upload"] = [os.path.abspath(path) for path in self._comment.uploads]
+            self.spoolCount = 0
+            self.spoolPayloads = list()
+            for line, ticketID, values, error in self.spoolRecords():
+                if error is None and self._dictInternal["action"] == "create" and (
+                        values.get("subject") is None or values.get("description") is None):
+                    error = "Object description or subject empty"
+                if error is not None:
+                    self._output(json.dumps({"line": line, "error": error}))
+                    continue
+                self.spoolPayload = {"id": uuid.uuid4().hex, "values": {item: value for item, value in values.items() if value is not None},
+                                     "internal": dict(self.spoolSettings), "spooled_at": round(time.time(), 3), "attempts": 0}
+                if ticketID is not None:
+                    self.spoolPayload["internal"]["ticketID"] = str(ticketID)
+                # the safe update of a record is executed with the updated_stamp of the record
+                if self.spoolSettings.get("safeUpdate") is True and self.spoolPayload["values"].get("updated_stamp") is not None:
+                    self.spoolPayload["internal"]["updatedStamp"] = self.spoolPayload["values"].pop("updated_stamp")
+                self.spoolPayloads.append((line, self.spoolPayload))
+                # the payloads are appended in chunks, the memory is flat with big files
+                if len(self.spoolPayloads) >= 1000:
+                    self.spoolCount += self.spoolAppend(self.spoolPayloads)
+                    self.spoolPayloads = list()
+            if self.spoolPayloads:
+                self.spoolCount += self.spoolAppend(self.spoolPayloads)
+            return self.spoolCount
+
+        except Exception as er:
+            if self._log is not None:
+                self._log.error("{} - {}".format(self.__class__.__name__, er))
+            else:
+                print("{} - {}".format(self.__class__.__name__, er))
+            return False
+
+    def spoolAppend(self, payloads):
+        self.actionSpool.append([payload for line, payload in payloads])
+        for line, payload in payloads:
+            self._output(json.dumps({"line": line, "spool_id": payload["id"]}))
+        return len(payloads)
+
+    def flushSpool(self):
+        """
+        Execute the actions of the spool, only one flush of the spool runs at a time, with --interval
+        the spool is flushed again after each interval until interrupted
+
+        :return:
+        """
+        try:
+            with open(self._spoolFile + ".lock", "w") as lockOpen:
+                try:
+                    fcntl.flock(lockOpen, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    raise RuntimeError("other flush of {} is running".format(self._spoolFile))
+                while True:
+                    for segment in self.actionSpool.segments():
+                        self.flushSegment(segment)
+                    if self._dictInternal.get("interval") is None:
+                        break
+                    self.writeMetrics(interval=10)
+                    time.sleep(self._dictInternal["interval"])
+            return True
+
+        except KeyboardInterrupt:
+            return True
+        except Exception as er:
+            if self._log is not None:
+                self._log.error("{} - {}".format(self.__class__.__name__, er))
+            else:
+                print("{} - {}".format(self.__class__.__name__, er))
+            return False
+
+    def flushSegment(self, segment):
+        """
+        Execute the actions of a segment in the order of the lines, the creates and the updates in sequence are
+        grouped in bulk jobs, the actions with uploads or other settings are executed one by one as in serve,
+        the offset of the segment is saved after each job, the segment is removed at the end
+
+        :param segment:
+        :return:
+        """
+        self.flushBatch = list()
+        self.flushKind = None
+        # the requesters are resolved before the tickets, the tickets use the requester_id
+        for line, payload, error in self.resolveStream(self.actionSpool.read(segment),
+                                                       lambda item: (item[1].get("values") or dict()).get("requester")
+                                                       if item[2] is None else None):
+            self.flushLineKind, self.flushTicket = None, None
+            if error is None:
+                try:
+                    self.flushLineKind, self.flushTicket = self.flushTicketObject(payload)
+                except Exception as er:
+                    error = str(er)
+            # a bulk job has one change of each ticket, the changes of a ticket are sent in order
+            if self.flushBatch and (self.flushLineKind != self.flushKind or len(self.flushBatch) >= self._dictInternal["batchSize"] or
+                                    (self.flushKind == "update" and
+                                     self.flushTicket.id in [ticket.id for line, payload, ticket in self.flushBatch])):
+                self.flushJob(segment, self.flushKind, self.flushBatch)
+                self.flushBatch = list()
+            if error is not None:
+                self._output(json.dumps({"id": (payload or dict()).get("id"), "line": line, "error": error}))
+                self.actionSpool.done(segment, line)
+            elif self.flushLineKind is not None:
+                self.flushKind = self.flushLineKind
+                self.flushBatch.append((line, payload, self.flushTicket))
+            else:
+                self._output(json.dumps(self.serveAction(json.dumps(payload)), default=str))
+                self.actionSpool.done(segment, line)
+        if self.flushBatch:
+            self.flushJob(segment, self.flushKind, self.flushBatch)
+        self.actionSpool.remove(segment)
+
+    def flushTicketObject(self, payload):
+        """
+        Build the ticket of the bulk job of a spooled action with the settings of the action
+
+        :param payload:
+        :return: tuple (create or update, Ticket), (None, None) if the action is executed alone
+        """
+        internal = payload.get("internal") or dict()
+        if (internal.get("upload") is not None or internal.get("internalMacroID") is not None or
+                internal.get("safeUpdate") is True):
+            return None, None
+        zendesk = self.actionZendesk(payload)
+        if internal.get("action") == "create":
+            if zendesk._dictValues.get("subject") is None or zendesk._dictValues.get("description") is None:
+                raise ValueError("Object description or subject empty")
+            ticket = zendesk.ticketObject(zendesk._dictValues)
+            # the external_id of the spool ID finds the ticket created by a request that failed, only with
+            # --dedup-external-id, the field is of the user and of the integrations
+            if ticket.external_id is None and self._dictInternal.get("dedupExternalID") is True:
+                ticket.external_id = "spool-{}".format(payload.get("id"))
+            return "create", ticket
+        if internal.get("action") == "update" and str(internal.get("ticketID") or "").isdigit():
+            return "update", apiObjects.Ticket(id=int(internal["ticketID"]), **zendesk.updateChanges(zendesk._dictValues, internal["ticketID"]))
+        return None, None
+
+    def flushJob(self, segment, kind, batch):
+        """
+        Send the batch in one bulk job and wait the job, batch is a list of (line, payload, Ticket), the job is
+        retried with backoff and jitter when it fails with 429, 5xx or a connection error, after --max-retries
+        the actions are appended to the spool again. A create retried after a request that can have reached
+        the server is sent only for the tickets not found by the external_id, the tickets without external_id
+        can be created again
+
+        :param segment:
+        :param kind: create or update
+        :param batch:
+        :return: ID of the job
+        """
+        self.flushAttempt = 0
+        self.flushLastLine = batch[-1][0]
+        # the creates spooled again can have been created by the request that failed
+        self.flushCheckCreated = kind == "create" and any(payload.get("attempts") for line, payload, ticket in batch)
+        while True:
+            try:
+                if self.flushCheckCreated is True:
+                    batch = self.flushCreated(batch)
+                    self.flushCheckCreated = False
+                self.flushResult = None
+                if batch and kind == "create":
+                    self.flushResult = self.connectZendesk.tickets.create([ticket for line, payload, ticket in batch])
+                elif batch:
+                    with self.cacheWrite([ticket.id for line, payload, ticket in batch]):
+                        self.flushResult = self.connectZendesk.tickets.update([ticket for line, payload, ticket in batch])
+                break
+
+            except Exception as er:
+                if self.isRetryable(er) and self.flushAttempt < self._maxRetries:
+                    time.sleep(min(self._retryDelay * 2 ** self.flushAttempt, 60) * random.uniform(0.5, 1.0))
+                    self.flushAttempt += 1
+                    self.flushCheckCreated = kind == "create" and not self.isNotSent(er)
+                    continue
+                if self.isRetryable(er):
+                    self.flushRequeue([(line, payload) for line, payload, ticket in batch], er)
+                else:
+                    self.flushFailed([(line, payload) for line, payload, ticket in batch], er)
+                self.actionSpool.done(segment, self.flushLastLine)
+                if self._log is not None:
+                    self._log.error("{} - {}".format(self.__class__.__name__, er))
+                else:
+                    print("{} - {}".format(self.__class__.__name__, er))
+                return False
+        if self.flushResult is not None:
+            self.flushJobResults(kind, batch, self.flushResult.id)
+        self.actionSpool.done(segment, self.flushLastLine)
+        return self.flushResult.id if self.flushResult is not None else None
+
+    def flushJobResults(self, kind, batch, jobID):
+        """
+        Wait the job of the batch and report each action, the tickets that failed in the job are moved to
+        the .failed file, the actions of a job failed without results are spooled again, the actions of a
+        job not finished in --job-timeout are reported with the job ID, the job can still apply them
+
+        :param kind: create or update
+        :param batch:
+        :param jobID:
+        :return:
+        """
+        try:
+            self.flushStatus = self.waitJobs([jobID])[jobID]
+        except Exception as er:
+            self.flushStatus = {"status": None, "results": list(), "timeout": True, "message": str(er)}
+        # the tickets read while the job was running are invalidated again
+        if kind == "update" and self.ticketCache is not None:
+            self.ticketCache.invalidate([ticket.id for line, payload, ticket in batch])
+        # the results of create_many have the index, the results of update_many have the ticket ID
+        self.flushResults = {result.get("index") if kind == "create" else result.get("id"): result
+                             for result in self.flushStatus["results"] if isinstance(result, dict)}
+        self.flushRetry = list()
+        self.flushErrors = list()
+        for index, (line, payload, ticket) in enumerate(batch):
+            result = self.flushResults.get(index if kind == "create" else ticket.id)
+            self.resultLine = {"id": payload.get("id"), "line": line, "job_id": jobID, "index": index}
+            if result is not None and (result.get("error") is not None or result.get("success") is False or
+                                       result.get("status") == "Failed"):
+                self.flushErrors.append(((line, payload), "{} {}".format(result.get("error"), result.get("details") or "").strip()))
+            elif result is not None:
+                self.resultLine["ticket_id"] = result.get("id")
+                self._output(json.dumps(self.resultLine))
+            elif self.flushStatus["timeout"] is True:
+                self.resultLine.update({"status": self.flushStatus["status"], "timeout": True})
+                self._output(json.dumps(self.resultLine))
+            else:
+                self.flushRetry.append((line, payload))
+        for item, error in self.flushErrors:
+            self.flushFailed([item], error)
+        if self.flushRetry:
+            self.flushRequeue(self.flushRetry, "job {} finished with status {} - {}".format(
+                jobID, self.flushStatus["status"], self.flushStatus["message"]))
+
+    def flushCreated(self, batch):
+        """
+        Remove of the batch the tickets created by a request that failed, they are found by the external_id
+        of the ticket, or of the spool ID with --dedup-external-id
+
+        :param batch:
+        :return: batch with the tickets not created
+        """
+        self.flushPending = list()
+        for line, payload, ticket in batch:
+            self.flushTicketCreated = None
+            if ticket.external_id is not None:
+                self.flushTicketCreated = next(iter(self.connectZendesk.tickets(external_id=ticket.external_id)), None)
+            if self.flushTicketCreated is not None:
+                self._output(json.dumps({"id": payload.get("id"), "line": line, "ticket_id": self.flushTicketCreated.id,
+                                         "created_before": True}))
+            else:
+                self.flushPending.append((line, payload, ticket))
+        return self.flushPending
+
+    def flushRequeue(self, items, error):
+        """
+        Append the actions to the spool again, the actions flushed --max-attempts times are moved to the .failed
+        file, items is a list of (line, payload)
+
+        :param items:
+        :param error:
+        :return:
+        """
+        self.flushAgain = list()
+        for line, payload in items:
+            payload = dict(payload, attempts=payload.get("attempts", 0) + 1, error=str(error))
+            if payload["attempts"] >= self._maxAttempts:
+                self.flushFailed([(line, payload)], error, attempted=True)
+                continue
+            self.flushAgain.append(payload)
+            self._output(json.dumps({"id": payload.get("id"), "line": line, "error": str(error), "spooled": True}))
+        if self.flushAgain:
+            self.actionSpool.append(self.flushAgain)
+
+    def flushFailed(self, items, error, attempted=False):
+        """
+        Move the actions to the .failed file of the spool, items is a list of (line, payload)
+
+        :param items:
+        :param error:
+        :param attempted: the attempts of the payloads are already counted
+        :return:
+        """
+        self.flushDead = [payload if attempted is True else dict(payload, attempts=payload.get("attempts", 0) + 1, error=str(error))
+                          for line, payload in items]
+        self.actionSpool.append(self.flushDead, failed=True)
+        for line, payload in items:
+            self._output(json.dumps({"id": payload.get("id"), "line": line, "error": str(error), "failed": self.actionSpool.failedFile}))
+
+    @staticmethod
+    def isRetryable(error):
+        """
+        Check if the error is temporary, 429, 5xx or a connection error
+
+        :param error:
+        :return:
+        """
+        if getattr(error, "response", None) is not None:
+            return error.response.status_code == 429 or error.response.status_code >= 500
+        return isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+
+    @staticmethod
+    def isNotSent(error):
+        """
+        Check if the request failed before reach the server, 429 or a timeout of the connection
+
+        :param error:
+        :return:
+        """
+        if getattr(error, "response", None) is not None:
+            return error.response.status_code == 429
+        return isinstance(error, requests.exceptions.ConnectTimeout)
+
+    def searchCached(self):
+        """
+        Search the ticket in the cache, the ticket is fetched when it is not cached or it is not fresh
+
+        :return: dict of the ticket
+        """
+        try:
+            self.cachedTicket = self.ticketCache.get(self._dictInternal['ticketID'])
+            if self.cachedTicket is not None and self.cachedTicket[1] is True:
+                return self.cachedTicket[0]
+            if self.cachedTicket is not None:
+                self.revalidateCache([int(self._dictInternal['ticketID'])])
+                self.cachedTicket = self.ticketCache.get(self._dictInternal['ticketID'])
+                if self.cachedTicket is not None:
+                    return self.cachedTicket[0]
+            self._searchObject = self.searchID()
+            self.cachedTicket = self._searchObject.to_dict()
+            self.ticketCache.put(self.cachedTicket)
+            return self.cachedTicket
+
+        except Exception as er:
             if self._log is not None:
                 self._log.error("{} - {}".format(self.__class__.__name__, er))
             else:
                 print("{} - {}".format(self.__class__.__name__, er))
             return False
 
+    def searchMany(self):
+        """
+        Search the tickets of the IDs separated by comma with show_many, print a JSON line for each ticket in
+        the order of the IDs, the fresh tickets of the cache are not fetched
+
+        :return:
+        """
+        try:
+            self.searchIDs = [int(ticketID) for ticketID in self._dictInternal["ticketID"].split(",") if ticketID.strip()]
+            for index in range(0, len(self.searchIDs), 100):
+                self.searchChunk = self.searchIDs[index:index + 100]
+                self.searchFound = self.freshTickets(self.searchChunk)
+                self.searchMissing = [ticketID for ticketID in self.searchChunk if ticketID not in self.searchFound]
+                if self.searchMissing:
+                    self.searchFound = self.fetchedTickets(self.searchFound, [ticket.to_dict() for ticket in
+                                                                              self.connectZendesk.tickets(ids=self.searchMissing)])
+                self.outputTickets(self.searchChunk, self.searchFound)
+            return True
+
+        except Exception as er:
+            if self._log is not None:
+                self._log.error("{} - {}".format(self.__class__.__name__, er))
+            else:
+                print("{} - {}".format(self.__class__.__name__, er))
+            return False
+
+    def freshTickets(self, ticketIDs):
+        """
+        Return the fresh tickets of the cache, empty without the cache
+
+        :param ticketIDs:
+        :return: dict with ID and ticket dict
+        """
+        if self.ticketCache is None:
+            return dict()
+        return {ticketID: ticket for ticketID, (ticket, fresh) in self.ticketCache.getMany(ticketIDs).items() if fresh is True}
+
+    def fetchedTickets(self, found, fetched):
+        """
+        Save the tickets fetched in the cache
+
+        :param found: dict with ID and ticket dict of the tickets found before
+        :param fetched: list of ticket dicts
+        :return: dict with ID and ticket dict of the tickets found and fetched
+        """
+        if self.ticketCache is not None and fetched:
+            self.ticketCache.putMany(fetched)
+        self.ticketsFound = dict(found)
+        self.ticketsFound.update({ticket["id"]: ticket for ticket in fetched})
+        return self.ticketsFound
+
+    def outputTickets(self, ticketIDs, found):
+        """
+        Output a JSON line for each ticket in the order of the IDs, the tickets not found have the error
+
+        :param ticketIDs:
+        :param found: dict with ID and ticket dict
+        :return:
+        """
+        for ticketID in ticketIDs:
+            self._output(json.dumps(found.get(ticketID, {"id": ticketID, "error": "RecordNotFound"})))
+
+    def searchQuery(self):
+        """
+        Search the tickets of the query with the search export API and cursor pagination, each ticket is
+        printed as a JSON line when its page arrives
+
+        :return:
+        """
+        try:
+            self.searchResults = self.connectZendesk.search_export(self._dictInternal["query"], type="ticket",
+                                                                   cursor_pagination=self._dictInternal["pageSize"] or 100)
+            for ticket in self.searchResults:
+                self._output(json.dumps(ticket.to_dict()))
+            return True
+
+        except Exception as er:
+            if self._log is not None:
+                self._log.error("{} - {}".format(self.__class__.__name__, er))
+            else:
+                print("{} - {}".format(self.__class__.__name__, er))
+            return False
+
+    def exportTickets(self):
+        """
+        Export the tickets changed since the cursor of the state file with the incremental cursor API, the
+        cursor is saved after each page written, so a new run continues from the last complete page
+
+        :return: count of the tickets exported
+        """
+        try:
+            self.exportState = self.loadExportState()
+            if self.exportState.get("cursor") is not None:
+                self.exportGenerator = self.connectZendesk.tickets.incremental(cursor=self.exportState["cursor"],
+                                                                             per_page=self._dictInternal["pageSize"])
+            else:
+                self.exportGenerator = self.connectZendesk.tickets.incremental(start_time=self._dictInternal["startTime"] or 0,
+                                                                             per_page=self._dictInternal["pageSize"])
+            self.exportCount = 0
+            self.exportOutput = open(self._dictInternal["output"], "a") if self._dictInternal.get("output") else sys.stdout
+            try:
+                # the generator has the after_cursor of the current page as attribute, a new after_cursor means
+                # the last page was written
+                self.exportCursor = getattr(self.exportGenerator, "after_cursor", None)
+                for ticket in self.exportGenerator:
+                    if getattr(self.exportGenerator, "after_cursor", None) != self.exportCursor:
+                        self.saveExportState(self.exportCursor)
+                        self.exportCursor = getattr(self.exportGenerator, "after_cursor", None)
+                    self.exportRecord = ticket.to_dict()
+                    if self._dictInternal.get("format") == "flat":
+                        self.exportRecord = self.flattenRecord(self.exportRecord)
+                    self.exportOutput.write(json.dumps(self.exportRecord) + "\n")
+                    self.exportCount += 1
+                self.saveExportState(self.exportCursor)
+            finally:
+                if self.exportOutput is not sys.stdout:
+                    self.exportOutput.close()
+            print("Exported {} tickets, cursor {}".format(self.exportCount, self.exportCursor), file=sys.stderr)
+            return self.exportCount
+
+        except Exception as er:
+            if self._log is not None:
+                self._log.error("{} - {}".format(self.__class__.__name__, er))
+            else:
+                print("{} - {}".format(self.__class__.__name__, er))
+            return False
+
+    def loadExportState(self):
+        if not os.path.exists(self._dictInternal["stateFile"]):
+            return dict()
+        with open(self._dictInternal["stateFile"]) as stateFileOpen:
+            return json.load(stateFileOpen)
+
+    def saveExportState(self, cursor):
+        """
+        Save the cursor after the written tickets are on disk, the state file is replaced atomically
+
+        :param cursor:
+        :return:
+        """
+        if cursor is None:
+            return
+        self.exportOutput.flush()
+        if self.exportOutput is not sys.stdout:
+            try:
+                os.fsync(self.exportOutput.fileno())
+            except OSError:
+                # output is not a regular file, e.g. a pipe
+                pass
+        with open(self._dictInternal["stateFile"] + ".tmp", "w") as stateFileOpen:
+            json.dump({"cursor": cursor, "saved_at": time.time()}, stateFileOpen)
+            stateFileOpen.flush()
+            os.fsync(stateFileOpen.fileno())
+        os.replace(self._dictInternal["stateFile"] + ".tmp", self._dictInternal["stateFile"])
+
+    def flattenRecord(self, record, prefix=""):
+        """
+        Flatten the nested objects of the record to columns with the keys joined by dot, the lists are
+        saved as JSON strings
+
+        :param record:
+        :param prefix:
+        :return:
+        """
+        flatRecord = dict()
+        for key, value in record.items():
+            if isinstance(value, dict):
+                flatRecord.update(self.flattenRecord(value, "{}{}.".format(prefix, key)))
+            elif isinstance(value, list):
+                flatRecord["{}{}".format(prefix, key)] = json.dumps(value)
+            else:
+                flatRecord["{}{}".format(prefix, key)] = value
+        return flatRecord
+
+    def revalidateCache(self, ticketIDs):
+        """
+        Revalidate the cached tickets with show_many, the tickets with the same updated_at are fresh again
+        and the changed tickets are replaced. The API has no request of only the updated_at of a list of
+        tickets, so the revalidation downloads the whole tickets, one call for each 100 stale tickets,
+        it saves the calls of the single GETs and not the transfer of the tickets
+
+        :param ticketIDs:
+        :return: list with the IDs of the changed tickets
+        """
+        self.cachedTickets = self.ticketCache.getMany(ticketIDs)
+        self.changedIDs = list()
+        for index in range(0, len(ticketIDs), 100):
+            self.revalidateChunk = [int(ticketID) for ticketID in ticketIDs[index:index + 100]]
+            self.revalidated = [ticket.to_dict() for ticket in self.connectZendesk.tickets(ids=self.revalidateChunk)]
+            for ticket in self.revalidated:
+                if ticket["id"] not in self.cachedTickets or ticket.get("updated_at") != self.cachedTickets[ticket["id"]][0].get("updated_at"):
+                    self.changedIDs.append(ticket["id"])
+            self.ticketCache.putMany(self.revalidated)
+            # tickets missing in show_many were deleted
+            self.ticketCache.invalidate(set(self.revalidateChunk) - set(ticket["id"] for ticket in self.revalidated))
+        return self.changedIDs
+
+    #id search
+    def searchID(self):
+        try:
+            return self.connectZendesk.tickets(id=self._dictInternal['ticketID'])
+
+        except Exception as er:
+            if self._log is not None:
+                self._log.error("{} - {}".format(self.__class__.__name__, er))
+            else:
+                print("{} - {}".format(self.__class__.__name__, er))
+            return False
+
+    #id search
+    def macroID(self):
+        try:
+            return self.connectZendesk.tickets.show_macro_effect(self._updateObject, self._dictValues['macro_ids'])
+
+        except Exception as er:
+            if self._log is not None:
+                self._log.error("{} - {}".format(self.__class__.__name__, er))
+            else:
+                print("{} - {}".format(self.__class__.__name__, er))
+            return False
+
+    def commentTicket(self, body=None, public=None):
+        """
+
+        :param body: body of the comment, default the --comment
+        :param public: default the --private
+        :return:
+        """
+        try:
+            self._comment.body = body if body is not None else self._dictValues['comment']
+            self._comment.public = public if public is not None else self._comment.public
+            if self._comment.uploads is not None:
+                self._updateObject.comment = apiObjects.Comment(body=self._comment.body, public=self._comment.public,
+                                                     uploads=self.uploadFiles(self._comment.uploads))
+            else:
+                self._updateObject.comment = apiObjects.Comment(body=self._comment.body, public=self._comment.public)
+
+        except Exception as er:
+            if self._log is not None:
+                self._log.error("{} - {}".format(self.__class__.__name__, er))
+            else:
+                print("{} - {}".format(self.__class__.__name__, er))
+            return False
+
+    def uploadFiles(self, uploadPaths):
+        """
+        Upload the files of the paths and globs at the same time with at most --upload-workers uploads,
+        print the size and the time of each file
+
+        :param uploadPaths:
+        :return: list with the tokens in the order of the paths
+        """
+        self.uploadPaths = self.uploadGlobs(uploadPaths)
+        with futures.ThreadPoolExecutor(max_workers=min(self._uploadWorkers, len(self.uploadPaths))) as uploadExecutor:
+            self.uploadResults = list(uploadExecutor.map(self.uploadFileTimed, self.uploadPaths))
+        return self.uploadTokens(self.uploadResults)
+
+    def uploadGlobs(self, uploadPaths):
+        """
+        Return the files of the paths and globs of the upload, a path without match is kept to report the
+        error of the file
+
+        :param uploadPaths:
+        :return:
+        """
+        if isinstance(uploadPaths, str):
+            uploadPaths = [uploadPaths]
+        self.uploadGlobPaths = list()
+        for uploadPath in uploadPaths:
+            self.uploadGlobPaths.extend(sorted(glob.glob(uploadPath)) or [uploadPath])
+        return self.uploadGlobPaths
+
+    def uploadTokens(self, uploadResults):
+        """
+        Print the size of the file, the bytes sent after the conversion to CRLF and the time of each file uploaded,
+        raise the error when an upload failed, the files uploaded with a token are in the uploadedPaths
+
+        :param uploadResults: list of tuple (path, size, sent, seconds, token or False)
+        :return: list with the tokens in the order of the paths
+        """
+        for uploadPath, uploadSize, uploadSent, uploadSeconds, uploadToken in uploadResults:
+            self._output(json.dumps({"upload": uploadPath, "bytes": uploadSize, "bytes_sent": uploadSent,
+                                     "seconds": round(uploadSeconds, 3), "ok": uploadToken is not False}))
+        self.uploadedPaths = [uploadPath for uploadPath, uploadSize, uploadSent, uploadSeconds, uploadToken in uploadResults
+                              if uploadToken is not False]
+        self.uploadFailed = [uploadPath for uploadPath, uploadSize, uploadSent, uploadSeconds, uploadToken in uploadResults
+                             if uploadToken is False]
+        if self.uploadFailed:
+            raise ValueError("upload failed - {}".format(", ".join(self.uploadFailed)))
+        return [uploadToken for uploadPath, uploadSize, uploadSent, uploadSeconds, uploadToken in uploadResults]
+
+    def uploadFileTimed(self, uploadPath):
+        """
+        Upload one file of uploadFiles
+
+        :param uploadPath:
+        :return: tuple (path, size, sent, seconds, token or False)
+        """
+        uploadStart = time.monotonic()
+        uploadSize = os.path.getsize(uploadPath) if os.path.isfile(uploadPath) else None
+        uploadSent = [None]
+        uploadResult = self.uploadFile(uploadPath, uploadSent)
+        return (uploadPath, uploadSize, uploadSent[0], time.monotonic() - uploadStart,
+                uploadResult.token if uploadResult is not False else False)
+
+    def uploadFile(self, uploadFile, sent=None):
+        """
+        Upload the file, the content is converted from LF to CRLF while it is sent unless --no-crlf,
+        the file in the disk is not changed
+
+        :param uploadFile:
+        :param sent: list of one item with the bytes sent of the body after the upload
+        :return:
+        """
+        try:
+            with self.convertLFtoCRLF(uploadFile) as uploadBody:
+                uploadResult = self.connectZendesk.attachments.upload(uploadBody, target_name=os.path.basename(uploadFile))
+                if sent is not None:
+                    sent[0] = uploadBody.sent
+                return uploadResult
+
+        except Exception as er:
+            if self._log is not None:
+                self._log.error("{} - {}".format(self.__class__.__name__, er))
+            else:
+                print("{} - {}".format(self.__class__.__name__, er))
+            return False
+
+    def convertLFtoCRLF(self, convertFile, chunkSize=65536):
+        """
+        Return the body of the upload with LF converted to CRLF while it is read, unless --no-crlf
+
+        :param convertFile:
+        :param chunkSize:
+        :return:
+        """
+        return UploadBody(convertFile, convert=self._dictInternal.get("noCRLF") is not True, chunkSize=chunkSize)
+
+class AsyncZendesk:
+
+    def __init__(self, zendesk, concurrency):
+        """
+        Execute the actions of the serve with asyncio in one aiohttp session with at most concurrency requests
+        at the same time, the payloads and the settings are the same of the Zendesk of the serve
+        """
+        try:
+            import aiohttp
+        except ImportError:
+            raise ImportError("--concurrency needs the aiohttp package, install it with pip install aiohttp")
+        self.aiohttp = aiohttp
+        self.zendesk = zendesk
+        self.concurrency = concurrency
+        self.maxRetries = 5
+        self.session = None
+        self.requestSlots = None
+        self.executor = None
+        self.baseURL = "{}://{}/api/v2".format(os.environ.get("ZENPY_FORCE_SCHEME", "https"),
+                                               os.environ.get("ZENPY_FORCE_NETLOC") or "{}.zendesk.com".format(zendesk._subdomain))
+
+    def serve(self):
+        try:
+            asyncio.run(self.serveAsync())
+        except KeyboardInterrupt:
+            pass
+
+    async def serveAsync(self):
+        """
+        Open the session and execute the actions of the Unix socket of --socket, or of the stdin
+
+        :return:
+        """
+        self.requestSlots = asyncio.Semaphore(self.concurrency)
+        # threads of the stdin and of the actions without async version
+        self.executor = futures.ThreadPoolExecutor(max_workers=(self.zendesk._dictInternal.get("workers") or 4) + 1)
+        # the header of the token is built once, the auth of the session is deprecated in aiohttp
+        authorization = base64.b64encode("{}/token:{}".format(self.zendesk._email, self.zendesk._token).encode("utf-8"))
+        self.session = self.aiohttp.ClientSession(
+            connector=self.aiohttp.TCPConnector(limit=self.concurrency),
+            headers={"Authorization": "Basic {}".format(authorization.decode("ascii"))},
+            timeout=self.aiohttp.ClientTimeout(sock_connect=self.zendesk._connectTimeout, sock_read=self.zendesk._readTimeout))
+        try:
+            if self.zendesk._dictInternal.get("socket") is not None:
+                await self.serveSocket(self.zendesk._dictInternal["socket"])
+            else:
+                loop = asyncio.get_running_loop()
+                await self.serveStream(lambda: loop.run_in_executor(self.executor, sys.stdin.readline), self.writeStdout)
+        finally:
+            await self.session.close()
+            self.executor.shutdown(wait=False)
+
+    async def writeStdout(self, content):
+        sys.stdout.write(content)
+        sys.stdout.flush()
+
+    async def serveStream(self, readLine, write):
+        """
+        Read the actions with readLine and write the results with write, return after the end of the input
+        and the results of all actions
+
+        :param readLine: coroutine function with the next line, empty at the end
+        :param write: coroutine function that writes a result line
+        :return:
+        """
+        # limit the actions read and not finished, the reading stops while the requests are busy
+        serveSlots = asyncio.Semaphore(self.concurrency * 2)
+        pending = set()
+
+        async def execute(content):
+            try:
+                await write(json.dumps(await self.serveAction(content), default=str) + "\n")
+            except Exception as er:
+                if self.zendesk._log is not None:
+                    self.zendesk._log.error("{} - {}".format(self.__class__.__name__, er))
+            finally:
+                serveSlots.release()
+
+        while True:
+            content = await readLine()
+            if not content:
+                break
+            if isinstance(content, bytes):
+                content = content.decode("utf-8")
+            if not content.strip():
+                continue
+            await serveSlots.acquire()
+            task = asyncio.ensure_future(execute(content))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+        if pending:
+            await asyncio.wait(pending)
+
+    async def serveSocket(self, socketPath):
+        """
+        Listen in the Unix socket, each connection send actions as JSON lines and receive the results
+
+        :param socketPath:
+        :return:
+        """
+        async def handle(reader, writer):
+            async def write(content):
+                writer.write(content.encode("utf-8"))
+                await writer.drain()
+
+            try:
+                await self.serveStream(reader.readline, write)
+            finally:
+                writer.close()
+
+        if os.path.exists(socketPath):
+            os.unlink(socketPath)
+        server = await asyncio.start_unix_server(handle, path=socketPath, limit=2 ** 24)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            os.unlink(socketPath)
+
+    async def serveAction(self, content):
+        """
+        Execute one action of the serve, the create of a ticket, the update and the search of the tickets of -t
+        and the search of the jobs are async, the other actions are executed by the Zendesk in a thread
+
+        :param content:
+        :return: dict with the result of the action
+        """
+        result = {"id": None, "ok": False, "output": list(), "errors": list()}
+        actionStart = time.perf_counter()
+        try:
+            payload = json.loads(content)
+            result["id"] = payload.get("id")
+            zendesk = self.zendesk.actionZendesk(payload)
+            zendesk._output = result["output"].append
+            action = zendesk._dictInternal.get("action")
+            executed = True
+            if action not in ("create", "update", "search"):
+                raise ValueError("invalid action {}".format(action))
+            if action == "create" and zendesk._dictInternal.get("fromFile") is None:
+                executed = await self.createTicket(zendesk)
+            elif (action == "update" and zendesk._dictInternal.get("fromFile") is None and
+                  zendesk._dictInternal.get("idsFile") is None):
+                executed = await self.updateTickets(zendesk)
+            elif action == "search" and zendesk._dictInternal.get("ticketID") is not None:
+                executed = await self.searchTickets(zendesk)
+            elif action == "search" and zendesk._dictInternal.get("jobID") is not None:
+                jobs = await self.waitJobs(zendesk, [jobID.strip() for jobID in str(zendesk._dictInternal["jobID"]).split(",")
+                                                     if jobID.strip()])
+                for jobID in jobs:
+                    zendesk._output(json.dumps(jobs[jobID]))
+            else:
+                executed = await asyncio.get_running_loop().run_in_executor(self.executor, zendesk.executeAction)
+            result["ok"] = executed is not False and not zendesk._log.errors
+            result["errors"] = zendesk._log.errors
+            zendesk._log.info("action finished, ok %s", result["ok"],
+                              extra={"duration": round(time.perf_counter() - actionStart, 4)})
+            return result
+
+        except Exception as er:
+            if self.zendesk._log is not None:
+                self.zendesk._log.error("{} - {}".format(self.__class__.__name__, er))
+            result["errors"].append("{} - {}".format(self.__class__.__name__, er))
+            return result
+        finally:
+            self.zendesk.writeMetrics(interval=10)
+
+    async def request(self, method, endpoint, priority=None, **kwargs):
+        """
+        Send one request with at most concurrency requests at the same time, with the rate limit the request
+        waits a token of the scheduler, the 429 responses are retried after the Retry-After
+
+        :param method:
+        :param endpoint: path after /api/v2/
+        :param priority: priority of the request in the scheduler, default interactive
+        :return: JSON of the response
+        """
+        scheduler = self.zendesk.requestScheduler
+        metrics = self.zendesk._metrics
+        url = "{}/{}".format(self.baseURL, endpoint)
+        sent = [0]
+        if kwargs.get("json") is not None:
+            kwargs["data"] = json.dumps(kwargs.pop("json")).encode("utf-8")
+            kwargs.setdefault("headers", dict())["Content-Type"] = "application/json"
+        uploadBody = kwargs.pop("data") if isinstance(kwargs.get("data"), UploadBody) else None
+        if isinstance(kwargs.get("data"), bytes):
+            sent[0] = len(kwargs["data"])
+        elif hasattr(kwargs.get("data"), "__aiter__"):
+            kwargs["data"] = self.countChunks(kwargs["data"], sent)
+        elif uploadBody is not None:
+            kwargs.setdefault("headers", dict())["Content-Length"] = str(len(uploadBody))
+        attempt = 0
+        while True:
+            async with self.requestSlots:
+                # the token is waited in the loop, the threads of the executor are not blocked
+                if scheduler is not None:
+                    wait = scheduler.tryAcquire(priority)
+                    while wait > 0:
+                        await asyncio.sleep(wait)
+                        wait = scheduler.tryAcquire(priority)
+                # the upload body is read again from the start on every attempt
+                if uploadBody is not None:
+                    uploadBody.seek(0)
+                    sent[0] = 0
+                    kwargs["data"] = self.countChunks(self.asyncChunks(uploadBody), sent)
+                start = time.perf_counter()
+                try:
+                    async with self.session.request(method, url, **kwargs) as response:
+                        content = await response.text()
+                except Exception:
+                    metrics.record(method, url, "error", time.perf_counter() - start, sent[0])
+                    raise
+                metrics.record(method, url, response.status, time.perf_counter() - start, sent[0], len(content))
+                if scheduler is not None:
+                    retryAfter = scheduler.observe(response.status, response.headers)
+                else:
+                    retryAfter = RequestScheduler.retryAfter(response.status, response.headers)
+                # a body of a stream can not be sent again, the upload body is rewound
+                if retryAfter is None or attempt >= self.maxRetries or (uploadBody is None and not isinstance(kwargs.get("data"), (bytes, type(None)))):
+                    if response.status == 404:
+                        raise zenpyExceptions.RecordNotFoundException(content)
+                    if response.status >= 400:
+                        raise zenpyExceptions.APIException(content)
+                    return json.loads(content) if content else dict()
+                metrics.retry(method, url, response.status)
+            attempt += 1
+            # with the scheduler the next acquire waits the Retry-After
+            if scheduler is None:
+                await asyncio.sleep(retryAfter)
+
+    def ticketPayload(self, ticket):
+        """
+        Return the JSON of the ticket object without the empty fields
+
+        :param ticket:
+        :return:
+        """
+        def clean(value):
+            if isinstance(value, dict):
+                return {item: clean(content) for item, content in value.items() if content is not None}
+            return value
+
+        return clean(ticket.to_dict(serialize=True))
+
+    async def createTicket(self, zendesk):
+        """
+        Create the ticket with create_many as the createTicket of the Zendesk, the output is the ID of the job,
+        with --get-id the job is waited and the output is the ID of the ticket
+
+        :param zendesk: Zendesk of the action
+        :return: ID of the job, or of the ticket with --get-id
+        """
+        try:
+            if zendesk._dictValues["subject"] is None or zendesk._dictValues["description"] is None:
+                raise ValueError("Object description or subject empty")
+            zendesk._output("Ok")
+            result = await self.request("POST", "tickets/create_many.json",
+                                        json={"tickets": [self.ticketPayload(zendesk.ticketObject(zendesk._dictValues))]})
+            jobID = result["job_status"]["id"]
+            if zendesk._dictInternal.get("getID") is True:
+                ticketID = zendesk.jobResultID(jobID, (await self.waitJobs(zendesk, [jobID]))[jobID])
+                zendesk._output(ticketID)
+                return ticketID
+            zendesk._output(jobID)
+            return jobID
+
+        except Exception as er:
+            zendesk._log.error("{} - {}".format(self.__class__.__name__, er))
+            return False
+
+    async def updateTickets(self, zendesk):
+        """
+        Update the tickets of -t, one ticket is fetched and updated as in the updateSingle unless it is a blind
+        update, many tickets are updated at the same time, each ticket with a single PUT of the changes without
+        fetch as in the bulk update, tags are added with additional_tags unless --no-keep-tags
+
+        :param zendesk: Zendesk of the action
+        :return: list with the report of each ticket
+        """
+        try:
+            ticketIDs = [ticketID.strip() for ticketID in str(zendesk._dictInternal["ticketID"]).split(",") if ticketID.strip()]
+            if len(ticketIDs) == 1 and not await asyncio.get_running_loop().run_in_executor(self.executor, zendesk.isBlindUpdate):
+                return [await self.updateSingle(zendesk, ticketIDs[0])]
+            values = dict(zendesk._dictValues)
+            macroID = values.pop("macro_ids", None)
+            uploads = zendesk._comment.uploads if values.get("comment") is not None else None
+            if uploads is not None and len(ticketIDs) > 1:
+                raise ValueError("upload is not supported in bulk update")
+            # the tickets are not fetched, the updated_stamp of each ticket is in the records of --from-file
+            if zendesk._dictInternal.get("safeUpdate") is True and len(ticketIDs) > 1:
+                raise ValueError("--safe-update of many tickets needs --from-file with the updated_stamp of each ticket")
+            # the macro applied locally is merged once in the changes of all tickets
+            macroLocal = False
+            if macroID is not None and zendesk.useLocalMacro():
+                macroLocal = await asyncio.get_running_loop().run_in_executor(
+                    self.executor, lambda: zendesk.macroChanges(zendesk.macroDefinition(macroID)) is not None)
+                if macroLocal is True:
+                    values["macro_ids"] = macroID
+                    macroID = None
+            changes = json.dumps(self.ticketPayload(apiObjects.Ticket(**zendesk.updateChanges(values))))
+            priority = "bulk" if len(ticketIDs) > 1 else None
+            return await asyncio.gather(*(self.updateTicket(zendesk, ticketID, json.loads(changes), macroID, uploads, priority,
+                                                            macroLocal) for ticketID in ticketIDs))
+
+        except Exception as er:
+            zendesk._log.error("{} - {}".format(self.__class__.__name__, er))
+            return False
+
+    async def updateSingle(self, zendesk, ticketID, priority=None):
+        """
+        Update one ticket as the updateSingle of the Zendesk, the effect of the macro, the comment, the tags and
+        the fields are merged in the ticket fetched and only the fields changed are sent in the PUT
+
+        :param zendesk: Zendesk of the action
+        :param ticketID:
+        :param priority:
+        :return: dict with the changed and skipped fields, and the API calls used and saved
+        """
+        report = {"ticket_id": ticketID, "changed": list(), "skipped": list(), "put": False, "api_calls": 0,
+                  "api_calls_saved": 0, "error": None}
+        # calls of the previous flow, GET, the PUT of the macro, and the final PUT
+        previousCalls = 2
+        zendesk.uploadedPaths = list()
+        try:
+            ticket = apiObjects.Ticket(**(await self.request("GET", "tickets/{}.json".format(ticketID), priority))["ticket"])
+            # only the fields changed after the fetch are sent
+            ticket._clean_dirty()
+            report["api_calls"] += 1
+            macroComment = None
+            macroID = zendesk._dictValues.get("macro_ids")
+            if macroID is not None:
+                previousCalls += 2
+                macroLocal = None
+                if zendesk.useLocalMacro():
+                    macroLocal = await asyncio.get_running_loop().run_in_executor(
+                        self.executor, lambda: zendesk.macroChanges(zendesk.macroDefinition(macroID)))
+                if macroLocal is not None:
+                    macroTicket = zendesk.localMacroEffect(ticket.to_dict(), macroLocal)
+                else:
+                    macroTicket = (await self.request("GET", "tickets/{}/macros/{}/apply.json".format(ticketID, macroID),
+                                                      priority))["result"]["ticket"]
+                    report["api_calls"] += 1
+                macroComment = zendesk.applyMacroEffect(ticket, macroTicket, report)
+            for item in zendesk._listValues:
+                value = zendesk._dictValues.get(item)
+                if value is None or value is False or item in ("macro_ids", "comment"):
+                    continue
+                zendesk.applyValue(ticket, item, value, report)
+            if zendesk._dictValues.get("comment") is not None:
+                body = zendesk._dictValues["comment"]
+                if macroComment is not None:
+                    body = "{}\n\n{}".format(macroComment["body"], body)
+                uploads = None
+                if zendesk._comment.uploads is not None:
+                    # the ticket is not updated without the files of the comment
+                    try:
+                        uploads = await self.uploadFiles(zendesk, zendesk._comment.uploads, priority)
+                    finally:
+                        report["api_calls"] += len(zendesk.uploadedPaths)
+                        previousCalls += len(zendesk.uploadedPaths)
+                ticket.comment = apiObjects.Comment(body=body, public=zendesk._comment.public, uploads=uploads)
+                report["changed"].append("comment")
+            elif macroComment is not None:
+                ticket.comment = apiObjects.Comment(body=macroComment["body"], public=macroComment["public"])
+                report["changed"].append("comment")
+            if report["changed"]:
+                if zendesk._dictInternal.get("safeUpdate") is True:
+                    ticket.safe_update = True
+                    ticket.updated_stamp = zendesk._dictInternal.get("updatedStamp") or ticket.updated_at
+                with zendesk.cacheWrite([ticketID]):
+                    await self.request("PUT", "tickets/{}.json".format(ticketID), priority,
+                                       json={"ticket": self.ticketPayload(ticket)})
+                report["api_calls"] += 1
+                report["put"] = True
+
+        except Exception as er:
+            report["error"] = str(er)
+            zendesk._log.error("{} - {}".format(self.__class__.__name__, er))
+        report["changed"] = list(dict.fromkeys(report["changed"]))
+        report["api_calls_saved"] = previousCalls - report["api_calls"]
+        zendesk._output(json.dumps(report))
+        return report
+
+    async def updateTicket(self, zendesk, ticketID, changes, macroID=None, uploads=None, priority=None, macroLocal=False):
+        """
+        Update one ticket, the effect of the macro is merged in the PUT and the values of the action have
+        priority over the macro, output the report in the format of the updateSingle
+
+        :param zendesk: Zendesk of the action
+        :param ticketID:
+        :param changes: JSON of the ticket with the changes
+        :param macroID:
+        :param uploads: paths and globs of the files of the comment
+        :param priority:
+        :param macroLocal: the macro was applied locally in the changes
+        :return: dict with the changed fields, and the API calls used and saved
+        """
+        report = {"ticket_id": ticketID, "changed": list(), "skipped": list(), "put": False, "api_calls": 0,
+                  "api_calls_saved": 0, "error": None}
+        # calls of the sync update, GET, the PUT of the macro, and the final PUT
+        previousCalls = 4 if macroLocal is True else 2
+        try:
+            if macroID is not None:
+                previousCalls += 2
+                macroTicket = dict((await self.request("GET", "tickets/{}/macros/{}/apply.json".format(ticketID, macroID),
+                                                       priority))["result"]["ticket"])
+                report["api_calls"] += 1
+                macroComment = macroTicket.pop("comment", None)
+                for item, value in macroTicket.items():
+                    if value is not None and item not in zendesk._macroSkipFields and item not in changes:
+                        changes[item] = value
+                if macroComment and macroComment.get("body") and "comment" in changes:
+                    changes["comment"]["body"] = "{}\n\n{}".format(macroComment["body"], changes["comment"]["body"])
+                elif macroComment and macroComment.get("body"):
+                    changes["comment"] = {"body": macroComment["body"], "public": macroComment.get("public", True)}
+            if uploads is not None:
+                zendesk.uploadedPaths = list()
+                try:
+                    changes["comment"]["uploads"] = await self.uploadFiles(zendesk, uploads, priority)
+                finally:
+                    report["api_calls"] += len(zendesk.uploadedPaths)
+                    previousCalls += len(zendesk.uploadedPaths)
+            report["changed"] = list(dict.fromkeys("tags" if item == "additional_tags" else item for item in changes))
+            if changes and zendesk._dictInternal.get("safeUpdate") is True:
+                if zendesk._dictInternal.get("updatedStamp") is None:
+                    raise ValueError("--safe-update needs the updated_stamp of the ticket")
+                changes.update({"safe_update": True, "updated_stamp": zendesk._dictInternal["updatedStamp"]})
+            if changes:
+                with zendesk.cacheWrite([ticketID]):
+                    await self.request("PUT", "tickets/{}.json".format(ticketID), priority, json={"ticket": changes})
+                report["api_calls"] += 1
+                report["put"] = True
+
+        except Exception as er:
+            report["error"] = str(er)
+            zendesk._log.error("{} - {}".format(self.__class__.__name__, er))
+        report["api_calls_saved"] = previousCalls - report["api_calls"]
+        zendesk._output(json.dumps(report))
+        return report
+
+    async def uploadFiles(self, zendesk, uploadPaths, priority=None):
+        """
+        Upload the files of the paths and globs at the same time as the uploadFiles of the Zendesk
+
+        :param zendesk: Zendesk of the action
+        :param uploadPaths:
+        :param priority:
+        :return: list with the tokens in the order of the paths
+        """
+        zendesk.uploadPaths = zendesk.uploadGlobs(uploadPaths)
+        results = await asyncio.gather(*(self.uploadFile(zendesk, path, priority) for path in zendesk.uploadPaths))
+        return zendesk.uploadTokens(results)
+
+    async def uploadFile(self, zendesk, uploadPath, priority=None):
+        """
+        Upload one file, the content is converted from LF to CRLF while it is sent unless --no-crlf
+
+        :param zendesk: Zendesk of the action
+        :param uploadPath:
+        :param priority:
+        :return: tuple (path, size, sent, seconds, token or False)
+        """
+        uploadStart = time.monotonic()
+        uploadSize = os.path.getsize(uploadPath) if os.path.isfile(uploadPath) else None
+        uploadSent = None
+        try:
+            uploadParams = {"filename": os.path.basename(uploadPath)}
+            uploadHeaders = {"Content-Type": "application/binary"}
+            with zendesk.convertLFtoCRLF(uploadPath) as uploadBody:
+                result = await self.request("POST", "uploads.json", priority, params=uploadParams, headers=uploadHeaders,
+                                            data=uploadBody)
+                uploadSent = uploadBody.sent
+            uploadToken = result["upload"]["token"]
+
+        except Exception as er:
+            zendesk._log.error("{} - {}".format(self.__class__.__name__, er))
+            uploadToken = False
+        return uploadPath, uploadSize, uploadSent, time.monotonic() - uploadStart, uploadToken
+
+    async def asyncChunks(self, chunks):
+        for chunk in chunks:
+            yield chunk
+
+    async def countChunks(self, chunks, sent):
+        async for chunk in chunks:
+            sent[0] += len(chunk)
+            yield chunk
+
+    async def searchTickets(self, zendesk):
+        """
+        Search the tickets of -t, one ID is fetched with GET and the dict is the output as in the searchID,
+        many IDs are fetched at the same time with show_many and the output is a JSON line for each ticket
+        in the order of the IDs, the fresh tickets of the cache are not fetched. The tickets are in the
+        format of the to_dict of the Zendesk
+
+        :param zendesk: Zendesk of the action
+        :return:
+        """
+        try:
+            ticketIDs = [int(ticketID) for ticketID in str(zendesk._dictInternal["ticketID"]).split(",") if ticketID.strip()]
+            found = zendesk.freshTickets(ticketIDs)
+            missing = [ticketID for ticketID in ticketIDs if ticketID not in found]
+            if len(ticketIDs) == 1 and missing:
+                fetched = [(await self.request("GET", "tickets/{}.json".format(ticketIDs[0])))["ticket"]]
+            else:
+                fetched = list()
+                for result in await asyncio.gather(*(
+                        self.request("GET", "tickets/show_many.json", "bulk",
+                                     params={"ids": ",".join(str(ticketID) for ticketID in missing[index:index + 100])})
+                        for index in range(0, len(missing), 100))):
+                    fetched.extend(result["tickets"])
+            found = zendesk.fetchedTickets(found, [apiObjects.Ticket(**ticket).to_dict() for ticket in fetched])
+            if len(ticketIDs) == 1:
+                zendesk._output(found[ticketIDs[0]])
+            else:
+                zendesk.outputTickets(ticketIDs, found)
+            return True
+
+        except Exception as er:
+            zendesk._log.error("{} - {}".format(self.__class__.__name__, er))
+            return False
+
+    async def waitJobs(self, zendesk, jobIDs):
+        """
+        Poll the jobs with the steps of the pollJobs of the Zendesk, the chunks of the pending jobs are polled
+        at the same time
+
+        :param zendesk: Zendesk of the action
+        :param jobIDs:
+        :return: dict with job ID and a dict with status, message, results and timeout of each job
+        """
+        poll = zendesk.pollJobs(jobIDs)
+        try:
+            wait, chunks = next(poll)
+            while True:
+                await asyncio.sleep(wait)
+                statuses = await asyncio.gather(*(self.jobStatuses(chunk) for chunk in chunks))
+                wait, chunks = poll.send([job for chunk in statuses for job in chunk])
+        except StopIteration as stop:
+            return stop.value
+
+    async def jobStatuses(self, jobIDs):
+        """
+        Return the status of the jobs, at most 100 jobs
+
+        :param jobIDs:
+        :return: list with a dict of each job found as the jobStatuses of the Zendesk
+        """
+        if len(jobIDs) == 1:
+            try:
+                statuses = [(await self.request("GET", "job_statuses/{}.json".format(jobIDs[0])))["job_status"]]
+            except zenpyExceptions.RecordNotFoundException:
+                return list()
+        else:
+            statuses = (await self.request("GET", "job_statuses/show_many.json", params={"ids": ",".join(jobIDs)}))["job_statuses"]
+        return [{"id": job["id"], "status": job.get("status"), "message": job.get("message"),
+                 "results": job.get("results") or list()} for job in statuses]
+
 def main():
     try:
+        # the profile starts before the parse of the arguments to have the startup, only the main thread
+        # is profiled, the workers of the serve are not
+        profile = None
+        if any(argument == "--profile" or argument.startswith("--profile=") for argument in sys.argv[1:]):
+            profile = cProfile.Profile()
+            profile.enable()
         zendesk = Zendesk()
         usage = Usage(zendesk)
+        if profile is not None and zendesk._dictInternal.get("profile") is None:
+            profile.disable()
+            profile = None
         if zendesk._dictInternal["logFile"] is not None:
             moduleLog = ModuleLog()
-            zendesk._log = moduleLog.log
-            print("Log - '{}'".format(moduleLog.logFile))
-        zendesk.executeAction()
+            zendesk._log = ActionLog(moduleLog.log, {"action": zendesk._dictInternal["action"],
+                                                     "ticket_id": zendesk._dictInternal.get("ticketID")})
+            # in serve the stdout has the results of the actions
+            print("Log - '{}'".format(moduleLog.logFile), file=sys.stderr if zendesk._dictInternal["action"] == "serve" else sys.stdout)
+        zendesk._metrics.phases["startup_seconds"] = round(time.perf_counter() - zendesk._metrics.started, 4)
+        actionStart = time.perf_counter()
+        executed = zendesk.executeAction()
+        if zendesk._log is not None:
+            zendesk._log.info("action finished, ok %s", executed, extra={"duration": round(time.perf_counter() - actionStart, 4)})
+        Zendesk.closeZendesk()
+        if profile is not None:
+            profile.disable()
+            profile.dump_stats(zendesk._dictInternal["profile"])
+            print("Profile - '{}'".format(zendesk._dictInternal["profile"]), file=sys.stderr)
+            pstats.Stats(profile, stream=sys.stderr).sort_stats("cumulative").print_stats(25)
+        zendesk.writeMetrics()
+        if zendesk._dictInternal.get("stats") is True:
+            zendesk.printStats()
 
     except Exception as er:
         print("{} - {}".format(__name__, er))